@@ -11,7 +11,8 @@ src_path = os.path.join(os.path.dirname(__file__), 'src')
 sys.path.insert(0, src_path)
 
 # Import and run the Flask app
-from web.app_api import app
+from web.app_api import (app, ensure_database_schema, prepare_static_assets, start_maintenance_scheduler,
+                         start_serving_publisher)
 
 if __name__ == '__main__':
     print("Starting Historical Reference Mapper...")
@@ -21,5 +22,9 @@ if __name__ == '__main__':
     print("\nPress Ctrl+C to stop the server")
 
     port = int(os.environ.get('PORT', 10000))
+    ensure_database_schema()
+    start_maintenance_scheduler()
+    start_serving_publisher()
+    prepare_static_assets()
     
     app.run(host='0.0.0.0', port=port, debug=False)
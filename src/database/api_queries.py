@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+SQL for the web API endpoints
+Queries use '?' placeholders and are converted for PostgreSQL, so the index advisor
+can EXPLAIN exactly the statements the endpoints run.
+Books the batch processor is still writing (books.in_progress = 1) are left out wherever
+book rows or the mentions behind a listing are read; the mention-mode year filters need
+no check, since a book's mention years are only written once it is complete.
+"""
+
+# Referenced-location listings walk the locations name index in ORDER BY order and probe
+# the mentions location index per row, so a page stops after LIMIT rows and nothing is
+# sorted; the page total is counted once by a separate subquery instead of a window
+# function, which would materialize and re-sort every match.
+API_QUERIES = {
+    'locations_search': """
+        SELECT
+            l.id, l.name, l.latitude, l.longitude,
+            (
+                SELECT COUNT(*) FROM locations t
+                WHERE EXISTS (
+                    SELECT 1 FROM mentions m JOIN books b ON b.id = m.book_id
+                    WHERE m.location_id = t.id AND b.in_progress IS NULL
+                )
+                AND t.name LIKE ?
+            ) as total_count
+        FROM locations l
+        WHERE EXISTS (
+            SELECT 1 FROM mentions m JOIN books b ON b.id = m.book_id
+            WHERE m.location_id = l.id AND b.in_progress IS NULL
+        )
+        AND l.name LIKE ?
+        ORDER BY l.name
+        LIMIT ? OFFSET ?
+    """,
+    'locations_page': """
+        SELECT
+            l.id, l.name, l.latitude, l.longitude,
+            (
+                SELECT COUNT(*) FROM locations t
+                WHERE EXISTS (
+                    SELECT 1 FROM mentions m JOIN books b ON b.id = m.book_id
+                    WHERE m.location_id = t.id AND b.in_progress IS NULL
+                )
+            ) as total_count
+        FROM locations l
+        WHERE EXISTS (
+            SELECT 1 FROM mentions m JOIN books b ON b.id = m.book_id
+            WHERE m.location_id = l.id AND b.in_progress IS NULL
+        )
+        ORDER BY l.name
+        LIMIT ? OFFSET ?
+    """,
+    'locations_with_references': """
+        SELECT l.id, l.name, l.latitude, l.longitude
+        FROM locations l
+        WHERE EXISTS (
+            SELECT 1 FROM mentions m JOIN books b ON b.id = m.book_id
+            WHERE m.location_id = l.id AND b.in_progress IS NULL
+        )
+        ORDER BY l.name
+    """,
+    'locations_with_references_columnar': """
+        SELECT l.id, l.name, l.latitude, l.longitude,
+               (
+                   SELECT COUNT(*) FROM mentions m JOIN books b ON b.id = m.book_id
+                   WHERE m.location_id = l.id AND b.in_progress IS NULL
+               ) as mention_count
+        FROM locations l
+        WHERE EXISTS (
+            SELECT 1 FROM mentions m JOIN books b ON b.id = m.book_id
+            WHERE m.location_id = l.id AND b.in_progress IS NULL
+        )
+        ORDER BY l.name
+    """,
+    'books_by_location': """
+        SELECT
+            b.id,
+            b.title,
+            b.url
+        FROM
+            books b
+        JOIN
+            mentions m ON b.id = m.book_id
+        JOIN
+            locations l ON l.id = m.location_id
+        WHERE
+            l.name = ?
+            AND b.in_progress IS NULL
+    """,
+    'mentions_by_location': """
+        SELECT
+            b.title,
+            l.name as location_name,
+            l.latitude,
+            l.longitude,
+            m.text_position,
+            m.context,
+            m.book_id,
+            m.mention_length
+        FROM
+            books b
+        JOIN
+            mentions m ON b.id = m.book_id
+        JOIN
+            locations l ON l.id = m.location_id
+        WHERE
+            l.name = ?
+            AND b.in_progress IS NULL
+        ORDER BY
+            m.text_position
+    """,
+    # Books that overlap with the selected range
+    'mentions_by_year_matched': """
+        SELECT
+            b.title,
+            b.historical_start_year,
+            b.historical_end_year,
+            l.name as location_name,
+            l.latitude,
+            l.longitude,
+            m.text_position,
+            m.context,
+            m.book_id,
+            m.mention_length,
+            'year_matched' as tier
+        FROM
+            books b
+        JOIN
+            mentions m ON b.id = m.book_id
+        JOIN
+            locations l ON l.id = m.location_id
+        WHERE
+            l.name = ?
+            AND b.in_progress IS NULL
+            AND b.historical_start_year IS NOT NULL
+            AND b.historical_end_year IS NOT NULL
+            AND b.historical_start_year <= ?
+            AND b.historical_end_year >= ?
+        ORDER BY
+            m.text_position
+    """,
+    # Year-mismatched and unperiodized books
+    'mentions_by_year_other': """
+        SELECT
+            b.title,
+            b.historical_start_year,
+            b.historical_end_year,
+            l.name as location_name,
+            l.latitude,
+            l.longitude,
+            m.text_position,
+            m.context,
+            m.book_id,
+            m.mention_length,
+            CASE
+                WHEN b.historical_start_year IS NULL OR b.historical_end_year IS NULL
+                THEN 'unperiodized'
+                ELSE 'year_mismatched'
+            END as tier
+        FROM
+            books b
+        JOIN
+            mentions m ON b.id = m.book_id
+        JOIN
+            locations l ON l.id = m.location_id
+        WHERE
+            l.name = ?
+            AND b.in_progress IS NULL
+            AND (
+                b.historical_start_year IS NULL
+                OR b.historical_end_year IS NULL
+                OR b.historical_start_year > ?
+                OR b.historical_end_year < ?
+            )
+        ORDER BY
+            m.text_position
+    """,
+    'search_exact': """
+        SELECT id, name, latitude, longitude, 1 as relevance
+        FROM locations
+        WHERE LOWER(name) = LOWER(?)
+    """,
+    # A range on the LOWER(name) index: above the term itself (the exact match) and below
+    # the term followed by STARTS_WITH_BOUND
+    'search_starts_with': """
+        SELECT id, name, latitude, longitude, 2 as relevance
+        FROM locations
+        WHERE LOWER(name) > LOWER(?) AND LOWER(name) < LOWER(?)
+    """,
+    'search_contains': """
+        SELECT id, name, latitude, longitude, 3 as relevance
+        FROM locations
+        WHERE LOWER(name) LIKE ?
+        AND LOWER(name) NOT LIKE LOWER(?)
+        AND LOWER(name) NOT LIKE LOWER(?)
+    """,
+    'statistics_book_count': "SELECT COUNT(*) as count FROM books WHERE in_progress IS NULL",
+    'statistics_location_count': "SELECT COUNT(*) as count FROM locations",
+    # Driven from books, so each complete book's mentions are counted on the book_id index
+    'statistics_mention_count': """
+        SELECT COUNT(*) as count FROM mentions m
+        JOIN books b ON b.id = m.book_id WHERE b.in_progress IS NULL
+    """,
+    # DISTINCT in a subquery walks the index led by the column from one key to the next;
+    # COUNT(DISTINCT ...) may be planned on any covering index and dedupe in a temp b-tree
+    'statistics_books_with_mentions': """
+        SELECT COUNT(*) as count FROM (SELECT DISTINCT book_id FROM mentions) d
+        JOIN books b ON b.id = d.book_id WHERE b.in_progress IS NULL
+    """,
+    'statistics_locations_with_mentions': """
+        SELECT COUNT(*) as count FROM (
+            SELECT DISTINCT location_id FROM mentions m
+            WHERE EXISTS (SELECT 1 FROM books b WHERE b.id = m.book_id AND b.in_progress IS NULL)
+        ) d
+    """,
+    'statistics_year_range': "SELECT MIN(historical_start_year), MAX(historical_end_year) FROM books WHERE historical_start_year IS NOT NULL AND in_progress IS NULL",
+    'locations_by_year': """
+        SELECT DISTINCT l.id, l.name, l.latitude, l.longitude,
+               b.historical_start_year, b.historical_end_year
+        FROM locations l
+        INNER JOIN mentions m ON l.id = m.location_id
+        INNER JOIN books b ON m.book_id = b.id
+        WHERE (b.historical_start_year <= ? AND b.historical_end_year >= ?)
+        AND b.in_progress IS NULL
+        ORDER BY l.name
+    """,
+    'locations_by_year_columnar': """
+        SELECT l.id, l.name, l.latitude, l.longitude, COUNT(*) as mention_count
+        FROM locations l
+        INNER JOIN mentions m ON l.id = m.location_id
+        INNER JOIN books b ON m.book_id = b.id
+        WHERE (b.historical_start_year <= ? AND b.historical_end_year >= ?)
+        AND b.in_progress IS NULL
+        GROUP BY l.id, l.name, l.latitude, l.longitude
+        ORDER BY l.name
+    """,
+    # Mention-granular year filters (mode=mention) on mentions.estimated_year
+    'locations_by_year_mention': """
+        SELECT l.id, l.name, l.latitude, l.longitude,
+               c.mention_count, c.earliest_year, c.latest_year
+        FROM (
+            SELECT location_id, COUNT(*) as mention_count,
+                   MIN(estimated_year) as earliest_year, MAX(estimated_year) as latest_year
+            FROM mentions
+            WHERE estimated_year BETWEEN ? AND ?
+            GROUP BY location_id
+        ) c
+        JOIN locations l ON l.id = c.location_id
+        ORDER BY l.name
+    """,
+    'locations_by_year_mention_columnar': """
+        SELECT l.id, l.name, l.latitude, l.longitude, c.mention_count
+        FROM (
+            SELECT location_id, COUNT(*) as mention_count
+            FROM mentions
+            WHERE estimated_year BETWEEN ? AND ?
+            GROUP BY location_id
+        ) c
+        JOIN locations l ON l.id = c.location_id
+        ORDER BY l.name
+    """,
+    'mentions_by_year_mention_matched': """
+        SELECT
+            b.title,
+            b.historical_start_year,
+            b.historical_end_year,
+            l.name as location_name,
+            l.latitude,
+            l.longitude,
+            m.text_position,
+            m.context,
+            m.book_id,
+            m.mention_length,
+            m.estimated_year,
+            'year_matched' as tier
+        FROM
+            locations l
+        JOIN
+            mentions m ON m.location_id = l.id
+        JOIN
+            books b ON b.id = m.book_id
+        WHERE
+            l.name = ?
+            AND b.in_progress IS NULL
+            AND m.estimated_year BETWEEN ? AND ?
+        ORDER BY
+            m.text_position
+    """,
+    'mentions_by_year_mention_other': """
+        SELECT
+            b.title,
+            b.historical_start_year,
+            b.historical_end_year,
+            l.name as location_name,
+            l.latitude,
+            l.longitude,
+            m.text_position,
+            m.context,
+            m.book_id,
+            m.mention_length,
+            m.estimated_year,
+            CASE
+                WHEN m.estimated_year IS NULL THEN 'undated'
+                ELSE 'year_mismatched'
+            END as tier
+        FROM
+            locations l
+        JOIN
+            mentions m ON m.location_id = l.id
+        JOIN
+            books b ON b.id = m.book_id
+        WHERE
+            l.name = ?
+            AND b.in_progress IS NULL
+            AND (
+                m.estimated_year IS NULL
+                OR m.estimated_year < ?
+                OR m.estimated_year > ?
+            )
+        ORDER BY
+            m.text_position
+    """,
+    # Timeline cells from the rollup table, grouped per location in bucket order
+    'timeline_cells': """
+        SELECT r.location_id, l.name, l.latitude, l.longitude, r.bucket, r.mention_count
+        FROM mention_year_rollup r
+        JOIN locations l ON l.id = r.location_id
+        WHERE r.bucket_size = ? AND r.bucket BETWEEN ? AND ?
+        ORDER BY r.location_id, r.bucket
+    """,
+}
+
+# Appended to a search term to bound the starts-with range: U+FFFF sorts after every
+# other character in the BMP, in SQLite's binary order and in ICU collations alike
+STARTS_WITH_BOUND = '\uffff'
+
+# Plans that cannot be index-only by design, which the index advisor grades separately:
+# - aggregate: counts that read every entry of one covering index
+# - ordered walk: listings that walk a covering index in ORDER BY order
+# - substring: LIKE '%term%' matches, which no b-tree can seek
+# - context read: mention listings that read the context from the mention rows by
+#   rowid; as an index column the context made the index larger than the table
+EXPECTED_PLANS = {
+    'locations_search': 'ordered walk',
+    'locations_page': 'ordered walk',
+    'locations_with_references': 'ordered walk',
+    'locations_with_references_columnar': 'ordered walk',
+    'mentions_by_location': 'context read',
+    'mentions_by_year_matched': 'context read',
+    'mentions_by_year_other': 'context read',
+    'search_contains': 'substring',
+    'statistics_book_count': 'aggregate',
+    'statistics_location_count': 'aggregate',
+    'statistics_mention_count': 'aggregate',
+    'statistics_books_with_mentions': 'aggregate',
+    'statistics_locations_with_mentions': 'aggregate',
+    'mentions_by_year_mention_matched': 'context read',
+    'mentions_by_year_mention_other': 'context read',
+}
+
+# Representative parameters used when EXPLAINing each query
+SAMPLE_PARAMETERS = {
+    'locations_search': ('%berg%', '%berg%', 100, 0),
+    'locations_page': (100, 0),
+    'locations_with_references': (),
+    'locations_with_references_columnar': (),
+    'books_by_location': ('Rome',),
+    'mentions_by_location': ('Rome',),
+    'mentions_by_year_matched': ('Rome', 1300, 500),
+    'mentions_by_year_other': ('Rome', 1300, 500),
+    'search_exact': ('Rome',),
+    'search_starts_with': ('Rom', 'Rom' + STARTS_WITH_BOUND),
+    'search_contains': ('%rom%', 'rom%', 'rom'),
+    'statistics_book_count': (),
+    'statistics_location_count': (),
+    'statistics_mention_count': (),
+    'statistics_books_with_mentions': (),
+    'statistics_locations_with_mentions': (),
+    'statistics_year_range': (),
+    'locations_by_year': (1300, 500),
+    'locations_by_year_columnar': (1300, 500),
+    'locations_by_year_mention': (1180, 1190),
+    'locations_by_year_mention_columnar': (1180, 1190),
+    'mentions_by_year_mention_matched': ('Rome', 1180, 1190),
+    'mentions_by_year_mention_other': ('Rome', 1180, 1190),
+    'timeline_cells': (10, -10000, 10000),
+}
+
+def format_query(sql: str, db_type: str) -> str:
+    """Convert '?' placeholders to the parameter style of the given database."""
+    if db_type == 'postgresql':
+        return sql.replace('?', '%s')
+    return sql
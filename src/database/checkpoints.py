@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Resumable bulk job checkpoints
+Jobs that walk a table by primary key store the last id they committed in the
+job_checkpoints table, inside the same transaction as the batch it covers.
+"""
+
+from migrations import _value
+
+def get_checkpoint(cursor, job: str, placeholder: str = '?') -> int:
+    """Last committed id of a job (0 when it has not started or has finished)."""
+    cursor.execute(f"SELECT last_id FROM job_checkpoints WHERE job = {placeholder}", (job,))
+    row = cursor.fetchone()
+    return _value(row) if row else 0
+
+def save_checkpoint(cursor, job: str, last_id: int, placeholder: str = '?'):
+    """Record progress; call before committing the batch that reached last_id."""
+    cursor.execute(f"DELETE FROM job_checkpoints WHERE job = {placeholder}", (job,))
+    cursor.execute(
+        f"INSERT INTO job_checkpoints (job, last_id) VALUES ({placeholder}, {placeholder})",
+        (job, last_id)
+    )
+
+def clear_checkpoint(cursor, job: str, placeholder: str = '?'):
+    """Forget a job's progress once it has completed."""
+    cursor.execute(f"DELETE FROM job_checkpoints WHERE job = {placeholder}", (job,))
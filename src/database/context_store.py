@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Compressed book text storage for mention contexts
+Each book's cleaned text is stored once as zlib-compressed chunks; mentions keep only
+their offsets and the context is sliced out of the book text when it is read.
+A streamed book is written with BookTextWriter, one chunk at a time as its text arrives.
+"""
+
+import os
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+# Characters per compressed chunk; a context read only inflates the chunks it overlaps
+CONTEXT_CHUNK_SIZE = 65536
+CONTEXT_COMPRESSION_LEVEL = 6
+
+# Characters kept on each side of a mention (matches the extractor's context window)
+DEFAULT_CONTEXT_WINDOW = 100
+MAX_CONTEXT_WINDOW = 2000
+
+def get_context_storage_mode() -> str:
+    """Determine how mention contexts are stored based on environment variables."""
+    if os.getenv('CONTEXT_STORAGE') == 'compressed':
+        return 'compressed'
+    return 'inline'  # Default: one context string per mention row
+
+def compress_book_text(text: str, chunk_size: int = CONTEXT_CHUNK_SIZE) -> List[tuple]:
+    """Split text into fixed-size character chunks and compress each one."""
+    chunks = []
+    for chunk_index, start in enumerate(range(0, len(text), chunk_size)):
+        data = zlib.compress(text[start:start + chunk_size].encode('utf-8'), CONTEXT_COMPRESSION_LEVEL)
+        chunks.append((chunk_index, data))
+    return chunks
+
+def save_book_text(cursor, book_id: int, text: str, placeholder: str = '?'):
+    """Replace the stored compressed text of a book."""
+    cursor.execute(f"DELETE FROM book_texts WHERE book_id = {placeholder}", (book_id,))
+    cursor.executemany(
+        f"INSERT INTO book_texts (book_id, chunk_index, data) VALUES ({placeholder}, {placeholder}, {placeholder})",
+        [(book_id, chunk_index, data) for chunk_index, data in compress_book_text(text)]
+    )
+
+def _column(row, name: str, index: int):
+    """Read a column by name from sqlite3.Row, DictCursor or RealDictCursor rows (plain tuples by position)."""
+    return row[index] if isinstance(row, tuple) else row[name]
+
+class BookTextWriter:
+    """Replaces the stored text of a book from consecutive pieces, the same chunks save_book_text writes."""
+
+    def __init__(self, cursor, book_id: int, placeholder: str = '?', chunk_size: int = CONTEXT_CHUNK_SIZE):
+        self.cursor = cursor
+        self.book_id = book_id
+        self.placeholder = placeholder
+        self.chunk_size = chunk_size
+        self.chunk_index = 0
+        self.pending = ''
+        cursor.execute(f"DELETE FROM book_texts WHERE book_id = {placeholder}", (book_id,))
+
+    def _insert(self, text: str):
+        data = zlib.compress(text.encode('utf-8'), CONTEXT_COMPRESSION_LEVEL)
+        self.cursor.execute(
+            f"INSERT INTO book_texts (book_id, chunk_index, data) VALUES ({self.placeholder}, {self.placeholder}, {self.placeholder})",
+            (self.book_id, self.chunk_index, data)
+        )
+        self.chunk_index += 1
+
+    def write(self, text: str):
+        """Append text, storing every chunk that is complete."""
+        text = self.pending + text
+        full = len(text) - len(text) % self.chunk_size
+        for start in range(0, full, self.chunk_size):
+            self._insert(text[start:start + self.chunk_size])
+        self.pending = text[full:]
+
+    def close(self):
+        """Store the last, partial chunk."""
+        if self.pending:
+            self._insert(self.pending)
+            self.pending = ''
+
+class BookTextReader:
+    """Slices ranges out of compressed book texts, inflating each chunk at most once."""
+
+    def __init__(self, cursor, placeholder: str = '?', chunk_size: int = CONTEXT_CHUNK_SIZE):
+        self.cursor = cursor
+        self.placeholder = placeholder
+        self.chunk_size = chunk_size
+        self.chunks: Dict[tuple, str] = {}
+
+    def _load_chunks(self, book_id: int, first_chunk: int, last_chunk: int):
+        """Fetch and decompress the chunks of a book that are not cached yet."""
+        missing = [i for i in range(first_chunk, last_chunk + 1) if (book_id, i) not in self.chunks]
+        if not missing:
+            return
+
+        self.cursor.execute(f"""
+            SELECT chunk_index, data FROM book_texts
+            WHERE book_id = {self.placeholder} AND chunk_index BETWEEN {self.placeholder} AND {self.placeholder}
+        """, (book_id, missing[0], missing[-1]))
+
+        for row in self.cursor.fetchall():
+            chunk_index, data = _column(row, 'chunk_index', 0), _column(row, 'data', 1)
+            self.chunks[(book_id, chunk_index)] = zlib.decompress(bytes(data)).decode('utf-8')
+
+    def slice(self, book_id: int, start: int, end: int) -> str:
+        """Return book_text[start:end] for a stored book."""
+        start = max(0, start)
+        if end <= start:
+            return ""
+
+        first_chunk = start // self.chunk_size
+        last_chunk = (end - 1) // self.chunk_size
+        self._load_chunks(book_id, first_chunk, last_chunk)
+
+        text = "".join(self.chunks.get((book_id, i), "") for i in range(first_chunk, last_chunk + 1))
+        offset = first_chunk * self.chunk_size
+        return text[start - offset:end - offset]
+
+    def context(self, book_id: int, position: int, length: int, window: int = DEFAULT_CONTEXT_WINDOW) -> str:
+        """Return the context around a mention, like the extractor would have stored it."""
+        return self.slice(book_id, position - window, position + (length or 0) + window).strip()
+
+def load_book_text(cursor, book_id: int, placeholder: str = '?') -> Optional[str]:
+    """Decompress the full stored text of a book, or None when it has none."""
+    cursor.execute(
+        f"SELECT data FROM book_texts WHERE book_id = {placeholder} ORDER BY chunk_index",
+        (book_id,)
+    )
+    chunks = [zlib.decompress(bytes(_column(row, 'data', 0))).decode('utf-8') for row in cursor.fetchall()]
+    return "".join(chunks) if chunks else None
+
+def iter_book_text(cursor, book_id: int, placeholder: str = '?') -> Iterator[str]:
+    """
+    Yield the stored text of a book one decompressed chunk at a time.
+    Each chunk is fetched by its key, so the cursor is free for other queries in between.
+    """
+    chunk_index = 0
+    while True:
+        cursor.execute(
+            f"SELECT data FROM book_texts WHERE book_id = {placeholder} AND chunk_index = {placeholder}",
+            (book_id, chunk_index)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return
+        yield zlib.decompress(bytes(_column(row, 'data', 0))).decode('utf-8')
+        chunk_index += 1
+
+def fill_mention_contexts(cursor, rows, placeholder: str = '?', window: Optional[int] = None) -> List[Dict]:
+    """
+    Convert mention rows to dictionaries, slicing contexts for rows stored in compressed mode.
+    Rows must include book_id, text_position, mention_length and context; the helper
+    columns book_id and mention_length are dropped from the result.
+    """
+    reader = BookTextReader(cursor, placeholder)
+    window = DEFAULT_CONTEXT_WINDOW if window is None else window
+    results = []
+
+    for row in rows:
+        mention = dict(row)
+        book_id = mention.pop('book_id', None)
+        mention_length = mention.pop('mention_length', None)
+
+        if mention.get('context') is None and book_id is not None and mention_length is not None:
+            mention['context'] = reader.context(book_id, mention['text_position'], mention_length, window)
+
+        results.append(mention)
+
+    return results
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Shared database access for the web API, batch processor and maintenance scripts
+Connections are opened in one place, with the same PRAGMAs and row factory on every
+path: rows can be read by column name or by position on both backends (sqlite3.Row on
+SQLite, DictRow on PostgreSQL). Named statements are formatted once per backend;
+SQLite reuses the compiled statement from its per-connection statement cache and
+PostgreSQL gets a server-side PREPARE the first time a connection runs a statement,
+then EXECUTE. Every named statement is timed and reported to the timing hooks.
+Read-only work can be routed to a replica or SQLite snapshot with get_read_connection;
+a snapshot's staleness is judged by the write marker the SQLite writers bump (mark_write).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional, Sequence
+
+from api_queries import API_QUERIES
+
+DEFAULT_DATABASE_FILE = 'history_map.db'
+
+# Compiled statements kept per SQLite connection (the sqlite3 default is 128)
+SQLITE_STATEMENT_CACHE_SIZE = 256
+
+SQLITE_PRAGMAS = [
+    # WAL lets readers run while the batch processor writes
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=10000",
+    "PRAGMA temp_store=MEMORY",
+]
+
+# Prefix of server-side prepared statement names on PostgreSQL
+PREPARED_PREFIX = 'hrm_'
+
+# --- Configuration ---
+def get_database_type() -> str:
+    """Determine which database to use based on environment variables."""
+    if os.getenv('DB_TYPE') == 'postgresql':
+        return 'postgresql'
+    return 'sqlite'  # Default fallback
+
+def get_sql_placeholder(db_type: Optional[str] = None) -> str:
+    """Get the SQL parameter placeholder for a database type (default: the configured one)."""
+    return '%s' if (db_type or get_database_type()) == 'postgresql' else '?'
+
+def backend_of(conn) -> str:
+    """Database type of an open connection (connection factories may have fallen back to SQLite)."""
+    return 'sqlite' if isinstance(conn, sqlite3.Connection) else 'postgresql'
+
+# --- Timing hooks ---
+class QueryStats:
+    """Per-statement call counts and durations, collected by a timing hook."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+
+    def __call__(self, name: str, seconds: float, rows: int):
+        with self._lock:
+            entry = self._stats.setdefault(name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            entry['calls'] += 1
+            entry['total_ms'] += seconds * 1000
+            entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Copy of the statistics with average durations, slowest total first."""
+        with self._lock:
+            stats = {name: dict(entry) for name, entry in self._stats.items()}
+        for entry in stats.values():
+            entry['avg_ms'] = entry['total_ms'] / entry['calls']
+        return dict(sorted(stats.items(), key=lambda item: -item[1]['total_ms']))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+# Statements slower than this many milliseconds are logged (0 disables)
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '0') or 0)
+
+def _slow_query_hook(name: str, seconds: float, rows: int):
+    """Log statements slower than DB_SLOW_QUERY_MS."""
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        print(f"🐢 Slow query {name}: {seconds * 1000:.1f} ms ({rows} rows)")
+
+query_stats = QueryStats()
+
+_timing_hooks: List[Callable[[str, float, int], None]] = [query_stats]
+if SLOW_QUERY_MS > 0:
+    _timing_hooks.append(_slow_query_hook)
+
+def add_timing_hook(hook: Callable[[str, float, int], None]):
+    """Call hook(statement_name, seconds, rowcount) after every named statement."""
+    _timing_hooks.append(hook)
+
+def remove_timing_hook(hook: Callable[[str, float, int], None]):
+    if hook in _timing_hooks:
+        _timing_hooks.remove(hook)
+
+def _report_timing(name: str, started: float, cursor):
+    elapsed = time.perf_counter() - started
+    rows = cursor.rowcount if cursor.rowcount is not None else -1
+    for hook in list(_timing_hooks):
+        hook(name, elapsed, rows)
+
+# --- Statement registry ---
+_statements: Dict[str, str] = dict(API_QUERIES)
+_prepared_forms: Dict[str, tuple] = {}
+
+def register_statements(statements: Dict[str, str]):
+    """Register named statements ('?' placeholders) for execute() and executemany()."""
+    for name, sql in statements.items():
+        if _statements.get(name, sql) != sql:
+            raise ValueError(f"Statement '{name}' is already registered with different SQL")
+        _statements[name] = sql
+
+def _numbered_placeholders(sql: str) -> tuple:
+    """Convert '?' placeholders to $1..$n; returns the SQL and the parameter count."""
+    parts = sql.split('?')
+    numbered = parts[0] + ''.join(f"${index}{part}" for index, part in enumerate(parts[1:], 1))
+    return numbered, len(parts) - 1
+
+# --- Backend adapters ---
+class SQLiteAdapter:
+    """SQLite connections; statement reuse comes from the connection's statement cache."""
+
+    db_type = 'sqlite'
+    placeholder = '?'
+
+    def connect(self, db_file: str = DEFAULT_DATABASE_FILE, immutable: bool = False):
+        if immutable:
+            # Snapshots never change in place, so SQLite can skip locking and change detection
+            conn = sqlite3.connect(f"file:{db_file}?mode=ro&immutable=1", uri=True,
+                                   cached_statements=SQLITE_STATEMENT_CACHE_SIZE)
+            pragmas = [pragma for pragma in SQLITE_PRAGMAS if 'cache_size' in pragma or 'temp_store' in pragma]
+        else:
+            conn = sqlite3.connect(db_file, cached_statements=SQLITE_STATEMENT_CACHE_SIZE)
+            pragmas = SQLITE_PRAGMAS
+        # Access columns by name (like a dictionary) or by position
+        conn.row_factory = sqlite3.Row
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def statement(self, name: str) -> str:
+        """SQL of a registered name; passing the identical string every time hits the statement cache."""
+        return _statements[name]
+
+    def execute(self, cursor, name: str, params: Sequence):
+        cursor.execute(self.statement(name), params)
+
+    def executemany(self, cursor, name: str, rows):
+        cursor.executemany(self.statement(name), rows)
+
+class PostgreSQLAdapter:
+    """PostgreSQL connections with server-side prepared statements per connection."""
+
+    db_type = 'postgresql'
+    placeholder = '%s'
+
+    def __init__(self):
+        # Statement names prepared on each live connection
+        self._prepared = weakref.WeakKeyDictionary()
+
+    def connect(self, dsn: Optional[str] = None, host: Optional[str] = None, port: Optional[str] = None):
+        import psycopg2
+        from psycopg2.extras import DictCursor
+
+        if dsn:
+            return psycopg2.connect(dsn, cursor_factory=DictCursor)
+        return psycopg2.connect(
+            host=host or os.getenv('DB_HOST'),
+            port=port or os.getenv('DB_PORT', 5432),
+            database=os.getenv('DB_NAME'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            cursor_factory=DictCursor
+        )
+
+    def statement(self, name: str) -> tuple:
+        """PREPARE and EXECUTE statements for a registered name."""
+        if name not in _prepared_forms:
+            numbered, count = _numbered_placeholders(_statements[name])
+            arguments = f" ({', '.join(['%s'] * count)})" if count else ""
+            _prepared_forms[name] = (f"PREPARE {PREPARED_PREFIX}{name} AS {numbered}",
+                                     f"EXECUTE {PREPARED_PREFIX}{name}{arguments}")
+        return _prepared_forms[name]
+
+    def _ensure_prepared(self, cursor, name: str) -> str:
+        prepare, execute = self.statement(name)
+        prepared = self._prepared.setdefault(cursor.connection, set())
+        if name not in prepared:
+            # Prepared statements live for the session and survive rollbacks
+            cursor.execute(prepare)
+            prepared.add(name)
+        return execute
+
+    def execute(self, cursor, name: str, params: Sequence):
+        cursor.execute(self._ensure_prepared(cursor, name), params)
+
+    def executemany(self, cursor, name: str, rows):
+        cursor.executemany(self._ensure_prepared(cursor, name), rows)
+
+ADAPTERS = {'sqlite': SQLiteAdapter(), 'postgresql': PostgreSQLAdapter()}
+
+def execute(cursor, name: str, params: Sequence = ()):
+    """Run a registered statement on a cursor of either backend and time it."""
+    started = time.perf_counter()
+    ADAPTERS[backend_of(cursor.connection)].execute(cursor, name, params)
+    _report_timing(name, started, cursor)
+    return cursor
+
+def fetch_all(cursor, name: str, params: Sequence = ()) -> list:
+    """Run a registered query and fetch its rows, timing both (SQLite computes rows while fetching)."""
+    started = time.perf_counter()
+    ADAPTERS[backend_of(cursor.connection)].execute(cursor, name, params)
+    rows = cursor.fetchall()
+    _report_timing(name, started, cursor)
+    return rows
+
+def executemany(cursor, name: str, rows):
+    """Run a registered statement once per parameter row and time the whole batch."""
+    started = time.perf_counter()
+    ADAPTERS[backend_of(cursor.connection)].executemany(cursor, name, rows)
+    _report_timing(name, started, cursor)
+    return cursor
+
+# --- Connections ---
+def get_sqlite_connection(db_file: str = DEFAULT_DATABASE_FILE):
+    """Open a SQLite connection with the shared PRAGMAs and row factory."""
+    return ADAPTERS['sqlite'].connect(db_file)
+
+def connect_postgresql(dsn: Optional[str] = None):
+    """Open a PostgreSQL connection, raising when it is unavailable."""
+    return ADAPTERS['postgresql'].connect(dsn)
+
+def get_postgresql_connection(fallback_file: str = DEFAULT_DATABASE_FILE):
+    """Open a PostgreSQL connection, falling back to SQLite when it is unavailable."""
+    try:
+        return connect_postgresql()
+    except ImportError:
+        print("Warning: psycopg2 not installed, falling back to SQLite")
+        return get_sqlite_connection(fallback_file)
+    except Exception as e:
+        print(f"Warning: PostgreSQL connection failed ({e}), falling back to SQLite")
+        return get_sqlite_connection(fallback_file)
+
+def get_db_connection(db_file: str = DEFAULT_DATABASE_FILE):
+    """Open a connection to the configured database (db_file is the SQLite database)."""
+    if get_database_type() == 'postgresql':
+        return get_postgresql_connection(db_file)
+    return get_sqlite_connection(db_file)
+
+# --- Read/write split ---
+# Reads can go to a PostgreSQL replica (DB_READ_DSN, or DB_READ_HOST/DB_READ_PORT with the
+# primary's credentials) or to a read-only SQLite serving database (SQLITE_READ_FILE, published
+# from the primary by serving_db.py). Writes always go to the primary. A read target lagging more than
+# DB_MAX_READ_LAG seconds behind is skipped until it catches up.
+DEFAULT_MAX_READ_LAG = 30
+# Seconds a staleness check is trusted before the read target is checked again
+READ_LAG_CHECK_INTERVAL = 5
+
+_read_lag = {'checked_at': 0.0, 'lag': 0.0, 'target': None}
+_read_lag_lock = threading.Lock()
+
+# Single-row table holding a write counter and the time of the last write. SQLite writers
+# bump it in every transaction that changes data (mark_write) and the serving database
+# carries a copy, so staleness follows real writes: file times also move when a connection
+# merely opens the primary (recreating its WAL), checkpoints or runs ANALYZE
+WRITE_MARKER_TABLE = 'write_marker'
+
+# Per serving database build (by file and write version): the last time it was seen holding every write
+_snapshot_complete = {'file': None, 'version': None, 'seen_at': 0.0}
+_snapshot_complete_lock = threading.Lock()
+
+def get_max_read_lag() -> float:
+    """Read DB_MAX_READ_LAG (seconds a read target may trail the primary)."""
+    try:
+        return float(os.getenv('DB_MAX_READ_LAG', DEFAULT_MAX_READ_LAG))
+    except ValueError:
+        return DEFAULT_MAX_READ_LAG
+
+def get_read_target() -> Optional[str]:
+    """Description of the configured read target, or None when reads use the primary."""
+    if get_database_type() == 'postgresql':
+        if os.getenv('DB_READ_DSN'):
+            return 'postgresql replica (DB_READ_DSN)'
+        if os.getenv('DB_READ_HOST'):
+            return f"postgresql replica {os.getenv('DB_READ_HOST')}:{os.getenv('DB_READ_PORT', os.getenv('DB_PORT', 5432))}"
+        return None
+    snapshot = os.getenv('SQLITE_READ_FILE')
+    return f"sqlite serving database {snapshot}" if snapshot else None
+
+def replica_lag_seconds(conn) -> float:
+    """Replay lag of a PostgreSQL standby (0 on a primary or a caught-up standby)."""
+    cursor = conn.cursor()
+    # An idle primary leaves the last replay timestamp behind, so compare WAL positions first
+    cursor.execute("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """)
+    lag = float(cursor.fetchone()[0])
+    cursor.close()
+    return lag
+
+def mark_write(cursor):
+    """
+    Record a write in the current transaction; call it before committing any change to the
+    data. SQLite only: PostgreSQL replicas report their own lag, and one hot row would make
+    concurrent PostgreSQL writers wait on each other.
+    """
+    if backend_of(cursor.connection) != 'sqlite':
+        return
+    cursor.execute(f"UPDATE {WRITE_MARKER_TABLE} SET version = version + 1, written_at = ? WHERE id = 1",
+                   (time.time(),))
+
+def read_write_marker(db_file: str, immutable: bool = False) -> Optional[tuple]:
+    """(version, written_at) of a SQLite database's write marker; None when it has none."""
+    if not os.path.exists(db_file):
+        return None
+    conn = ADAPTERS['sqlite'].connect(db_file, immutable=immutable)
+    try:
+        row = conn.execute(f"SELECT version, written_at FROM {WRITE_MARKER_TABLE} WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        # Not migrated yet, or a snapshot built before write markers
+        return None
+    finally:
+        conn.close()
+    return (row[0], row[1]) if row else None
+
+def last_write_time(db_file: str) -> float:
+    """Time of the last write recorded in a SQLite database's write marker (0 when unknown)."""
+    marker = read_write_marker(db_file)
+    return marker[1] if marker else 0.0
+
+def snapshot_lag_seconds(db_file: str, snapshot_file: str) -> float:
+    """
+    Seconds since the first write the snapshot does not contain (0 when it has every write,
+    inf without a snapshot or write markers). A snapshot holds the primary's write marker
+    as of its build; the first missing write came after the last write it holds and after
+    the last check that found it complete, so the later of the two stands in for it.
+    """
+    if not os.path.exists(snapshot_file):
+        return float('inf')
+    # Taken before the primary is looked at: a write after this check is after now
+    now = time.time()
+    snapshot = read_write_marker(snapshot_file, immutable=True)
+    primary = read_write_marker(db_file)
+    if snapshot is None or primary is None:
+        return float('inf')
+    version, last_write = snapshot
+    with _snapshot_complete_lock:
+        if (_snapshot_complete['file'], _snapshot_complete['version']) != (snapshot_file, version):
+            _snapshot_complete.update(file=snapshot_file, version=version, seen_at=last_write)
+        if primary[0] == version:
+            _snapshot_complete['seen_at'] = now
+            return 0.0
+        return max(0.0, now - _snapshot_complete['seen_at'])
+
+def _connect_read_target(db_file: str):
+    """Open the configured read target; raises when it is unavailable."""
+    if get_database_type() == 'postgresql':
+        return ADAPTERS['postgresql'].connect(os.getenv('DB_READ_DSN'), host=os.getenv('DB_READ_HOST'),
+                                              port=os.getenv('DB_READ_PORT'))
+    return ADAPTERS['sqlite'].connect(os.getenv('SQLITE_READ_FILE'), immutable=True)
+
+def _read_target_lag(conn, db_file: str) -> float:
+    """Staleness of the read target, re-checked at most every READ_LAG_CHECK_INTERVAL seconds."""
+    target = get_read_target()
+    now = time.monotonic()
+    with _read_lag_lock:
+        if _read_lag['target'] == target and now - _read_lag['checked_at'] < READ_LAG_CHECK_INTERVAL:
+            return _read_lag['lag']
+
+    if backend_of(conn) == 'postgresql':
+        lag = replica_lag_seconds(conn)
+    else:
+        lag = snapshot_lag_seconds(db_file, os.getenv('SQLITE_READ_FILE'))
+
+    with _read_lag_lock:
+        _read_lag.update(checked_at=now, lag=lag, target=target)
+    return lag
+
+def get_read_connection(db_file: str = DEFAULT_DATABASE_FILE):
+    """
+    Open a connection for read-only work: the read target when one is configured and
+    no more than DB_MAX_READ_LAG seconds behind, otherwise the primary.
+    """
+    if get_read_target() is None:
+        return get_db_connection(db_file)
+    if get_database_type() == 'sqlite' and not os.path.exists(os.getenv('SQLITE_READ_FILE')):
+        # No snapshot published yet
+        return get_db_connection(db_file)
+
+    try:
+        conn = _connect_read_target(db_file)
+    except Exception as e:
+        print(f"Warning: read target unavailable ({e}), reading from the primary")
+        return get_db_connection(db_file)
+
+    try:
+        lag = _read_target_lag(conn, db_file)
+    except Exception as e:
+        conn.close()
+        print(f"Warning: read target lag check failed ({e}), reading from the primary")
+        return get_db_connection(db_file)
+
+    if lag > get_max_read_lag():
+        conn.close()
+        return get_db_connection(db_file)
+    return conn
+
+def get_read_status(db_file: str = DEFAULT_DATABASE_FILE) -> Dict:
+    """Read target and its current lag, for status endpoints."""
+    target = get_read_target()
+    if target is None:
+        return {'target': 'primary'}
+    if get_database_type() == 'sqlite' and not os.path.exists(os.getenv('SQLITE_READ_FILE')):
+        return {'target': target, 'error': 'snapshot not published yet', 'serving_reads': False}
+    try:
+        conn = _connect_read_target(db_file)
+        try:
+            lag = _read_target_lag(conn, db_file)
+        finally:
+            conn.close()
+    except Exception as e:
+        return {'target': target, 'error': str(e), 'serving_reads': False}
+    return {'target': target, 'lag_seconds': None if lag == float('inf') else round(lag, 2),
+            'max_lag_seconds': get_max_read_lag(), 'serving_reads': lag <= get_max_read_lag()}
@@ -1,56 +1,33 @@
 import json
 import spacy
 import requests
-import sqlite3 
 import os
 from typing import Optional, Union
 from dotenv import load_dotenv
+from migrations import ensure_schema
+from data_access import (backend_of, execute, executemany, get_database_type, get_postgresql_connection,
+                         get_sqlite_connection, mark_write, register_statements)
 
 # Load environment variables
 load_dotenv()
 
-# --- Database Configuration ---
-def get_database_type() -> str:
-    """Determine which database to use based on environment variables."""
-    if os.getenv('DB_TYPE') == 'postgresql':
-        return 'postgresql'
-    return 'sqlite'  # Default fallback
-
-def get_db_connection():
-    """Get database connection based on configuration."""
-    db_type = get_database_type()
-    
-    if db_type == 'postgresql':
-        return get_postgresql_connection()
-    else:
-        return get_sqlite_connection()
-
-def get_sqlite_connection():
-    """Get SQLite connection (existing functionality)."""
-    conn = sqlite3.connect('history_map.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_postgresql_connection():
-    """Get PostgreSQL connection."""
-    try:
-        import psycopg2
-        from psycopg2.extras import RealDictCursor
-        
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT', 5432),
-            database=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-        return conn
-    except ImportError:
-        print("Warning: psycopg2 not installed, falling back to SQLite")
-        return get_sqlite_connection()
-    except Exception as e:
-        print(f"Warning: PostgreSQL connection failed ({e}), falling back to SQLite")
-        return get_sqlite_connection()
+# Writes of save_results_to_db, prepared once per connection on PostgreSQL
+INTEGRATION_STATEMENTS = {
+    # Titles are not unique, the Gutenberg URL is
+    'integration_insert_book': """
+        INSERT INTO books (title, url, gutenberg_url) VALUES (?, ?, ?)
+        ON CONFLICT (gutenberg_url) DO NOTHING
+    """,
+    'integration_book_id': "SELECT id FROM books WHERE gutenberg_url = ?",
+    'integration_delete_mentions': "DELETE FROM mentions WHERE book_id = ?",
+    'integration_insert_location': """
+        INSERT INTO locations (name, latitude, longitude) VALUES (?, ?, ?)
+        ON CONFLICT (name, latitude, longitude) DO NOTHING
+    """,
+    'integration_location_id': "SELECT id FROM locations WHERE name = ? AND latitude = ? AND longitude = ?",
+    'integration_insert_mention': "INSERT INTO mentions (book_id, location_id, text_position, context) VALUES (?, ?, ?, ?)",
+}
+register_statements(INTEGRATION_STATEMENTS)
 
 # --- Database Functions ---
 def setup_database(db_file):
@@ -64,90 +41,24 @@ def setup_database(db_file):
 
 def setup_sqlite_database(db_file):
     """Setup SQLite database (existing functionality)."""
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    
-    # Create the books table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS books (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL UNIQUE,
-        url TEXT
-    )''')
-    
-    # Create the locations table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS locations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        latitude REAL NOT NULL,
-        longitude REAL NOT NULL
-    )''')
-    
-    # Create the mentions linking table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS mentions (
-        book_id INTEGER,
-        location_id INTEGER,
-        text_position INTEGER,
-        context TEXT,
-        FOREIGN KEY (book_id) REFERENCES books (id),
-        FOREIGN KEY (location_id) REFERENCES locations (id),
-        PRIMARY KEY (book_id, location_id)
-    )''')
-    
-    conn.commit()
+    conn = get_sqlite_connection(db_file)
+    version = ensure_schema(conn, 'sqlite')
     conn.close()
-    print(f"SQLite database '{db_file}' is set up.")
+    print(f"SQLite database '{db_file}' is set up (schema version {version}).")
 
 def setup_postgresql_database():
     """Setup PostgreSQL database."""
     try:
         conn = get_postgresql_connection()
-        cursor = conn.cursor()
-        
-        # Create the books table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id SERIAL PRIMARY KEY,
-            title VARCHAR(500) NOT NULL UNIQUE,
-            url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
+        if backend_of(conn) == 'sqlite':
+            # get_postgresql_connection already fell back to SQLite
+            conn.close()
+            setup_sqlite_database('history_map.db')
+            return
         
-        # Create the locations table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS locations (
-            id SERIAL PRIMARY KEY,
-            name VARCHAR(200) NOT NULL UNIQUE,
-            latitude DOUBLE PRECISION NOT NULL,
-            longitude DOUBLE PRECISION NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # Create the mentions linking table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS mentions (
-            id SERIAL PRIMARY KEY,
-            book_id INTEGER,
-            location_id INTEGER,
-            text_position INTEGER,
-            context TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (book_id) REFERENCES books (id),
-            FOREIGN KEY (location_id) REFERENCES locations (id)
-        )''')
-        
-        # Create indexes for better performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_title ON books(title)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_locations_name ON locations(name)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_mentions_book_id ON mentions(book_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_mentions_location_id ON mentions(location_id)')
-        
-        conn.commit()
-        cursor.close()
+        version = ensure_schema(conn, 'postgresql')
         conn.close()
-        print("PostgreSQL database is set up.")
+        print(f"PostgreSQL database is set up (schema version {version}).")
         
     except Exception as e:
         print(f"Warning: PostgreSQL setup failed ({e}), falling back to SQLite")
@@ -162,31 +73,39 @@ def save_results_to_db(db_file, book_title, book_url, found_locations):
     else:
         save_results_to_sqlite(db_file, book_title, book_url, found_locations)
 
-def save_results_to_sqlite(db_file, book_title, book_url, found_locations):
-    """Save results to SQLite (existing functionality)."""
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    
+def write_results(cursor, book_title, book_url, found_locations):
+    """Write a book, its locations and its mentions with the registered statements; returns the mention count."""
     # 1. Add the book and get its ID
-    cursor.execute("INSERT OR IGNORE INTO books (title, url) VALUES (?, ?)", (book_title, book_url))
-    cursor.execute("SELECT id FROM books WHERE title = ?", (book_title,))
+    execute(cursor, 'integration_insert_book', (book_title, book_url, book_url))
+    execute(cursor, 'integration_book_id', (book_url,))
     book_id = cursor.fetchone()[0]
     
+    # A rerun replaces the book's mentions instead of adding them again
+    execute(cursor, 'integration_delete_mentions', (book_id,))
+    
     # 2. Add the locations and the mentions with context
     total_mentions = 0
     for name, data in found_locations.items():
         # Add the location and get its ID
-        cursor.execute("INSERT OR IGNORE INTO locations (name, latitude, longitude) VALUES (?, ?, ?)",
-                       (name, data['lat'], data['lon']))
-        cursor.execute("SELECT id FROM locations WHERE name = ?", (name,))
+        place = (name, data['lat'], data['lon'])
+        execute(cursor, 'integration_insert_location', place)
+        execute(cursor, 'integration_location_id', place)
         location_id = cursor.fetchone()[0]
         
-        # Add each mention with its context
-        for mention in data['mentions']:
-            cursor.execute("INSERT OR IGNORE INTO mentions (book_id, location_id, text_position, context) VALUES (?, ?, ?, ?)",
-                           (book_id, location_id, mention['position'], mention['context']))
-            total_mentions += 1
+        # Add the location's mentions with their context in one batch
+        executemany(cursor, 'integration_insert_mention', [
+            (book_id, location_id, mention['position'], mention['context']) for mention in data['mentions']
+        ])
+        total_mentions += len(data['mentions'])
+    return total_mentions
 
+def save_results_to_sqlite(db_file, book_title, book_url, found_locations):
+    """Save results to SQLite (existing functionality)."""
+    conn = get_sqlite_connection(db_file)
+    cursor = conn.cursor()
+    
+    total_mentions = write_results(cursor, book_title, book_url, found_locations)
+    mark_write(cursor)
     conn.commit()
     conn.close()
     print(f"Successfully saved {total_mentions} mentions for '{book_title}' to SQLite database.")
@@ -197,37 +116,7 @@ def save_results_to_postgresql(book_title, book_url, found_locations):
         conn = get_postgresql_connection()
         cursor = conn.cursor()
         
-        # 1. Add the book and get its ID
-        cursor.execute("INSERT INTO books (title, url) VALUES (%s, %s) ON CONFLICT (title) DO NOTHING", (book_title, book_url))
-        cursor.execute("SELECT id FROM books WHERE title = %s", (book_title,))
-        result = cursor.fetchone()
-        if result:
-            book_id = result[0]
-        else:
-            # Book was already there, get its ID
-            cursor.execute("SELECT id FROM books WHERE title = %s", (book_title,))
-            book_id = cursor.fetchone()[0]
-        
-        # 2. Add the locations and the mentions with context
-        total_mentions = 0
-        for name, data in found_locations.items():
-            # Add the location and get its ID
-            cursor.execute("INSERT INTO locations (name, latitude, longitude) VALUES (%s, %s, %s) ON CONFLICT (name) DO NOTHING",
-                           (name, data['lat'], data['lon']))
-            cursor.execute("SELECT id FROM locations WHERE name = %s", (name,))
-            result = cursor.fetchone()
-            if result:
-                location_id = result[0]
-            else:
-                # Location was already there, get its ID
-                cursor.execute("SELECT id FROM locations WHERE name = %s", (name,))
-                location_id = cursor.fetchone()[0]
-            
-            # Add each mention with its context
-            cursor.execute("INSERT INTO mentions (book_id, location_id, text_position, context) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING",
-                           (book_id, location_id, mention['position'], mention['context']))
-            total_mentions += 1
-
+        total_mentions = write_results(cursor, book_title, book_url, found_locations)
         conn.commit()
         cursor.close()
         conn.close()
@@ -297,6 +186,9 @@ def match_locations_with_context(text, entities, gazetteer_lookup):
         lookup_key = ent.lower()
         if lookup_key in gazetteer_lookup:
             record = gazetteer_lookup[lookup_key]
+            if isinstance(record, list):
+                # A name shared by several places; without disambiguation the first listed wins
+                record = record[0]
             main_name = record['name']
             
             # Find the position of this entity in the text
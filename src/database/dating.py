@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Per-mention year estimation
+Books store their cleaned text length and chapter start offsets at ingestion. A book's
+historical range is spread over its chapters, anchored by the explicit dates the
+temporal tagger finds, and every mention of the book is dated in one NumPy pass.
+"""
+
+import json
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Chapter-like headings on a line of their own: "CHAPTER XII", "Chapter 3.", "BOOK II", "PART ONE"
+CHAPTER_PATTERN = re.compile(
+    r'^[ \t]*(?:CHAPTER|Chapter|BOOK|Book|PART|Part)[ \t]+'
+    r'(?:[IVXLCDM]+|\d+|[A-Z][a-z]+|[A-Z]+)\b[^\n]{0,80}$',
+    re.MULTILINE
+)
+
+# Explicit dates further than this outside the book's range are treated as digressions
+DATE_TOLERANCE_YEARS = 50
+
+def find_chapter_offsets(text: str) -> List[int]:
+    """Character offsets where chapters start (the book start is implicit)."""
+    return [match.start() for match in CHAPTER_PATTERN.finditer(text) if match.start() > 0]
+
+def chapter_offsets_between(text: str, start: int, end: int, text_start: int = 0) -> List[int]:
+    """
+    Chapter offsets in [start, end) of a book, given a piece of it that begins at book
+    offset text_start and holds whole lines around the range; a streamed book's chunks
+    together give the same offsets as find_chapter_offsets on the whole text.
+    """
+    offsets = []
+    # Searching from a position still anchors ^ only at real line starts
+    for match in CHAPTER_PATTERN.finditer(text, max(0, start - text_start)):
+        offset = text_start + match.start()
+        if offset >= end:
+            break
+        if offset > 0:
+            offsets.append(offset)
+    return offsets
+
+def book_structure(text: str) -> Tuple[int, List[int]]:
+    """Text length and chapter offsets stored with a book at ingestion."""
+    return len(text), find_chapter_offsets(text)
+
+def stream_book_structure(pieces: Iterable[str]) -> Tuple[int, List[int]]:
+    """book_structure over a text given in consecutive pieces, searched a batch of whole lines at a time."""
+    length, offsets, carry = 0, [], ''
+    for piece in pieces:
+        text = carry + piece
+        text_start = length - len(carry)
+        length += len(piece)
+        # The line after the last newline may continue in the next piece
+        cut = text.rfind('\n') + 1
+        offsets.extend(chapter_offsets_between(text[:cut], text_start, text_start + cut, text_start))
+        carry = text[cut:]
+    if carry:
+        offsets.extend(chapter_offsets_between(carry, length - len(carry), length, length - len(carry)))
+    return length, offsets
+
+def dump_chapter_offsets(offsets: Optional[Sequence[int]]) -> Optional[str]:
+    """Serialize chapter offsets for the books.chapter_offsets column."""
+    return None if offsets is None else json.dumps(list(offsets))
+
+def load_chapter_offsets(value) -> List[int]:
+    """Parse the books.chapter_offsets column (JSON list, NULL for unknown)."""
+    if not value:
+        return []
+    return json.loads(value) if isinstance(value, str) else list(value)
+
+def estimate_years(positions: Sequence[int], explicit_years: Sequence[Optional[int]],
+                   text_length: Optional[int], chapter_offsets: Sequence[int],
+                   start_year: Optional[int], end_year: Optional[int],
+                   tolerance: int = DATE_TOLERANCE_YEARS) -> np.ndarray:
+    """
+    Estimate a year for every mention of one book (NaN where none can be given).
+
+    The historical range is interpolated over the book's chapters: each chapter that
+    contains explicit dates inside the range (+- tolerance) is anchored at its midpoint
+    to their median, other chapters follow the proportional position in the book.
+    A mention's own explicit date wins over the interpolated value when plausible.
+    explicit_years may also be a float array with NaN for the mentions without a date.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    if isinstance(explicit_years, np.ndarray):
+        explicit = explicit_years.astype(np.float64)
+    else:
+        explicit = np.array([np.nan if year is None else year for year in explicit_years], dtype=np.float64)
+    if positions.size == 0:
+        return explicit
+
+    if start_year is None or end_year is None:
+        return explicit
+
+    low, high = min(start_year, end_year), max(start_year, end_year)
+    plausible = ~np.isnan(explicit) & (explicit >= low - tolerance) & (explicit <= high + tolerance)
+
+    length = float(text_length) if text_length else float(positions.max() + 1)
+    inner = [offset for offset in sorted(chapter_offsets) if 0 < offset < length]
+    bounds = np.array([0.0] + inner + [length])
+    chapter = np.clip(np.searchsorted(bounds, positions, side='right') - 1, 0, len(bounds) - 2)
+
+    # Anchors at the book edges and chapter midpoints; np.interp is linear between them
+    midpoints = (bounds[:-1] + bounds[1:]) / 2
+    anchor_years = start_year + (midpoints / length) * (end_year - start_year)
+    for index in np.unique(chapter[plausible]):
+        anchor_years[index] = np.median(explicit[plausible & (chapter == index)])
+
+    anchor_positions = np.concatenate(([0.0], midpoints, [length]))
+    anchor_years = np.concatenate(([start_year], anchor_years, [end_year]))
+    interpolated = np.clip(np.interp(positions, anchor_positions, anchor_years), low, high)
+
+    return np.where(plausible, explicit, np.trunc(interpolated))
+
+def to_year(value) -> Optional[int]:
+    """Convert an estimate to an int year, or None for NaN."""
+    return None if np.isnan(value) else int(value)
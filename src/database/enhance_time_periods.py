@@ -1,81 +1,31 @@
-import sqlite3
+import argparse
 import re
+import time
+from array import array
 from datetime import datetime
+from typing import Iterator, List
+import numpy as np
+from data_access import get_sqlite_connection, mark_write
+from migrations import ensure_schema
+from checkpoints import clear_checkpoint, get_checkpoint, save_checkpoint
+from context_store import iter_book_text
+from temporal_tagger import mention_time_context, tag_pieces, tag_text
+from timeline import rebuild_timeline_rollup
+from dating import dump_chapter_offsets, estimate_years, load_chapter_offsets, stream_book_structure, to_year
 
 def enhance_database_with_time_periods():
     """Enhance the database schema to include time period analysis."""
-    conn = sqlite3.connect('history_map.db')
+    conn = get_sqlite_connection('history_map.db')
     cursor = conn.cursor()
     
     print("Enhancing database with time period analysis...")
     
-    # 1. Add time period columns to books table
-    cursor.execute("""
-        ALTER TABLE books ADD COLUMN publication_year INTEGER
-    """)
-    
-    cursor.execute("""
-        ALTER TABLE books ADD COLUMN historical_start_year INTEGER
-    """)
-    
-    cursor.execute("""
-        ALTER TABLE books ADD COLUMN historical_end_year INTEGER
-    """)
-    
-    cursor.execute("""
-        ALTER TABLE books ADD COLUMN time_period_description TEXT
-    """)
-    
-    # 2. Add time period columns to locations table
-    cursor.execute("""
-        ALTER TABLE locations ADD COLUMN first_mentioned_year INTEGER
-    """)
-    
-    cursor.execute("""
-        ALTER TABLE locations ADD COLUMN period_of_significance TEXT
-    """)
-    
-    # 3. Add time period columns to mentions table
-    cursor.execute("""
-        ALTER TABLE mentions ADD COLUMN estimated_year INTEGER
-    """)
-    
-    cursor.execute("""
-        ALTER TABLE mentions ADD COLUMN time_context TEXT
-    """)
-    
-    # 4. Create new time_periods table for reference
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS time_periods (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            start_year INTEGER,
-            end_year INTEGER,
-            description TEXT,
-            region TEXT
-        )
-    """)
-    
-    # 5. Insert common historical periods
-    periods = [
-        ("Early Middle Ages", 500, 1000, "Migration period, Carolingian Empire", "Europe"),
-        ("High Middle Ages", 1000, 1300, "Crusades, rise of cities, Gothic architecture", "Europe"),
-        ("Late Middle Ages", 1300, 1500, "Black Death, Hundred Years War, Renaissance begins", "Europe"),
-        ("Early Modern Period", 1500, 1800, "Age of Discovery, Reformation, Enlightenment", "Europe"),
-        ("Roman Empire", -27, 476, "Classical Roman civilization", "Mediterranean"),
-        ("Byzantine Empire", 330, 1453, "Eastern Roman Empire", "Eastern Mediterranean"),
-        ("Islamic Golden Age", 750, 1258, "Abbasid Caliphate, scientific advances", "Middle East"),
-        ("Viking Age", 793, 1066, "Norse exploration and raids", "Northern Europe"),
-        ("Crusader States", 1098, 1291, "Christian kingdoms in the Levant", "Middle East"),
-        ("Holy Roman Empire", 800, 1806, "Medieval and early modern German empire", "Central Europe")
-    ]
-    
-    cursor.executemany("""
-        INSERT OR IGNORE INTO time_periods (name, start_year, end_year, description, region)
-        VALUES (?, ?, ?, ?, ?)
-    """, periods)
+    # 1. Time period columns, the time_periods table and time indexes are schema migrations,
+    # so running this script again is safe
+    version = ensure_schema(conn, 'sqlite')
+    print(f"Schema at version {version}")
     
-    # 6. Update existing book with time period information
+    # 2. Update existing book with time period information
     cursor.execute("""
         UPDATE books 
         SET 
@@ -86,12 +36,7 @@ def enhance_database_with_time_periods():
         WHERE title = 'The Empire and the Papacy, 918-1273'
     """)
     
-    # 7. Create indexes for time-based queries
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_publication_year ON books(publication_year)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_historical_start ON books(historical_start_year)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_historical_end ON books(historical_end_year)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mentions_estimated_year ON mentions(estimated_year)")
-    
+    mark_write(cursor)
     conn.commit()
     conn.close()
     print("Database enhanced with time period analysis!")
@@ -141,62 +86,170 @@ def extract_time_periods_from_text(text):
     
     return extracted_times
 
-def analyze_mentions_with_time_context():
-    """Analyze existing mentions to add time context."""
-    conn = sqlite3.connect('history_map.db')
+# Job name of the re-dating run in the job_checkpoints table (progress is kept per book)
+TIME_CONTEXT_JOB = 'mention_time_context'
+
+# Rows per read/write batch, and the memory budget that shrinks batches of long contexts
+TIME_CONTEXT_BATCH_SIZE = 20000
+TIME_CONTEXT_MEMORY_LIMIT_MB = 64
+
+# Books fetched per query when walking the corpus
+TIME_CONTEXT_BOOK_PAGE = 500
+
+UPDATE_MENTION_TIME_SQL = """
+    UPDATE mentions
+    SET estimated_year = ?, time_context = ?
+    WHERE id = ?
+"""
+
+def date_book_mentions(cursor, book_id: int, start_year, end_year, text_length, chapter_offsets,
+                       batch_size: int = TIME_CONTEXT_BATCH_SIZE,
+                       memory_limit_mb: int = TIME_CONTEXT_MEMORY_LIMIT_MB) -> Iterator[List[tuple]]:
+    """
+    Date every mention of one book in a single NumPy pass.
+    Contexts are read in keyset batches and reduced to their explicit dates, kept in
+    compact arrays (ids, positions, years, and an index into the distinct time context
+    strings), then estimate_years combines them with the book's range over its chapters.
+    Yields (estimated_year, time_context, mention_id) update rows in slices of at most
+    batch_size rows, once all of the book's mentions have been read.
+    """
+    # Compressed books are tagged from their stored text one chunk at a time; the text
+    # also fills in missing structure
+    book_events = None
+    cursor.execute("SELECT COUNT(*) FROM book_texts WHERE book_id = ?", (book_id,))
+    if cursor.fetchone()[0]:
+        book_events = tag_pieces(iter_book_text(cursor, book_id))
+        if text_length is None:
+            text_length, chapter_offsets = stream_book_structure(iter_book_text(cursor, book_id))
+            cursor.execute(
+                "UPDATE books SET text_length = ?, chapter_offsets = ? WHERE id = ?",
+                (text_length, dump_chapter_offsets(chapter_offsets), book_id)
+            )
+
+    memory_limit = memory_limit_mb * 1024 * 1024
+    ids, positions, explicit_years = array('q'), array('q'), array('d')
+    context_indexes, time_contexts = array('l'), {}
+    last_id, limit = 0, batch_size
+
+    while True:
+        cursor.execute("""
+            SELECT id, context, text_position, mention_length
+            FROM mentions
+            WHERE book_id = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (book_id, last_id, limit))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        for mention_id, context, position, mention_length in rows:
+            if context is not None:
+                # The mention sits roughly in the middle of its stored context
+                year, time_context = mention_time_context(tag_text(context), len(context) // 2, 0, window=len(context))
+            elif book_events is not None:
+                year, time_context = mention_time_context(book_events, position, mention_length or 0)
+            else:
+                year, time_context = None, ""
+
+            ids.append(mention_id)
+            positions.append(position)
+            explicit_years.append(np.nan if year is None else year)
+            context_indexes.append(time_contexts.setdefault(time_context or "No specific time mentioned",
+                                                            len(time_contexts)))
+
+        last_id = rows[-1][0]
+        # Keep the next batch within the memory budget
+        row_bytes = sum(len(row[1]) for row in rows if row[1]) / len(rows) + 64
+        limit = max(100, min(batch_size, int(memory_limit / row_bytes)))
+
+    estimated = estimate_years(np.frombuffer(positions, dtype=np.int64), np.frombuffer(explicit_years),
+                               text_length, chapter_offsets, start_year, end_year)
+    contexts = list(time_contexts)
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        yield [(to_year(year), contexts[context_index], mention_id)
+               for year, context_index, mention_id in zip(estimated[start:end], context_indexes[start:end], ids[start:end])]
+
+def analyze_mentions_with_time_context(db_file: str = 'history_map.db', redate_all: bool = False,
+                                       batch_size: int = TIME_CONTEXT_BATCH_SIZE,
+                                       memory_limit_mb: int = TIME_CONTEXT_MEMORY_LIMIT_MB):
+    """
+    Analyze mentions to add time context, one book at a time.
+    Books are walked by id; updates are written with executemany in slices of at most
+    batch_size rows and committed whenever about batch_size rows are pending, even in
+    the middle of a book, so transactions stay bounded. The checkpoint is the last book
+    dated completely, so an interrupted run dates a partly written book again.
+    By default only books that have mentions without time context are dated;
+    redate_all re-dates the whole corpus. Books still in progress are left to the batch
+    processor, which dates them when their text is complete.
+    """
+    conn = get_sqlite_connection(db_file)
+    ensure_schema(conn, 'sqlite')
     cursor = conn.cursor()
-    
+
     print("Analyzing mentions for time context...")
-    
-    # Get all mentions with their context
-    cursor.execute("""
-        SELECT m.id, m.context, m.text_position, b.historical_start_year, b.historical_end_year
-        FROM mentions m
-        JOIN books b ON m.book_id = b.id
-        WHERE m.time_context IS NULL
-    """)
-    
-    mentions = cursor.fetchall()
-    
-    for mention in mentions:
-        mention_id, context, position, start_year, end_year = mention
-        
-        # Extract time information from context
-        time_info = extract_time_periods_from_text(context)
-        
-        # Estimate year based on position in text and book's time range
-        if start_year and end_year:
-            # Simple linear interpolation based on position in text
-            # This is a rough estimate - could be improved with more sophisticated analysis
-            estimated_year = start_year + int((position / 1000000) * (end_year - start_year))
-        else:
-            estimated_year = None
-        
-        # Create time context description
-        time_context_parts = []
-        if time_info.get('year'):
-            time_context_parts.append(f"Years mentioned: {', '.join(time_info['year'])}")
-        if time_info.get('century'):
-            time_context_parts.append(f"Centuries: {', '.join(time_info['century'])}")
-        if time_info.get('period'):
-            time_context_parts.append(f"Periods: {', '.join(time_info['period'])}")
-        
-        time_context = "; ".join(time_context_parts) if time_context_parts else "No specific time mentioned"
-        
-        # Update the mention with time information
-        cursor.execute("""
-            UPDATE mentions 
-            SET estimated_year = ?, time_context = ?
-            WHERE id = ?
-        """, (estimated_year, time_context, mention_id))
-    
+
+    last_book_id = get_checkpoint(cursor, TIME_CONTEXT_JOB)
+    if last_book_id:
+        print(f"Resuming after book id {last_book_id}")
+
+    pending = "" if redate_all else \
+        "AND EXISTS (SELECT 1 FROM mentions m WHERE m.book_id = b.id AND m.time_context IS NULL)"
+    analyzed = pending_rows = 0
+    started = time.perf_counter()
+
+    def commit(book_id):
+        save_checkpoint(cursor, TIME_CONTEXT_JOB, book_id)
+        mark_write(cursor)
+        conn.commit()
+        print(f"   {analyzed:,} mentions dated (books up to {book_id} complete, {time.perf_counter() - started:.1f}s)")
+
+    while True:
+        cursor.execute(f"""
+            SELECT b.id, b.historical_start_year, b.historical_end_year, b.text_length, b.chapter_offsets
+            FROM books b
+            WHERE b.id > ? AND b.in_progress IS NULL {pending}
+            ORDER BY b.id
+            LIMIT ?
+        """, (last_book_id, TIME_CONTEXT_BOOK_PAGE))
+        books = cursor.fetchall()
+        if not books:
+            break
+
+        for book_id, start_year, end_year, text_length, chapter_offsets in books:
+            for updates in date_book_mentions(cursor, book_id, start_year, end_year, text_length,
+                                              load_chapter_offsets(chapter_offsets), batch_size, memory_limit_mb):
+                cursor.executemany(UPDATE_MENTION_TIME_SQL, updates)
+                analyzed += len(updates)
+                pending_rows += len(updates)
+                if pending_rows >= batch_size:
+                    commit(last_book_id)
+                    pending_rows = 0
+            last_book_id = book_id
+
+    if pending_rows:
+        commit(last_book_id)
+
+    clear_checkpoint(cursor, TIME_CONTEXT_JOB)
+    if analyzed:
+        # Estimated years changed, so the timeline rollup is recomputed once
+        rebuild_timeline_rollup(cursor)
+        mark_write(cursor)
     conn.commit()
     conn.close()
-    print("Time context analysis complete!")
+    print(f"Time context analysis complete! ({analyzed:,} mentions)")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add time periods to books and time context to mentions")
+    parser.add_argument('--redate-all', action='store_true', help="re-date every mention, not only new ones")
+    parser.add_argument('--batch-size', type=int, default=TIME_CONTEXT_BATCH_SIZE)
+    parser.add_argument('--memory-limit-mb', type=int, default=TIME_CONTEXT_MEMORY_LIMIT_MB)
+    args = parser.parse_args()
+
     enhance_database_with_time_periods()
-    analyze_mentions_with_time_context()
+    analyze_mentions_with_time_context(redate_all=args.redate_all, batch_size=args.batch_size,
+                                       memory_limit_mb=args.memory_limit_mb)
     print("\n🎉 Time period analysis system ready!")
     print("\nNew capabilities:")
     print("- Book publication and historical coverage dates")
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Streaming bulk export of the books/locations/mentions join
+Rows are read through a server-side cursor (PostgreSQL) or an incrementally stepped
+statement (SQLite) and written out batch by batch, so memory stays constant no matter
+how many mentions match. Used by the export CLI and the /api/export endpoint.
+
+Usage:
+    python src/database/export.py --format ndjson > mentions.ndjson
+    python src/database/export.py --format geojson --start-year 1000 --end-year 1200 -o out.geojson
+    python src/database/export.py --format parquet --bbox 5,45,15,55 -o alps.parquet
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Sequence
+
+sys.path.append(os.path.dirname(__file__))
+from context_store import BookTextReader, DEFAULT_CONTEXT_WINDOW
+from data_access import backend_of, get_db_connection
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet/Arrow export is optional
+    pyarrow = None
+
+# Rows fetched from the database and written per batch
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    'mention_id', 'book_id', 'book_title', 'book_author',
+    'historical_start_year', 'historical_end_year',
+    'location_id', 'location_name', 'latitude', 'longitude', 'country_code',
+    'text_position', 'mention_length', 'estimated_year', 'time_context', 'context'
+]
+
+EXPORT_QUERY = """
+    SELECT m.id AS mention_id, m.book_id, b.title AS book_title, b.author AS book_author,
+           b.historical_start_year, b.historical_end_year,
+           m.location_id, l.name AS location_name, l.latitude, l.longitude, l.country_code,
+           m.text_position, m.mention_length, m.estimated_year, m.time_context, m.context
+    FROM mentions m
+    JOIN books b ON b.id = m.book_id
+    JOIN locations l ON l.id = m.location_id
+    WHERE b.in_progress IS NULL
+"""
+
+# Output format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'geojson': ('application/geo+json', 'geojson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+ARROW_FORMATS = ('parquet', 'arrow')
+
+class ExportError(ValueError):
+    """Invalid export request (unknown format, bad filter, missing optional dependency)."""
+
+class ExportFilters:
+    """Optional filters applied to the export query."""
+
+    def __init__(self, start_year: Optional[int] = None, end_year: Optional[int] = None,
+                 mode: str = 'book', bbox: Optional[Sequence[float]] = None,
+                 book_ids: Optional[Sequence[int]] = None):
+        if (start_year is None) != (end_year is None):
+            raise ExportError("Both start_year and end_year are required for a year filter")
+        if mode not in ('book', 'mention'):
+            raise ExportError("Year filter mode must be 'book' or 'mention'")
+        if bbox is not None and len(bbox) != 4:
+            raise ExportError("bbox must be min_lon,min_lat,max_lon,max_lat")
+        self.start_year = start_year
+        self.end_year = end_year
+        self.mode = mode
+        self.bbox = tuple(bbox) if bbox is not None else None
+        self.book_ids = list(book_ids) if book_ids else []
+
+    def where_clause(self, placeholder: str = '?'):
+        """SQL conditions (each led by AND, for the export query's WHERE) and parameters for the active filters."""
+        conditions, params = [], []
+        if self.start_year is not None:
+            if self.mode == 'mention':
+                conditions.append(f"m.estimated_year BETWEEN {placeholder} AND {placeholder}")
+                params += [self.start_year, self.end_year]
+            else:
+                # Same overlap rule as the year endpoints: book period intersects the range
+                conditions.append(f"b.historical_start_year <= {placeholder} AND b.historical_end_year >= {placeholder}")
+                params += [self.end_year, self.start_year]
+        if self.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            conditions.append(f"l.latitude BETWEEN {placeholder} AND {placeholder} "
+                              f"AND l.longitude BETWEEN {placeholder} AND {placeholder}")
+            params += [min_lat, max_lat, min_lon, max_lon]
+        if self.book_ids:
+            conditions.append(f"m.book_id IN ({', '.join([placeholder] * len(self.book_ids))})")
+            params += self.book_ids
+        return "".join(" AND " + condition for condition in conditions), params
+
+def parse_bbox(value: Optional[str]) -> Optional[List[float]]:
+    """Parse 'min_lon,min_lat,max_lon,max_lat' into floats."""
+    if not value:
+        return None
+    try:
+        bbox = [float(part) for part in value.split(',')]
+    except ValueError:
+        raise ExportError("bbox must be four comma-separated numbers")
+    if len(bbox) != 4:
+        raise ExportError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    return bbox
+
+def check_export_format(fmt: str):
+    """Raise ExportError when a format is unknown or its optional dependency is missing."""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format '{fmt}' (choose from {', '.join(EXPORT_FORMATS)})")
+    if fmt in ARROW_FORMATS and pyarrow is None:
+        raise ExportError(f"{fmt} export requires pyarrow (pip install pyarrow)")
+
+# --- Reading ---
+def _row_values(row) -> list:
+    """Column values of a tuple, sqlite3.Row or dict row in EXPORT_COLUMNS order."""
+    if isinstance(row, dict):
+        return [row[column] for column in EXPORT_COLUMNS]
+    return list(row)
+
+def iter_export_batches(conn, db_type: str, filters: Optional[ExportFilters] = None,
+                        batch_size: int = EXPORT_BATCH_SIZE,
+                        context_window: int = DEFAULT_CONTEXT_WINDOW) -> Iterator[List[list]]:
+    """
+    Yield lists of export rows (values in EXPORT_COLUMNS order) in mention id order.
+    Contexts of books stored in compressed mode are sliced from the book text per batch.
+    """
+    placeholder = '%s' if db_type == 'postgresql' else '?'
+    where, params = (filters or ExportFilters()).where_clause(placeholder)
+    query = EXPORT_QUERY + where + " ORDER BY m.id"
+
+    if db_type == 'postgresql':
+        # Named cursors live on the server; rows are transferred itersize at a time
+        cursor = conn.cursor(name='mention_export')
+        cursor.itersize = batch_size
+    else:
+        cursor = conn.cursor()
+    text_cursor = conn.cursor()
+    book_index, position_index, length_index, context_index = (
+        EXPORT_COLUMNS.index(column) for column in ('book_id', 'text_position', 'mention_length', 'context'))
+
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = [_row_values(row) for row in rows]
+            # A fresh reader per batch keeps the inflated chunk cache bounded
+            reader = BookTextReader(text_cursor, placeholder)
+            for values in batch:
+                if values[context_index] is None and values[length_index] is not None:
+                    values[context_index] = reader.context(values[book_index], values[position_index],
+                                                           values[length_index], context_window)
+            yield batch
+    finally:
+        cursor.close()
+        text_cursor.close()
+
+# --- Writers: each turns row batches into a stream of bytes chunks ---
+def _records(batch: List[list]) -> Iterator[Dict]:
+    for values in batch:
+        yield dict(zip(EXPORT_COLUMNS, values))
+
+def write_ndjson(batches: Iterator[List[list]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in _records(batch)).encode('utf-8')
+
+def write_csv(batches: Iterator[List[list]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def write_geojson(batches: Iterator[List[list]]) -> Iterator[bytes]:
+    """A FeatureCollection written incrementally, one Point feature per mention."""
+    yield b'{"type":"FeatureCollection","features":['
+    first = True
+    for batch in batches:
+        features = []
+        for record in _records(batch):
+            geometry = {"type": "Point", "coordinates": [record.pop('longitude'), record.pop('latitude')]}
+            features.append(json.dumps({"type": "Feature", "geometry": geometry, "properties": record},
+                                       ensure_ascii=False))
+        if features:
+            yield ((b"" if first else b",") + ",".join(features).encode('utf-8'))
+            first = False
+    yield b']}\n'
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _arrow_schema():
+    """Arrow schema for EXPORT_COLUMNS."""
+    types = {
+        'book_title': pyarrow.string(), 'book_author': pyarrow.string(),
+        'location_name': pyarrow.string(), 'country_code': pyarrow.string(),
+        'time_context': pyarrow.string(), 'context': pyarrow.string(),
+        'latitude': pyarrow.float64(), 'longitude': pyarrow.float64(),
+    }
+    return pyarrow.schema([(column, types.get(column, pyarrow.int64())) for column in EXPORT_COLUMNS])
+
+def _write_arrow_batches(batches: Iterator[List[list]], open_writer) -> Iterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    writer = open_writer(sink, schema)
+    try:
+        for batch in batches:
+            columns = [pyarrow.array(column, type=field.type) for column, field in zip(zip(*batch), schema)]
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def write_parquet(batches: Iterator[List[list]]) -> Iterator[bytes]:
+    """Parquet written one row group per batch; the footer follows the last batch."""
+    return _write_arrow_batches(batches, lambda sink, schema: pyarrow.parquet.ParquetWriter(sink, schema))
+
+def write_arrow(batches: Iterator[List[list]]) -> Iterator[bytes]:
+    """Arrow IPC stream format, one record batch per database batch."""
+    return _write_arrow_batches(batches, lambda sink, schema: pyarrow.ipc.new_stream(sink, schema))
+
+EXPORT_WRITERS = {
+    'ndjson': write_ndjson,
+    'csv': write_csv,
+    'geojson': write_geojson,
+    'parquet': write_parquet,
+    'arrow': write_arrow,
+}
+
+def export_mentions(conn, db_type: str, fmt: str, filters: Optional[ExportFilters] = None,
+                    batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Stream the filtered mention export in the given format as bytes chunks."""
+    check_export_format(fmt)
+    return EXPORT_WRITERS[fmt](iter_export_batches(conn, db_type, filters, batch_size))
+
+def main():
+    """Export mentions from the configured database to a file or stdout."""
+    parser = argparse.ArgumentParser(description="Stream the books/locations/mentions join to a file")
+    parser.add_argument('--db', default='history_map.db', help="SQLite database file (when DB_TYPE is not postgresql)")
+    parser.add_argument('--format', default='ndjson', choices=list(EXPORT_FORMATS))
+    parser.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    parser.add_argument('--start-year', type=int)
+    parser.add_argument('--end-year', type=int)
+    parser.add_argument('--mode', default='book', choices=['book', 'mention'],
+                        help="filter by book period or by each mention's estimated year")
+    parser.add_argument('--bbox', help="min_lon,min_lat,max_lon,max_lat")
+    parser.add_argument('--book-id', type=int, action='append', help="restrict to a book (repeatable)")
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        filters = ExportFilters(args.start_year, args.end_year, args.mode, parse_bbox(args.bbox), args.book_id)
+        check_export_format(args.format)
+    except ExportError as e:
+        parser.error(str(e))
+
+    conn = get_db_connection(args.db)
+    # get_db_connection falls back to SQLite when PostgreSQL is unavailable
+    db_type = backend_of(conn)
+
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    written = 0
+    try:
+        for chunk in export_mentions(conn, db_type, args.format, filters, args.batch_size):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        conn.close()
+    print(f"Exported {written} bytes as {args.format}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Index advisor for the web API queries
+Runs EXPLAIN over every endpoint query in api_queries, reports full table scans,
+table lookups and temporary sorts, and creates the recommended covering indexes.
+Queries that cannot be index-only by design (api_queries.EXPECTED_PLANS) are graded
+separately: counts and ordered listings may walk a whole covering index, substring
+matches may scan the name index, and the mention listings read each mention's context
+from the table by rowid, because a covering index carrying the context outgrew the table.
+
+Usage:
+    python src/database/index_advisor.py            # report only
+    python src/database/index_advisor.py --apply    # create missing and drop obsolete indexes, ANALYZE, report again
+"""
+
+import argparse
+import os
+import sys
+from collections import Counter
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(__file__))
+from api_queries import API_QUERIES, EXPECTED_PLANS, SAMPLE_PARAMETERS, format_query
+from data_access import backend_of, get_db_connection
+from migrations import OBSOLETE_INDEXES, RECOMMENDED_INDEXES, ensure_schema, _value
+
+# --- Plan Inspection ---
+def explain_query(cursor, db_type: str, sql: str, params: tuple) -> List[str]:
+    """Return the plan steps of a query as text lines."""
+    if db_type == 'postgresql':
+        cursor.execute("EXPLAIN " + format_query(sql, db_type), params)
+        return [_value(row) for row in cursor.fetchall()]
+
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    # Rows are (id, parent, notused, detail)
+    return [_value(row, 3) for row in cursor.fetchall()]
+
+# Expected plan kinds that may walk a whole covering index, and the one that reads mention rows
+INDEX_WALK_PLANS = {'aggregate', 'ordered walk', 'substring'}
+CONTEXT_READ_PLAN = 'context read'
+
+def classify_plan(steps: List[str], db_type: str, expected: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Sort plan steps into full scans, table lookups and temporary sorts. With an expected
+    plan kind, covering index walks and mention context reads are listed as 'by_design'.
+    """
+    issues = {'full_scans': [], 'table_lookups': [], 'temp_sorts': [], 'by_design': []}
+    # Scanning a materialized subquery or co-routine reads its temporary result, not a table
+    materialized = {step.strip().split()[1] for step in steps
+                    if step.strip().startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+
+    for step in steps:
+        text = step.strip()
+        if db_type == 'postgresql':
+            if 'Seq Scan' in text:
+                issues['full_scans'].append(text)
+            elif ('Index Scan' in text and 'Index Only Scan' not in text) or 'Bitmap Heap Scan' in text:
+                if expected == CONTEXT_READ_PLAN and ' on mentions' in text:
+                    issues['by_design'].append(text)
+                else:
+                    issues['table_lookups'].append(text)
+            elif text.lstrip('-> ').startswith('Sort'):
+                issues['temp_sorts'].append(text)
+        else:
+            if text.startswith('SCAN'):
+                # A scan reads the whole table or index, covering or not
+                if text.split()[1] in materialized or 'CONSTANT ROW' in text or '(subquery' in text:
+                    continue
+                if expected in INDEX_WALK_PLANS and 'USING COVERING INDEX' in text:
+                    issues['by_design'].append(text)
+                else:
+                    issues['full_scans'].append(text)
+            elif text.startswith('SEARCH'):
+                # Rowid lookups hit the table b-tree itself, which is clustered on the primary key,
+                # and a covering index search never reads the table
+                if 'USING INDEX' in text:
+                    if expected == CONTEXT_READ_PLAN and 'USING INDEX idx_mentions_' in text:
+                        issues['by_design'].append(text)
+                    else:
+                        issues['table_lookups'].append(text)
+            elif 'TEMP B-TREE' in text:
+                issues['temp_sorts'].append(text)
+
+    return issues
+
+def advise(conn, db_type: str) -> List[Dict]:
+    """EXPLAIN every API query and collect its plan and issues."""
+    cursor = conn.cursor()
+    report = []
+
+    for name, sql in API_QUERIES.items():
+        steps = explain_query(cursor, db_type, sql, SAMPLE_PARAMETERS[name])
+        issues = classify_plan(steps, db_type, EXPECTED_PLANS.get(name))
+        needs_indexes = bool(issues['full_scans'] or issues['table_lookups'])
+        report.append({
+            'query': name,
+            'plan': steps,
+            'issues': issues,
+            'index_only': not needs_indexes and not issues['by_design'],
+            # Kind of by-design plan, graded apart from index-only plans
+            'expected': EXPECTED_PLANS.get(name) if issues['by_design'] and not needs_indexes else None,
+        })
+
+    cursor.close()
+    return report
+
+def existing_indexes(cursor, db_type: str) -> set:
+    """Names of the indexes present in the database."""
+    if db_type == 'postgresql':
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")
+    else:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    return {_value(row) for row in cursor.fetchall()}
+
+def missing_indexes(conn, db_type: str) -> List[tuple]:
+    """Recommended covering indexes that have not been created yet."""
+    cursor = conn.cursor()
+    present = existing_indexes(cursor, db_type)
+    cursor.close()
+    return [index for index in RECOMMENDED_INDEXES if index[0] not in present]
+
+def obsolete_indexes(conn, db_type: str) -> List[str]:
+    """Indexes the migrations drop (left prefixes and superseded forms) that are still present."""
+    cursor = conn.cursor()
+    present = existing_indexes(cursor, db_type)
+    cursor.close()
+    return [name for name in OBSOLETE_INDEXES if name in present]
+
+def print_report(report: List[Dict], missing: List[tuple], obsolete: List[str]):
+    """Print the per-query plans and the index recommendations."""
+    print("=== API Query Plan Report ===")
+    for entry in report:
+        if entry['index_only']:
+            status = "index-only"
+        elif entry['expected']:
+            status = f"{entry['expected']} (by design)"
+        else:
+            status = "NEEDS INDEXES"
+        print(f"\n{entry['query']}: {status}")
+        for step in entry['plan']:
+            print(f"    {step}")
+        for kind, steps in entry['issues'].items():
+            for step in steps:
+                marker = '~' if kind == 'by_design' else '!'
+                print(f"  {marker} {kind.replace('_', ' ')}: {step}")
+
+    index_only = sum(1 for entry in report if entry['index_only'])
+    by_design = Counter(entry['expected'] for entry in report if entry['expected'])
+    needs_indexes = [entry['query'] for entry in report if not entry['index_only'] and not entry['expected']]
+    print(f"\n{index_only}/{len(report)} queries use index-only plans")
+    for kind, count in sorted(by_design.items()):
+        print(f"{count}/{len(report)} queries use {kind} plans by design")
+    print(f"{len(needs_indexes)}/{len(report)} queries need indexes")
+
+    if obsolete:
+        # The planner may prefer them and then read the table
+        print("\nObsolete indexes (drop with --apply):")
+        for name in obsolete:
+            print(f"  DROP INDEX {name}")
+
+    if missing:
+        print("\nMissing recommended indexes (create with --apply):")
+        for name, table, columns in missing:
+            print(f"  CREATE INDEX {name} ON {table}({columns})")
+    elif needs_indexes:
+        print(f"\nAll recommended indexes are present, but none serves {', '.join(needs_indexes)}")
+    else:
+        print("\nAll recommended indexes are present")
+
+def apply_indexes(conn, db_type: str):
+    """Create the recommended and drop the obsolete indexes through the schema migrations, then refresh statistics."""
+    version = ensure_schema(conn, db_type)
+    cursor = conn.cursor()
+    cursor.execute("ANALYZE")
+    conn.commit()
+    cursor.close()
+    print(f"Schema at version {version}, statistics refreshed")
+
+def main():
+    """Run the index advisor against the configured database."""
+    parser = argparse.ArgumentParser(description="Report and create indexes for the web API queries")
+    parser.add_argument('--apply', action='store_true', help="create missing indexes and ANALYZE")
+    parser.add_argument('--db', default='history_map.db', help="SQLite database file (when DB_TYPE is not postgresql)")
+    args = parser.parse_args()
+
+    conn = get_db_connection(args.db)
+    # get_db_connection falls back to SQLite when PostgreSQL is unavailable
+    db_type = backend_of(conn)
+
+    try:
+        if args.apply:
+            apply_indexes(conn, db_type)
+        print_report(advise(conn, db_type), missing_indexes(conn, db_type), obsolete_indexes(conn, db_type))
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Database maintenance: planner statistics, WAL checkpoints and space reclamation
+The batch processor runs it after every batch and long-running processes can run it
+on a timer, so query plans and file sizes do not drift between manual interventions.
+
+Usage:
+    python src/database/maintenance.py                      # run once
+    python src/database/maintenance.py --interval 3600      # run every hour
+    python src/database/maintenance.py --enable-incremental-vacuum
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+sys.path.append(os.path.dirname(__file__))
+from data_access import backend_of, get_db_connection
+from migrations import _value
+
+# Seconds between timer runs; 0 disables the timer
+DEFAULT_MAINTENANCE_INTERVAL = 6 * 60 * 60
+
+# Only one maintenance run per process; timer and batch triggers skip while one is active
+_maintenance_lock = threading.Lock()
+
+def get_maintenance_interval() -> int:
+    """Read the timer interval from MAINTENANCE_INTERVAL (seconds, 0 disables)."""
+    try:
+        return max(0, int(os.getenv('MAINTENANCE_INTERVAL', DEFAULT_MAINTENANCE_INTERVAL)))
+    except ValueError:
+        return DEFAULT_MAINTENANCE_INTERVAL
+
+def _format_bytes(size: int) -> str:
+    """Human-readable byte count for the maintenance log."""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def _timed_step(steps: List[Dict], name: str, action: Callable[[], Optional[int]]):
+    """Run one maintenance step, recording its duration and reclaimed bytes."""
+    started = time.perf_counter()
+    try:
+        reclaimed = action()
+        error = None
+    except Exception as e:
+        reclaimed = None
+        error = str(e)
+    elapsed = time.perf_counter() - started
+
+    steps.append({'step': name, 'seconds': elapsed, 'reclaimed_bytes': reclaimed, 'error': error})
+    if error:
+        print(f"   🧹 {name}: failed after {elapsed:.2f}s ({error})")
+    elif reclaimed is None:
+        print(f"   🧹 {name}: {elapsed:.2f}s")
+    else:
+        print(f"   🧹 {name}: {elapsed:.2f}s, reclaimed {_format_bytes(reclaimed)}")
+
+# --- SQLite ---
+def _sqlite_pragma(cursor, pragma: str):
+    """Run a PRAGMA and return the first column of its first row."""
+    cursor.execute(f"PRAGMA {pragma}")
+    rows = cursor.fetchall()
+    return _value(rows[0]) if rows else None
+
+def _sqlite_wal_path(cursor) -> Optional[str]:
+    """Path of the WAL file of the main database, if it is a file database."""
+    cursor.execute("PRAGMA database_list")
+    for row in cursor.fetchall():
+        if _value(row, 1) == 'main' and _value(row, 2):
+            return _value(row, 2) + '-wal'
+    return None
+
+def _file_size(path: Optional[str]) -> int:
+    """Size of a file in bytes, 0 when it does not exist."""
+    if path and os.path.exists(path):
+        return os.path.getsize(path)
+    return 0
+
+def maintain_sqlite(conn, full_analyze: bool = False) -> List[Dict]:
+    """Refresh statistics, checkpoint the WAL and release free pages of a SQLite database."""
+    cursor = conn.cursor()
+    steps = []
+    page_size = _sqlite_pragma(cursor, "page_size")
+
+    def analyze():
+        # After bulk loads every table changed, so rebuild all statistics; otherwise let
+        # PRAGMA optimize decide which tables are stale
+        if full_analyze:
+            cursor.execute("ANALYZE")
+        else:
+            cursor.execute("PRAGMA optimize")
+            cursor.fetchall()
+        conn.commit()
+        return None
+
+    def checkpoint():
+        if str(_sqlite_pragma(cursor, "journal_mode")).lower() != 'wal':
+            return 0
+        wal_path = _sqlite_wal_path(cursor)
+        before = _file_size(wal_path)
+        # TRUNCATE resets the WAL to zero bytes once every frame is copied back
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        cursor.fetchall()
+        return before - _file_size(wal_path)
+
+    def incremental_vacuum():
+        free_before = _sqlite_pragma(cursor, "freelist_count")
+        # auto_vacuum 2 = INCREMENTAL; other modes cannot release pages without a full VACUUM
+        if _sqlite_pragma(cursor, "auto_vacuum") != 2:
+            if free_before:
+                print(f"   🧹 incremental vacuum unavailable: {_format_bytes(free_before * page_size)} free "
+                      f"(run with --enable-incremental-vacuum once)")
+            return 0
+        cursor.execute("PRAGMA incremental_vacuum")
+        cursor.fetchall()
+        conn.commit()
+        return (free_before - _sqlite_pragma(cursor, "freelist_count")) * page_size
+
+    _timed_step(steps, "ANALYZE" if full_analyze else "PRAGMA optimize", analyze)
+    # Vacuum before the checkpoint so the pages it writes are folded back and truncated too
+    _timed_step(steps, "incremental vacuum", incremental_vacuum)
+    _timed_step(steps, "WAL checkpoint", checkpoint)
+    cursor.close()
+    return steps
+
+def enable_incremental_vacuum(conn):
+    """Switch a SQLite database to incremental auto-vacuum (rewrites the file once)."""
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.commit()
+    # The new mode only takes effect after a full VACUUM
+    conn.execute("VACUUM")
+    print("SQLite database switched to incremental auto-vacuum")
+
+# --- PostgreSQL ---
+def maintain_postgresql(conn, full_analyze: bool = False) -> List[Dict]:
+    """VACUUM ANALYZE a PostgreSQL database, reporting the change in database size."""
+    steps = []
+    conn.commit()
+    previous_autocommit = conn.autocommit
+    # VACUUM cannot run inside a transaction block
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    def database_size() -> int:
+        cursor.execute("SELECT pg_database_size(current_database())")
+        return int(_value(cursor.fetchone()))
+
+    def vacuum_analyze():
+        before = database_size()
+        cursor.execute("VACUUM ANALYZE")
+        return before - database_size()
+
+    try:
+        _timed_step(steps, "VACUUM ANALYZE", vacuum_analyze)
+    finally:
+        cursor.close()
+        conn.autocommit = previous_autocommit
+    return steps
+
+def run_maintenance(conn, db_type: str, full_analyze: bool = False) -> Optional[List[Dict]]:
+    """
+    Run every maintenance step for the database type.
+    Returns the per-step log, or None when another run in this process is still active.
+    """
+    if not _maintenance_lock.acquire(blocking=False):
+        print("Database maintenance already running, skipping")
+        return None
+
+    try:
+        print(f"Running database maintenance ({db_type})...")
+        started = time.perf_counter()
+        if db_type == 'postgresql':
+            steps = maintain_postgresql(conn, full_analyze)
+        else:
+            steps = maintain_sqlite(conn, full_analyze)
+
+        reclaimed = sum(step['reclaimed_bytes'] or 0 for step in steps)
+        print(f"Database maintenance finished in {time.perf_counter() - started:.2f}s, "
+              f"reclaimed {_format_bytes(reclaimed)}")
+        return steps
+    finally:
+        _maintenance_lock.release()
+
+def maintain_database(connect: Callable, full_analyze: bool = False) -> Optional[List[Dict]]:
+    """Open a connection with the given factory, run maintenance and close it."""
+    try:
+        conn = connect()
+    except Exception as e:
+        print(f"Warning: database maintenance could not connect ({e})")
+        return None
+
+    try:
+        # Connection factories fall back to SQLite when PostgreSQL is unavailable
+        db_type = backend_of(conn)
+        return run_maintenance(conn, db_type, full_analyze)
+    finally:
+        conn.close()
+
+class MaintenanceScheduler:
+    """Runs database maintenance on a daemon timer thread."""
+
+    def __init__(self, connect: Callable, interval: Optional[int] = None):
+        self.connect = connect
+        self.interval = get_maintenance_interval() if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> bool:
+        """Start the timer thread; returns False when the interval disables it."""
+        if self.interval <= 0 or self._thread is not None:
+            return False
+        self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+        self._thread.start()
+        print(f"Database maintenance scheduled every {self.interval}s")
+        return True
+
+    def stop(self):
+        """Stop the timer thread after the current run."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            maintain_database(self.connect)
+
+def main():
+    """Run maintenance once or on a timer against the configured database."""
+    parser = argparse.ArgumentParser(description="Refresh statistics and reclaim space in the database")
+    parser.add_argument('--db', default='history_map.db', help="SQLite database file (when DB_TYPE is not postgresql)")
+    parser.add_argument('--interval', type=int, default=0, help="repeat every N seconds instead of running once")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="switch a SQLite database to incremental auto-vacuum first")
+    args = parser.parse_args()
+
+    def connect():
+        return get_db_connection(args.db)
+
+    if args.enable_incremental_vacuum:
+        conn = connect()
+        if backend_of(conn) == 'sqlite':
+            enable_incremental_vacuum(conn)
+        conn.close()
+
+    maintain_database(connect, full_analyze=True)
+    if args.interval > 0:
+        scheduler = MaintenanceScheduler(connect, args.interval)
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop()
+
+if __name__ == "__main__":
+    main()
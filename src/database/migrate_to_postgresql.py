@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Bulk migration of a SQLite database into PostgreSQL
+Every table is streamed out of SQLite in primary key slices and loaded with parallel
+COPY, keeping the original ids. Secondary indexes and foreign keys are dropped for the
+load and rebuilt afterwards, sequences are moved past the copied ids, and each table
+is verified by row count and an order-independent checksum of its rows.
+
+The PostgreSQL connection is read from DB_HOST, DB_PORT, DB_NAME, DB_USER and
+DB_PASSWORD (or --dsn). Unlike the application connections there is no SQLite fallback.
+
+Usage:
+    python src/database/migrate_to_postgresql.py --db history_map.db
+    python src/database/migrate_to_postgresql.py --db history_map.db --workers 8 --replace
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(__file__))
+from data_access import connect_postgresql
+from migrations import ensure_schema, _column_names, _value
+
+# Tables copied, parents first; schema_version is maintained by the target's own migrations
+MIGRATED_TABLES = [
+    'books', 'locations', 'time_periods', 'mentions', 'book_texts',
+    'job_checkpoints', 'mention_year_rollup',
+]
+
+# Tables with a data row in the target are only overwritten with --replace
+DATA_TABLES = ['books', 'locations', 'mentions']
+
+# Rows per COPY slice; slices of the same table are loaded concurrently
+SLICE_ROWS = 200000
+FETCH_ROWS = 5000
+COPY_BUFFER_SIZE = 1 << 20
+
+def connect_sqlite_readonly(db_file: str):
+    """Open the source database read-only so a running app can keep using it."""
+    return sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+
+# --- COPY text encoding ---
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\b': '\\b', '\f': '\\f', '\v': '\\v',
+})
+
+def _copy_field(value) -> str:
+    """
+    Encode one value in PostgreSQL COPY text format, spelled the way COPY TO prints it
+    so that source and target rows hash identically.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bytes):
+        # bytea hex input; the backslash itself is escaped in COPY text
+        return '\\\\x' + value.hex()
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        text = repr(value)
+        return text[:-2] if text.endswith('.0') else text
+    return str(value).translate(_COPY_ESCAPES)
+
+def _row_hash(line: bytes) -> int:
+    """64-bit hash of one encoded row; table checksums are sums, so row order does not matter."""
+    return int.from_bytes(hashlib.blake2b(line, digest_size=8).digest(), 'little')
+
+class _CopySource:
+    """File-like reader that encodes SQLite rows into COPY text on demand."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.buffer = b''
+        self.rows = 0
+        self.checksum = 0
+        self.done = False
+
+    def _fill(self, size: int):
+        while len(self.buffer) < size and not self.done:
+            rows = self.cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                self.done = True
+                break
+            lines = []
+            for row in rows:
+                line = '\t'.join(_copy_field(value) for value in row).encode('utf-8')
+                self.checksum += _row_hash(line)
+                lines.append(line)
+            self.rows += len(rows)
+            self.buffer += b'\n'.join(lines) + b'\n'
+
+    def read(self, size: int = -1) -> bytes:
+        self._fill(COPY_BUFFER_SIZE if size is None or size < 0 else size)
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+class _CopySink:
+    """File-like writer that checksums the rows PostgreSQL prints with COPY TO."""
+
+    def __init__(self):
+        self.partial = b''
+        self.rows = 0
+        self.checksum = 0
+
+    def write(self, data) -> int:
+        lines = (self.partial + bytes(data)).split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.checksum += _row_hash(line)
+        self.rows += len(lines)
+        return len(data)
+
+# --- Planning ---
+def _slice_condition(key: Optional[str], low, high) -> str:
+    return f" WHERE {key} BETWEEN {low} AND {high}" if low is not None else ""
+
+def plan_slices(source_cursor, table: str, columns: List[str]) -> List[Dict]:
+    """Split a table into primary key ranges of about SLICE_ROWS rows."""
+    source_cursor.execute(f"PRAGMA table_info({table})")
+    # (cid, name, type, notnull, default, pk)
+    primary_key = [row for row in source_cursor.fetchall() if row[5]]
+    primary_key.sort(key=lambda row: row[5])
+    key = primary_key[0][1] if primary_key and 'INT' in (primary_key[0][2] or '').upper() else None
+
+    base = {'table': table, 'columns': columns, 'key': key, 'low': None, 'high': None}
+    if key is None:
+        return [base]
+
+    source_cursor.execute(f"SELECT MIN({key}), MAX({key}), COUNT(*) FROM {table}")
+    low, high, count = source_cursor.fetchone()
+    if not count:
+        return [base]
+
+    slice_count = max(1, math.ceil(count / SLICE_ROWS))
+    width = math.ceil((high - low + 1) / slice_count)
+    return [dict(base, low=start, high=min(start + width - 1, high)) for start in range(low, high + 1, width)]
+
+# --- Workers (run in separate processes) ---
+def copy_slice(db_file: str, dsn: Optional[str], task: Dict) -> Dict:
+    """COPY one primary key range of a table from SQLite into PostgreSQL."""
+    started = time.perf_counter()
+    source = connect_sqlite_readonly(db_file)
+    target = connect_postgresql(dsn)
+    column_list = ', '.join(task['columns'])
+
+    try:
+        cursor = source.cursor()
+        cursor.execute(f"SELECT {column_list} FROM {task['table']}"
+                       + _slice_condition(task['key'], task['low'], task['high']))
+        stream = _CopySource(cursor)
+        with target.cursor() as target_cursor:
+            target_cursor.copy_expert(f"COPY {task['table']} ({column_list}) FROM STDIN", stream, COPY_BUFFER_SIZE)
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+
+    return {'table': task['table'], 'rows': stream.rows, 'checksum': stream.checksum,
+            'seconds': time.perf_counter() - started}
+
+def checksum_slice(dsn: Optional[str], task: Dict) -> Dict:
+    """Read one primary key range back from PostgreSQL and checksum it."""
+    target = connect_postgresql(dsn)
+    sink = _CopySink()
+    try:
+        with target.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY (SELECT {', '.join(task['columns'])} FROM {task['table']}"
+                f"{_slice_condition(task['key'], task['low'], task['high'])}) TO STDOUT", sink, COPY_BUFFER_SIZE)
+    finally:
+        target.close()
+    return {'table': task['table'], 'rows': sink.rows, 'checksum': sink.checksum}
+
+def run_statement(dsn: Optional[str], statement: str) -> float:
+    """Run one DDL statement on its own connection; returns its duration."""
+    started = time.perf_counter()
+    target = connect_postgresql(dsn)
+    try:
+        with target.cursor() as cursor:
+            cursor.execute(statement)
+        target.commit()
+    finally:
+        target.close()
+    return time.perf_counter() - started
+
+# --- Target preparation and restore ---
+def drop_secondary_structures(cursor, tables: List[str]) -> Dict[str, List[str]]:
+    """
+    Drop foreign keys and non-constraint indexes of the tables, returning the statements
+    that recreate them. Primary keys and unique constraints stay so ids are checked.
+    """
+    cursor.execute("""
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype = 'f' AND conrelid::regclass::text = ANY(%s)
+    """, (tables,))
+    foreign_keys = [(_value(row), _value(row, 1), _value(row, 2)) for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = ANY(%s)
+          AND indexname NOT IN (SELECT conname FROM pg_constraint)
+    """, (tables,))
+    indexes = cursor.fetchall()
+
+    for table, name, _ in foreign_keys:
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    for row in indexes:
+        cursor.execute(f"DROP INDEX {_value(row)}")
+    return {
+        'indexes': [_value(row, 1) for row in indexes],
+        'foreign_keys': [f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"
+                         for table, name, definition in foreign_keys],
+    }
+
+def reset_sequences(cursor, tables: List[str]):
+    """Move each serial sequence past the largest copied id."""
+    cursor.execute("""
+        SELECT table_name, pg_get_serial_sequence(table_name, 'id') FROM information_schema.columns
+        WHERE table_schema = current_schema() AND column_name = 'id' AND table_name = ANY(%s)
+    """, (tables,))
+    for row in cursor.fetchall():
+        table, sequence = _value(row), _value(row, 1)
+        if sequence:
+            cursor.execute(f"SELECT setval(%s, COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}", (sequence,))
+
+# --- Driver ---
+def migrate_sqlite_to_postgresql(db_file: str, dsn: Optional[str] = None, workers: int = 4,
+                                 replace: bool = False) -> bool:
+    """Copy every table of a SQLite database into PostgreSQL; returns True when verification passes."""
+    started = time.perf_counter()
+
+    # Both sides must be at the same schema version before their columns are matched
+    source = sqlite3.connect(db_file)
+    ensure_schema(source, 'sqlite')
+    source.close()
+    target = connect_postgresql(dsn)
+    ensure_schema(target, 'postgresql')
+
+    source = connect_sqlite_readonly(db_file)
+    source_cursor = source.cursor()
+    target_cursor = target.cursor()
+
+    for table in DATA_TABLES:
+        target_cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        if _value(target_cursor.fetchone()) and not replace:
+            print(f"❌ Target table '{table}' already has data; rerun with --replace to overwrite it")
+            return False
+
+    tasks = []
+    for table in MIGRATED_TABLES:
+        target_columns = _column_names(target_cursor, 'postgresql', table)
+        columns = [column for column in _column_names(source_cursor, 'sqlite', table) if column in target_columns]
+        tasks += plan_slices(source_cursor, table, columns)
+    source.close()
+
+    print(f"🚚 Migrating {db_file} into PostgreSQL: {len(MIGRATED_TABLES)} tables, {len(tasks)} slices, {workers} workers")
+    target_cursor.execute(f"TRUNCATE {', '.join(MIGRATED_TABLES)}")
+    dropped = drop_secondary_structures(target_cursor, MIGRATED_TABLES)
+    target.commit()
+
+    source_totals = {table: {'rows': 0, 'checksum': 0} for table in MIGRATED_TABLES}
+    target_totals = {table: {'rows': 0, 'checksum': 0} for table in MIGRATED_TABLES}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        load_started = time.perf_counter()
+        try:
+            for result in pool.map(copy_slice, [db_file] * len(tasks), [dsn] * len(tasks), tasks):
+                source_totals[result['table']]['rows'] += result['rows']
+                source_totals[result['table']]['checksum'] += result['checksum']
+        except Exception:
+            # Leave an empty target with its full schema rather than a partial copy
+            print("❌ COPY failed; emptying the target tables and restoring their indexes")
+            target_cursor.execute(f"TRUNCATE {', '.join(MIGRATED_TABLES)}")
+            target.commit()
+            for statement in dropped['indexes'] + dropped['foreign_keys']:
+                run_statement(dsn, statement)
+            raise
+        print(f"   📥 COPY finished in {time.perf_counter() - load_started:.1f}s "
+              f"({sum(total['rows'] for total in source_totals.values()):,} rows)")
+
+        # Index builds are independent of each other; foreign keys validate against them
+        rebuild_started = time.perf_counter()
+        list(pool.map(run_statement, [dsn] * len(dropped['indexes']), dropped['indexes']))
+        for statement in dropped['foreign_keys']:
+            run_statement(dsn, statement)
+        print(f"   🔨 Rebuilt {len(dropped['indexes'])} indexes and {len(dropped['foreign_keys'])} foreign keys "
+              f"in {time.perf_counter() - rebuild_started:.1f}s")
+
+        reset_sequences(target_cursor, MIGRATED_TABLES)
+        target.commit()
+
+        for result in pool.map(checksum_slice, [dsn] * len(tasks), tasks):
+            target_totals[result['table']]['rows'] += result['rows']
+            target_totals[result['table']]['checksum'] += result['checksum']
+
+    target.autocommit = True
+    target_cursor.execute(f"ANALYZE {', '.join(MIGRATED_TABLES)}")
+    target.close()
+
+    print("   🔍 Verification:")
+    verified = True
+    for table in MIGRATED_TABLES:
+        expected, actual = source_totals[table], target_totals[table]
+        ok = expected == actual
+        verified = verified and ok
+        print(f"      {'✅' if ok else '❌'} {table}: {actual['rows']:,}/{expected['rows']:,} rows, "
+              f"checksum {actual['checksum'] % (1 << 64):016x}"
+              + ("" if ok else f" (expected {expected['checksum'] % (1 << 64):016x})"))
+
+    status = "completed" if verified else "FAILED verification"
+    print(f"{'🎉' if verified else '❌'} Migration {status} in {time.perf_counter() - started:.1f}s")
+    return verified
+
+def main():
+    """Migrate a SQLite database file into the configured PostgreSQL database."""
+    parser = argparse.ArgumentParser(description="Copy a SQLite history map database into PostgreSQL")
+    parser.add_argument('--db', default='history_map.db', help="source SQLite database file")
+    parser.add_argument('--dsn', help="PostgreSQL connection string (default: DB_* environment variables)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="parallel COPY connections")
+    parser.add_argument('--replace', action='store_true', help="overwrite a target that already has data")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"SQLite database '{args.db}' not found")
+    sys.exit(0 if migrate_sqlite_to_postgresql(args.db, args.dsn, max(1, args.workers), args.replace) else 1)
+
+if __name__ == "__main__":
+    main()
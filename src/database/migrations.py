@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Numbered schema migrations for SQLite and PostgreSQL
+Every schema change is a numbered migration recorded in the schema_version table,
+so startup only has to read the current version instead of inspecting every table.
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from data_access import WRITE_MARKER_TABLE, mark_write
+from timeline import rebuild_timeline_rollup
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+# Arbitrary constant used as the PostgreSQL advisory lock key while migrating
+MIGRATION_LOCK_ID = 72873001
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    apply: Callable  # apply(cursor, db_type)
+
+# --- Helpers ---
+def _value(row, index: int = 0):
+    """Read a column by position from tuple, sqlite3.Row or RealDictCursor rows."""
+    if isinstance(row, dict):
+        return list(row.values())[index]
+    return row[index]
+
+def _table_exists(cursor, db_type: str, table: str) -> bool:
+    """Check whether a table exists."""
+    if db_type == 'postgresql':
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    else:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return bool(_value(cursor.fetchone()))
+
+def _column_names(cursor, db_type: str, table: str) -> List[str]:
+    """List the columns of a table (empty if the table does not exist)."""
+    if db_type == 'postgresql':
+        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table,))
+        return [_value(row) for row in cursor.fetchall()]
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [_value(row, 1) for row in cursor.fetchall()]
+
+def add_column_if_missing(cursor, db_type: str, table: str, column: str, definition: str):
+    """Add a column unless it already exists (databases created before schema versioning)."""
+    if db_type == 'postgresql':
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+    elif column not in _column_names(cursor, db_type, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def create_indexes(cursor, indexes: List[tuple]):
+    """Create (name, table, columns) indexes if they don't exist."""
+    for name, table, columns in indexes:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+# --- Migrations ---
+def migration_001_core_tables(cursor, db_type: str):
+    """Books, locations and mentions as written by the batch processor."""
+    if db_type == 'postgresql':
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id SERIAL PRIMARY KEY,
+                title VARCHAR(500) NOT NULL,
+                author VARCHAR(200),
+                gutenberg_url TEXT UNIQUE,
+                url TEXT,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                release_date TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS locations (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(200) NOT NULL UNIQUE,
+                latitude DOUBLE PRECISION NOT NULL,
+                longitude DOUBLE PRECISION NOT NULL,
+                country_code VARCHAR(10),
+                population INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS mentions (
+                id SERIAL PRIMARY KEY,
+                book_id INTEGER REFERENCES books (id),
+                location_id INTEGER REFERENCES locations (id),
+                text_position INTEGER,
+                context TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        book_columns = _column_names(cursor, db_type, 'books')
+    else:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                author TEXT,
+                gutenberg_url TEXT UNIQUE,
+                url TEXT,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                release_date TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS locations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                country_code TEXT,
+                population INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS mentions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                book_id INTEGER,
+                location_id INTEGER,
+                text_position INTEGER,
+                context TEXT,
+                FOREIGN KEY (book_id) REFERENCES books (id),
+                FOREIGN KEY (location_id) REFERENCES locations (id)
+            )
+        ''')
+        book_columns = _column_names(cursor, db_type, 'books')
+        _rebuild_sqlite_mentions_with_id(cursor)
+
+    # Databases created by database_integration.py predate these columns
+    if 'gutenberg_url' not in book_columns:
+        cursor.execute("ALTER TABLE books ADD COLUMN gutenberg_url TEXT")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_books_gutenberg_url_unique ON books(gutenberg_url)")
+    add_column_if_missing(cursor, db_type, 'books', 'author', 'TEXT')
+    add_column_if_missing(cursor, db_type, 'books', 'url', 'TEXT')
+    add_column_if_missing(cursor, db_type, 'books', 'processed_at', 'TIMESTAMP')
+    add_column_if_missing(cursor, db_type, 'books', 'release_date', 'TEXT')
+    add_column_if_missing(cursor, db_type, 'locations', 'country_code', 'TEXT')
+    add_column_if_missing(cursor, db_type, 'locations', 'population', 'INTEGER')
+
+def _rebuild_sqlite_mentions_with_id(cursor):
+    """Give legacy (book_id, location_id)-keyed SQLite mentions tables an id column."""
+    cursor.execute("PRAGMA table_info(mentions)")
+    columns = [(_value(row, 1), _value(row, 2)) for row in cursor.fetchall()]
+    if any(name == 'id' for name, _ in columns):
+        return
+
+    print("Rebuilding legacy mentions table with an id column...")
+    column_names = ", ".join(name for name, _ in columns)
+    column_definitions = ",\n".join(f"{name} {col_type}" for name, col_type in columns)
+    cursor.execute(f'''
+        CREATE TABLE mentions_migrated (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {column_definitions},
+            FOREIGN KEY (book_id) REFERENCES books (id),
+            FOREIGN KEY (location_id) REFERENCES locations (id)
+        )
+    ''')
+    cursor.execute(f"INSERT INTO mentions_migrated ({column_names}) SELECT {column_names} FROM mentions")
+    cursor.execute("DROP TABLE mentions")
+    cursor.execute("ALTER TABLE mentions_migrated RENAME TO mentions")
+
+def migration_002_time_periods(cursor, db_type: str):
+    """Time period columns, the time_periods reference table and time-based indexes."""
+    add_column_if_missing(cursor, db_type, 'books', 'publication_year', 'INTEGER')
+    add_column_if_missing(cursor, db_type, 'books', 'historical_start_year', 'INTEGER')
+    add_column_if_missing(cursor, db_type, 'books', 'historical_end_year', 'INTEGER')
+    add_column_if_missing(cursor, db_type, 'books', 'time_period_description', 'TEXT')
+    add_column_if_missing(cursor, db_type, 'locations', 'first_mentioned_year', 'INTEGER')
+    add_column_if_missing(cursor, db_type, 'locations', 'period_of_significance', 'TEXT')
+    add_column_if_missing(cursor, db_type, 'mentions', 'estimated_year', 'INTEGER')
+    add_column_if_missing(cursor, db_type, 'mentions', 'time_context', 'TEXT')
+
+    id_column = 'id SERIAL PRIMARY KEY' if db_type == 'postgresql' else 'id INTEGER PRIMARY KEY AUTOINCREMENT'
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS time_periods (
+            {id_column},
+            name TEXT NOT NULL UNIQUE,
+            start_year INTEGER,
+            end_year INTEGER,
+            description TEXT,
+            region TEXT
+        )
+    """)
+
+    # Common historical periods
+    periods = [
+        ("Early Middle Ages", 500, 1000, "Migration period, Carolingian Empire", "Europe"),
+        ("High Middle Ages", 1000, 1300, "Crusades, rise of cities, Gothic architecture", "Europe"),
+        ("Late Middle Ages", 1300, 1500, "Black Death, Hundred Years War, Renaissance begins", "Europe"),
+        ("Early Modern Period", 1500, 1800, "Age of Discovery, Reformation, Enlightenment", "Europe"),
+        ("Roman Empire", -27, 476, "Classical Roman civilization", "Mediterranean"),
+        ("Byzantine Empire", 330, 1453, "Eastern Roman Empire", "Eastern Mediterranean"),
+        ("Islamic Golden Age", 750, 1258, "Abbasid Caliphate, scientific advances", "Middle East"),
+        ("Viking Age", 793, 1066, "Norse exploration and raids", "Northern Europe"),
+        ("Crusader States", 1098, 1291, "Christian kingdoms in the Levant", "Middle East"),
+        ("Holy Roman Empire", 800, 1806, "Medieval and early modern German empire", "Central Europe")
+    ]
+    if db_type == 'postgresql':
+        cursor.executemany("""
+            INSERT INTO time_periods (name, start_year, end_year, description, region)
+            VALUES (%s, %s, %s, %s, %s) ON CONFLICT (name) DO NOTHING
+        """, periods)
+    else:
+        cursor.executemany("""
+            INSERT OR IGNORE INTO time_periods (name, start_year, end_year, description, region)
+            VALUES (?, ?, ?, ?, ?)
+        """, periods)
+
+    create_indexes(cursor, [
+        ('idx_books_publication_year', 'books', 'publication_year'),
+        ('idx_books_historical_start', 'books', 'historical_start_year'),
+        ('idx_books_historical_end', 'books', 'historical_end_year'),
+        ('idx_mentions_estimated_year', 'mentions', 'estimated_year'),
+    ])
+
+def migration_003_compressed_contexts(cursor, db_type: str):
+    """Mention lengths and compressed book texts for CONTEXT_STORAGE=compressed."""
+    add_column_if_missing(cursor, db_type, 'mentions', 'mention_length', 'INTEGER')
+
+    data_type = 'BYTEA' if db_type == 'postgresql' else 'BLOB'
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS book_texts (
+            book_id INTEGER NOT NULL REFERENCES books (id),
+            chunk_index INTEGER NOT NULL,
+            data {data_type} NOT NULL,
+            PRIMARY KEY (book_id, chunk_index)
+        )
+    ''')
+
+def migration_004_performance_indexes(cursor, db_type: str):
+    """Single-column indexes previously created ad hoc by setup and optimize functions."""
+    create_indexes(cursor, [
+        ('idx_books_title', 'books', 'title'),
+        ('idx_books_gutenberg_url', 'books', 'gutenberg_url'),
+        ('idx_locations_name', 'locations', 'name'),
+        ('idx_mentions_book_id', 'mentions', 'book_id'),
+        ('idx_mentions_location_id', 'mentions', 'location_id'),
+        ('idx_mentions_position', 'mentions', 'text_position'),
+    ])
+
+# Composite and covering indexes shaped after the API queries (see index_advisor.py)
+API_COVERING_INDEXES = [
+    # Location -> books joins (books_by_location, referenced-location listings)
+    ('idx_mentions_location_book_position', 'mentions', 'location_id, book_id, text_position'),
+    # Mention listings for one location, already in text_position order; includes the
+    # context payload (NULL in compressed context mode, so the index stays small there)
+    ('idx_mentions_location_payload', 'mentions', 'location_id, text_position, book_id, mention_length, context'),
+    # Year queries drive from books into mentions
+    ('idx_mentions_book_location', 'mentions', 'book_id, location_id'),
+    ('idx_books_year_range', 'books', 'historical_start_year, historical_end_year, id'),
+    # Mentions are looked up by l.name, so cover the columns the endpoints read
+    ('idx_locations_name_cover', 'locations', 'name, id, latitude, longitude'),
+]
+
+def migration_005_api_covering_indexes(cursor, db_type: str):
+    """Composite and covering indexes for the web API join and year filters."""
+    create_indexes(cursor, API_COVERING_INDEXES)
+    # Duplicates the UNIQUE constraint on locations.name and steers the planner away
+    # from the covering index above
+    cursor.execute("DROP INDEX IF EXISTS idx_locations_name")
+
+def migration_006_job_checkpoints(cursor, db_type: str):
+    """Progress markers that let long-running bulk jobs resume after an interruption."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def migration_007_book_structure(cursor, db_type: str):
+    """Cleaned text length and chapter offsets used to date mentions within a book."""
+    add_column_if_missing(cursor, db_type, 'books', 'text_length', 'INTEGER')
+    add_column_if_missing(cursor, db_type, 'books', 'chapter_offsets', 'TEXT')  # JSON list of offsets
+
+# Mention-granular year filters (mode=mention)
+MENTION_YEAR_INDEXES = [
+    # Map queries: range scan on estimated_year, grouped by location
+    ('idx_mentions_year_location', 'mentions', 'estimated_year, location_id'),
+    # Mention listings for one location filtered by estimated_year; replaces the
+    # payload index of migration 005 with estimated_year added
+    ('idx_mentions_location_year_payload', 'mentions',
+     'location_id, text_position, estimated_year, book_id, mention_length, context'),
+]
+
+# Indexes dropped because a later index covers them
+SUPERSEDED_INDEXES = ['idx_mentions_estimated_year', 'idx_mentions_location_payload']
+
+def migration_008_mention_year_index(cursor, db_type: str):
+    """Composite indexes for filtering mentions by their own estimated year."""
+    create_indexes(cursor, MENTION_YEAR_INDEXES)
+    for name in SUPERSEDED_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+def migration_009_timeline_rollup(cursor, db_type: str):
+    """Per-location decade/century mention counts for the timeline endpoint."""
+    # Clustered on the key in SQLite, so a resolution's cells are one contiguous range
+    suffix = '' if db_type == 'postgresql' else ' WITHOUT ROWID'
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS mention_year_rollup (
+            bucket_size INTEGER NOT NULL,
+            location_id INTEGER NOT NULL REFERENCES locations (id),
+            bucket INTEGER NOT NULL,
+            mention_count INTEGER NOT NULL,
+            PRIMARY KEY (bucket_size, location_id, bucket)
+        ){suffix}
+    ''')
+    rebuild_timeline_rollup(cursor)
+
+# Mention listings for one location filtered by estimated_year: a seek on the year range,
+# then the context is read from the table by rowid. As an index column the context made
+# the index larger than the table itself in inline context mode
+MENTION_LISTING_INDEXES = [
+    ('idx_mentions_location_year', 'mentions', 'location_id, estimated_year, text_position, book_id, mention_length'),
+]
+
+# Listing indexes of migrations 005 and 008 that carried the context payload
+PAYLOAD_INDEXES = ['idx_mentions_location_payload', 'idx_mentions_location_year_payload']
+
+def migration_010_listing_index_without_context(cursor, db_type: str):
+    """Mention listing index keyed without the context payload."""
+    create_indexes(cursor, MENTION_LISTING_INDEXES)
+    for name in PAYLOAD_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+# Same-named places (the Frankfurts) are separate locations; a place is its name and coordinates
+LOCATION_IDENTITY_INDEX = ('idx_locations_identity', 'locations', 'name, latitude, longitude')
+
+def _rebuild_sqlite_locations_without_unique_name(cursor):
+    """Recreate the SQLite locations table without the UNIQUE constraint migration 001 put on name."""
+    cursor.execute("PRAGMA table_info(locations)")
+    columns = [(_value(row, 1), _value(row, 2), _value(row, 3)) for row in cursor.fetchall()]
+    column_names = ", ".join(name for name, _, _ in columns)
+    column_definitions = ",\n".join(
+        "id INTEGER PRIMARY KEY AUTOINCREMENT" if name == 'id' else f"{name} {col_type}{' NOT NULL' if not_null else ''}"
+        for name, col_type, not_null in columns
+    )
+    cursor.execute(f'''
+        CREATE TABLE locations_migrated (
+            {column_definitions}
+        )
+    ''')
+    cursor.execute(f"INSERT INTO locations_migrated ({column_names}) SELECT {column_names} FROM locations")
+    cursor.execute("DROP TABLE locations")
+    cursor.execute("ALTER TABLE locations_migrated RENAME TO locations")
+    # Dropped with the old table
+    create_indexes(cursor, [index for index in API_COVERING_INDEXES if index[1] == 'locations'])
+
+def migration_011_location_identity(cursor, db_type: str):
+    """Locations keyed by name and coordinates instead of by name alone."""
+    if db_type == 'postgresql':
+        cursor.execute("ALTER TABLE locations DROP CONSTRAINT IF EXISTS locations_name_key")
+    else:
+        _rebuild_sqlite_locations_without_unique_name(cursor)
+    name, table, columns = LOCATION_IDENTITY_INDEX
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+# Single-column indexes of migration 004 that are left prefixes of the composite mention
+# indexes; the planner picked them and then read every matching mention row
+PREFIX_INDEXES = ['idx_mentions_book_id', 'idx_mentions_location_id']
+
+# Case-insensitive name search (LOWER(name) equality and prefix ranges), covering the
+# columns the search endpoint returns
+LOCATION_SEARCH_INDEXES = [
+    ('idx_locations_lower_name', 'locations', 'LOWER(name), name, latitude, longitude'),
+]
+
+def migration_012_search_index_and_prefix_drops(cursor, db_type: str):
+    """Expression index for name search; drop the mention indexes the composites start with."""
+    create_indexes(cursor, LOCATION_SEARCH_INDEXES)
+    for name in PREFIX_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+def migration_013_write_marker(cursor, db_type: str):
+    """Write counter the SQLite writers bump, so serving database staleness follows real writes."""
+    time_type = 'DOUBLE PRECISION' if db_type == 'postgresql' else 'REAL'
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {WRITE_MARKER_TABLE} (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            written_at {time_type} NOT NULL
+        )
+    ''')
+    cursor.execute(f"""
+        INSERT INTO {WRITE_MARKER_TABLE} (id, version, written_at)
+        SELECT 1, 0, 0 WHERE NOT EXISTS (SELECT 1 FROM {WRITE_MARKER_TABLE})
+    """)
+
+# Year queries check that a book is complete, so the year range index covers the flag too
+BOOK_STATE_INDEXES = [
+    ('idx_books_year_range_state', 'books', 'historical_start_year, historical_end_year, in_progress, id'),
+]
+
+# Year range index of migration 005 without the in-progress flag
+BOOK_YEAR_INDEXES = ['idx_books_year_range']
+
+def migration_014_book_in_progress(cursor, db_type: str):
+    """Flag for books the batch processor is still writing, hidden from the API and the export."""
+    # NULL for every existing book, which stays visible
+    add_column_if_missing(cursor, db_type, 'books', 'in_progress', 'INTEGER')
+    create_indexes(cursor, BOOK_STATE_INDEXES)
+    for name in BOOK_YEAR_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+MIGRATIONS = [
+    Migration(1, "Core books, locations and mentions tables", migration_001_core_tables),
+    Migration(2, "Time period columns and reference table", migration_002_time_periods),
+    Migration(3, "Compressed mention context storage", migration_003_compressed_contexts),
+    Migration(4, "Performance indexes", migration_004_performance_indexes),
+    Migration(5, "Covering indexes for API queries", migration_005_api_covering_indexes),
+    Migration(6, "Bulk job checkpoints", migration_006_job_checkpoints),
+    Migration(7, "Book text length and chapter offsets", migration_007_book_structure),
+    Migration(8, "Mention year filter index", migration_008_mention_year_index),
+    Migration(9, "Timeline rollup table", migration_009_timeline_rollup),
+    Migration(10, "Mention listing index without context", migration_010_listing_index_without_context),
+    Migration(11, "Locations keyed by name and coordinates", migration_011_location_identity),
+    Migration(12, "Name search index, prefix mention indexes dropped", migration_012_search_index_and_prefix_drops),
+    Migration(13, "Write marker", migration_013_write_marker),
+    Migration(14, "Book in-progress flag", migration_014_book_in_progress),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# Indexes later migrations drop; the index advisor reports any still present
+OBSOLETE_INDEXES = SUPERSEDED_INDEXES + PAYLOAD_INDEXES + PREFIX_INDEXES + BOOK_YEAR_INDEXES
+
+# Indexes the index advisor checks for
+RECOMMENDED_INDEXES = [
+    index for index in (API_COVERING_INDEXES + MENTION_YEAR_INDEXES + MENTION_LISTING_INDEXES
+                        + LOCATION_SEARCH_INDEXES + BOOK_STATE_INDEXES)
+    if index[0] not in OBSOLETE_INDEXES
+]
+
+# --- Engine ---
+def get_schema_version(cursor, db_type: str) -> int:
+    """Read the current schema version (0 for unversioned databases)."""
+    if not _table_exists(cursor, db_type, SCHEMA_VERSION_TABLE):
+        return 0
+    cursor.execute(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")
+    return _value(cursor.fetchone()) or 0
+
+def migrate(conn, db_type: str, target: Optional[int] = None) -> int:
+    """Apply pending migrations up to target (default: latest), one transaction per migration."""
+    target = LATEST_VERSION if target is None else target
+    cursor = conn.cursor()
+    placeholder = '%s' if db_type == 'postgresql' else '?'
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    for migration in MIGRATIONS:
+        if migration.version > target:
+            break
+
+        # Take the write lock before re-reading the version so concurrent workers migrate once
+        if db_type == 'postgresql':
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        else:
+            cursor.execute("BEGIN IMMEDIATE")
+
+        try:
+            if migration.version <= get_schema_version(cursor, db_type):
+                conn.commit()
+                continue
+
+            print(f"Applying migration {migration.version:03d}: {migration.description}")
+            migration.apply(cursor, db_type)
+            cursor.execute(
+                f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) VALUES ({placeholder}, {placeholder})",
+                (migration.version, migration.description)
+            )
+            # Migrations change the schema and may rewrite data, so snapshots must be rebuilt
+            if _table_exists(cursor, db_type, WRITE_MARKER_TABLE):
+                mark_write(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    version = get_schema_version(cursor, db_type)
+    cursor.close()
+    return version
+
+def ensure_schema(conn, db_type: str) -> int:
+    """Bring the schema up to date; a current database costs a single version read."""
+    cursor = conn.cursor()
+    version = get_schema_version(cursor, db_type)
+    cursor.close()
+
+    if version >= LATEST_VERSION:
+        return version
+
+    print(f"Database schema at version {version}, migrating to {LATEST_VERSION}...")
+    return migrate(conn, db_type)
+
+def main():
+    """Apply pending migrations to the configured database."""
+    sys.path.append(os.path.dirname(__file__))
+    from data_access import backend_of, get_db_connection
+
+    conn = get_db_connection()
+    # get_db_connection falls back to SQLite when PostgreSQL is unavailable
+    db_type = backend_of(conn)
+    version = migrate(conn, db_type)
+    conn.close()
+    print(f"Database schema is at version {version} ({db_type})")
+
+if __name__ == "__main__":
+    main()
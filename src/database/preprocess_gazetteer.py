@@ -1,6 +1,20 @@
 import ijson
 import json
 
+def add_to_lookup(lookup, key, record):
+    """File a record under a lookup key; a key shared by several places holds a list of them."""
+    existing = lookup.get(key)
+    if existing is None:
+        lookup[key] = record
+        return
+    
+    places = existing if isinstance(existing, list) else [existing]
+    # The same place listed twice (a variant equal to the primary name, a duplicate feature)
+    identity = (record['name'], record['lat'], record['lon'])
+    if any((place['name'], place['lat'], place['lon']) == identity for place in places):
+        return
+    lookup[key] = places + [record]
+
 def create_lookup_from_whg(whg_filepath, output_filepath):
     """
     Parses a large WHG Linked Places Format (LPF) JSON file and creates
@@ -8,6 +22,9 @@ def create_lookup_from_whg(whg_filepath, output_filepath):
 
     The output format is:
     { "variant_name_lowercase": {"name": "Primary Name", "lat": 12.34, "lon": 56.78} }
+    A name shared by several places maps to a list of their records instead, so the
+    extractor can disambiguate them:
+    { "frankfurt": [{"name": "Frankfurt am Main", ...}, {"name": "Frankfurt (Oder)", ...}] }
     """
     print(f"Starting to process large WHG file: {whg_filepath}")
     lookup = {}
@@ -36,14 +53,14 @@ def create_lookup_from_whg(whg_filepath, output_filepath):
                 record = {"name": primary_name, "lat": lat, "lon": lon}
                 
                 # Add the primary name to the lookup
-                lookup[primary_name.lower()] = record
+                add_to_lookup(lookup, primary_name.lower(), record)
                 
                 # Add all variant names to the lookup
                 names = feature.get('names', [])
                 for name_obj in names:
                     if 'toponym' in name_obj:
                         variant = name_obj['toponym']
-                        lookup[variant.lower()] = record
+                        add_to_lookup(lookup, variant.lower(), record)
                 
                 count += 1
                 if count % 10000 == 0:
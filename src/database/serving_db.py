@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Read-optimized serving database for the web API
+The primary database is laid out for the batch writer. The serving database is a
+separate SQLite file built from it with only the tables and columns the API reads,
+mentions stored in location order, every recommended index, fresh statistics and no
+free pages. It is built under a temporary name and swapped in with os.replace, so web
+workers opening SQLITE_READ_FILE (see data_access.get_read_connection) see either the
+previous build or the new one, never a half-written batch, and never take a lock the
+writer holds.
+
+Usage:
+    python src/database/serving_db.py --db history_map.db --serving history_map.serving.db
+    python src/database/serving_db.py --db history_map.db --serving history_map.serving.db --interval 300
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+sys.path.append(os.path.dirname(__file__))
+from data_access import (DEFAULT_DATABASE_FILE, WRITE_MARKER_TABLE, get_max_read_lag, last_write_time,
+                         snapshot_lag_seconds)
+from migrations import LATEST_VERSION, RECOMMENDED_INDEXES, SCHEMA_VERSION_TABLE
+
+# Seconds between rebuild checks in long-running processes (DB_SNAPSHOT_INTERVAL, 0 disables
+# the timer); unset, it is derived from DB_MAX_READ_LAG so checks come well within the lag allowed
+SERVING_INTERVAL_LAG_FRACTION = 0.5
+
+# Seconds the primary must go without writes before the timer rebuilds (DB_SNAPSHOT_QUIET).
+# During a batch run readers fall back to the primary and the batch processor publishes
+# at the end of the run, instead of the timer rebuilding and vacuuming throughout it
+DEFAULT_SERVING_QUIET_PERIOD = 120
+
+# Larger pages hold more mention contexts per read; set before the first table is created
+SERVING_PAGE_SIZE = 8192
+
+# Only the columns the API queries and the export read, in build order. Books still being
+# written are left out with their mentions and text; in_progress is kept (always NULL)
+# because the queries check it
+SERVING_TABLES = [
+    ('books', '''
+        CREATE TABLE books (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT,
+            url TEXT,
+            historical_start_year INTEGER,
+            historical_end_year INTEGER,
+            in_progress INTEGER
+        )
+    ''', '''
+        INSERT INTO books
+        SELECT id, title, author, url, historical_start_year, historical_end_year, in_progress
+        FROM source.books WHERE in_progress IS NULL ORDER BY id
+    '''),
+    ('locations', '''
+        CREATE TABLE locations (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            country_code TEXT
+        )
+    ''', '''
+        INSERT INTO locations
+        SELECT id, name, latitude, longitude, country_code
+        FROM source.locations ORDER BY id
+    '''),
+    # The rowid is assigned in (location_id, text_position) order, so one location's
+    # mentions sit on adjacent pages and listings read them sequentially
+    ('mentions', '''
+        CREATE TABLE mentions (
+            id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            text_position INTEGER,
+            mention_length INTEGER,
+            estimated_year INTEGER,
+            time_context TEXT,
+            context TEXT
+        )
+    ''', '''
+        INSERT INTO mentions
+        SELECT id, book_id, location_id, text_position, mention_length, estimated_year, time_context, context
+        FROM source.mentions
+        WHERE book_id NOT IN (SELECT id FROM source.books WHERE in_progress IS NOT NULL)
+        ORDER BY location_id, text_position, id
+    '''),
+    # Compressed-mode contexts are sliced from the book text on read
+    ('book_texts', '''
+        CREATE TABLE book_texts (
+            book_id INTEGER NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (book_id, chunk_index)
+        ) WITHOUT ROWID
+    ''', '''
+        INSERT INTO book_texts SELECT book_id, chunk_index, data
+        FROM source.book_texts
+        WHERE book_id NOT IN (SELECT id FROM source.books WHERE in_progress IS NOT NULL)
+        ORDER BY book_id, chunk_index
+    '''),
+    ('mention_year_rollup', '''
+        CREATE TABLE mention_year_rollup (
+            bucket_size INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            mention_count INTEGER NOT NULL,
+            PRIMARY KEY (bucket_size, location_id, bucket)
+        ) WITHOUT ROWID
+    ''', '''
+        INSERT INTO mention_year_rollup SELECT bucket_size, location_id, bucket, mention_count
+        FROM source.mention_year_rollup ORDER BY bucket_size, location_id, bucket
+    '''),
+    # The primary's write marker as of the copy, which the read lag is measured against
+    (WRITE_MARKER_TABLE, f'''
+        CREATE TABLE {WRITE_MARKER_TABLE} (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            written_at REAL NOT NULL
+        )
+    ''', f'''
+        INSERT INTO {WRITE_MARKER_TABLE} SELECT id, version, written_at FROM source.{WRITE_MARKER_TABLE}
+    '''),
+]
+
+# Indexes beyond the primary's own
+SERVING_INDEXES = [
+    # mentions.id is no longer the rowid; the export pages through mentions by id
+    ('idx_mentions_id', 'mentions', 'id'),
+]
+
+# One build per process; the web timer and the batch processor may both trigger one
+_build_lock = threading.Lock()
+
+class ServingDatabaseError(RuntimeError):
+    """The primary database cannot be turned into a serving database."""
+
+def get_serving_interval() -> int:
+    """Read the rebuild check interval from DB_SNAPSHOT_INTERVAL (seconds, 0 disables; default half of DB_MAX_READ_LAG)."""
+    derived = max(1, int(get_max_read_lag() * SERVING_INTERVAL_LAG_FRACTION))
+    try:
+        return max(0, int(os.getenv('DB_SNAPSHOT_INTERVAL', derived)))
+    except ValueError:
+        return derived
+
+def get_serving_quiet_period() -> float:
+    """Read DB_SNAPSHOT_QUIET (seconds without primary writes before the timer rebuilds)."""
+    try:
+        return max(0.0, float(os.getenv('DB_SNAPSHOT_QUIET', DEFAULT_SERVING_QUIET_PERIOD)))
+    except ValueError:
+        return DEFAULT_SERVING_QUIET_PERIOD
+
+def build_serving_database(db_file: str, target_file: str) -> Dict[str, int]:
+    """
+    Build a serving database at target_file from the primary SQLite database.
+    Every table is copied inside one read transaction on the primary, so the build
+    reflects a single committed state even while the batch processor keeps writing.
+    Returns row counts per table.
+    """
+    if os.path.exists(target_file):
+        os.remove(target_file)
+
+    conn = sqlite3.connect(target_file, isolation_level=None)
+    counts = {}
+    try:
+        # A scratch file until it is swapped in: no journal, no fsync while loading
+        conn.execute(f"PRAGMA page_size = {SERVING_PAGE_SIZE}")
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -65536")
+        conn.execute("ATTACH DATABASE ? AS source", (db_file,))
+
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT COUNT(*) FROM source.sqlite_master WHERE type = 'table' AND name = ?",
+                       (SCHEMA_VERSION_TABLE,))
+        version = 0
+        if cursor.fetchone()[0]:
+            cursor.execute(f"SELECT MAX(version) FROM source.{SCHEMA_VERSION_TABLE}")
+            version = cursor.fetchone()[0] or 0
+        if version < LATEST_VERSION:
+            cursor.execute("ROLLBACK")
+            raise ServingDatabaseError(f"{db_file} is at schema version {version}, "
+                                       f"run migrations (version {LATEST_VERSION}) first")
+
+        for table, create_sql, copy_sql in SERVING_TABLES:
+            cursor.execute(create_sql)
+            cursor.execute(copy_sql)
+            counts[table] = cursor.rowcount
+
+        # ensure_schema on the serving file is then a single version read
+        cursor.execute(f"""
+            CREATE TABLE {SCHEMA_VERSION_TABLE} (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute(f"INSERT INTO {SCHEMA_VERSION_TABLE} SELECT * FROM source.{SCHEMA_VERSION_TABLE}")
+
+        # Every index the primary has on the copied tables (the planner's choices were
+        # tuned against them), created after the load so each is built in one sorted pass
+        tables = [table for table, _, _ in SERVING_TABLES]
+        cursor.execute(f"""
+            SELECT sql FROM source.sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({', '.join('?' for _ in tables)})
+        """, tables)
+        primary_indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute("COMMIT")
+        conn.execute("DETACH DATABASE source")
+
+        for sql in primary_indexes:
+            try:
+                conn.execute(sql)
+            except sqlite3.OperationalError:
+                # Indexes on columns the serving database leaves out (e.g. books.gutenberg_url)
+                continue
+        for name, table, columns in RECOMMENDED_INDEXES + SERVING_INDEXES:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+        # Immutable readers cannot use a WAL or rollback journal
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        conn.close()
+    return counts
+
+def publish_serving_database(db_file: str, serving_file: str, force: bool = False) -> bool:
+    """
+    Build a serving database next to serving_file and atomically swap it in.
+    Returns False when the current serving database already reflects every write
+    (or another build in this process is running).
+    """
+    if not force and snapshot_lag_seconds(db_file, serving_file) == 0:
+        return False
+    if not _build_lock.acquire(blocking=False):
+        print("Serving database build already running, skipping")
+        return False
+
+    # Per-process name, so a web worker and the batch processor never share a scratch file
+    temporary = f"{serving_file}.{os.getpid()}.building"
+    try:
+        started = time.perf_counter()
+        # The copy carries the primary's write marker, so writes landing after it leave the result stale
+        counts = build_serving_database(db_file, temporary)
+        os.replace(temporary, serving_file)
+        print(f"📦 Serving database {serving_file} published in {time.perf_counter() - started:.2f}s "
+              f"({counts['mentions']} mentions, {os.path.getsize(serving_file) / (1024 * 1024):.1f} MB)")
+        return True
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        _build_lock.release()
+
+class ServingPublisher:
+    """
+    Republishes the serving database on a daemon timer thread when the primary changed
+    and has since gone quiet_period seconds without writes.
+    """
+
+    def __init__(self, db_file: str = DEFAULT_DATABASE_FILE, serving_file: Optional[str] = None,
+                 interval: Optional[int] = None, quiet_period: Optional[float] = None):
+        self.db_file = db_file
+        self.serving_file = serving_file or os.getenv('SQLITE_READ_FILE')
+        self.interval = get_serving_interval() if interval is None else interval
+        self.quiet_period = get_serving_quiet_period() if quiet_period is None else quiet_period
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> bool:
+        """Start the timer thread; returns False without a serving file or with the timer disabled."""
+        if not self.serving_file or self.interval <= 0 or self._thread is not None:
+            return False
+        self._thread = threading.Thread(target=self._run, name="db-serving", daemon=True)
+        self._thread.start()
+        print(f"Serving database checked for changes every {self.interval}s "
+              f"(rebuilt after {self.quiet_period:.0f}s without writes)")
+        if self.interval >= get_max_read_lag():
+            print(f"Warning: DB_SNAPSHOT_INTERVAL ({self.interval}s) is not below DB_MAX_READ_LAG "
+                  f"({get_max_read_lag():.0f}s); reads will often fall back to the primary")
+        return True
+
+    def stop(self):
+        """Stop the timer thread after the current build."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def publish(self):
+        # The primary is still being written (e.g. a batch run, which publishes when it ends)
+        if time.time() - last_write_time(self.db_file) < self.quiet_period:
+            return
+        try:
+            publish_serving_database(self.db_file, self.serving_file)
+        except Exception as e:
+            print(f"Warning: serving database build failed ({e})")
+
+    def _run(self):
+        # First build right away, so a fresh deployment does not wait a full interval
+        self.publish()
+        while not self._stop.wait(self.interval):
+            self.publish()
+
+def main():
+    """Publish the serving database once or on a timer."""
+    parser = argparse.ArgumentParser(description="Build and publish the read-optimized serving database")
+    parser.add_argument('--db', default=DEFAULT_DATABASE_FILE, help="primary SQLite database file")
+    parser.add_argument('--serving', default=os.getenv('SQLITE_READ_FILE'),
+                        help="serving database file (default: SQLITE_READ_FILE)")
+    parser.add_argument('--force', action='store_true', help="rebuild even if the primary has not changed")
+    parser.add_argument('--interval', type=int, default=0, help="republish every N seconds instead of once")
+    parser.add_argument('--quiet', type=float, default=None,
+                        help="with --interval, only rebuild after N seconds without primary writes (default: DB_SNAPSHOT_QUIET or 120)")
+    args = parser.parse_args()
+
+    if not args.serving:
+        parser.error("--serving or SQLITE_READ_FILE is required")
+
+    try:
+        if not publish_serving_database(args.db, args.serving, args.force):
+            print(f"Serving database {args.serving} is up to date")
+    except ServingDatabaseError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    if args.interval > 0:
+        publisher = ServingPublisher(args.db, args.serving, args.interval, args.quiet)
+        publisher.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            publisher.stop()
+
+if __name__ == "__main__":
+    main()
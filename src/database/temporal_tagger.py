@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Whole-book temporal tagging
+The cleaned book text is scanned once with a single combined pattern, producing a
+sorted array of (offset, kind, value) events. Mentions look up the events around their
+text position with a binary search instead of re-running regexes over their context.
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from typing import Iterable, List, Optional, Tuple
+
+# Characters searched on each side of a mention (the stored context uses 100)
+TEMPORAL_WINDOW = 250
+
+# Characters at the end of the text read so far whose matches wait for the next piece,
+# which may still extend them (tag_pieces)
+PIECE_OVERLAP = 1000
+
+# One alternation in priority order: a year range must win over its two years, and
+# centuries over their leading number. Era markers and period names are matched
+# case-sensitively so running text ("ad hoc", "the next age") is not tagged.
+TEMPORAL_PATTERN = re.compile(r"""
+    \b(?P<range_start>1[0-9]{3}|2[0-9]{3})\s*-\s*(?P<range_end>1[0-9]{3}|2[0-9]{3})\b
+  | \b(?P<century>\d{1,2})(?:st|nd|rd|th)\s+century\b
+  | \b(?P<year>1[0-9]{3}|2[0-9]{3})\b
+  | \b(?P<era>(?-i:BCE?|AD|CE))\b
+  | \b(?:during|in|the)\s+(?P<period>(?-i:[A-Z][a-z]+)\s+(?:period|era|age))\b
+""", re.IGNORECASE | re.VERBOSE)
+
+YEAR = 'year'
+CENTURY = 'century'
+ERA = 'era'
+PERIOD = 'period'
+
+class TemporalEvents:
+    """Sorted temporal events of one text, stored as parallel arrays."""
+
+    def __init__(self):
+        self.offsets = array('q')
+        self.kinds: List[str] = []
+        self.values: List[object] = []
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def add(self, offset: int, kind: str, value):
+        self.offsets.append(offset)
+        self.kinds.append(kind)
+        self.values.append(value)
+
+    def between(self, start: int, end: int) -> range:
+        """Indexes of the events with start <= offset < end."""
+        return range(bisect_left(self.offsets, start), bisect_left(self.offsets, end))
+
+    def nearest(self, position: int, kind: str, start: int, end: int) -> Optional[int]:
+        """Index of the event of a kind closest to position within [start, end)."""
+        best, best_distance = None, None
+        # Walk outwards from the position so the first hit on each side is the closest
+        right = bisect_right(self.offsets, position)
+        for i in range(right - 1, bisect_left(self.offsets, start) - 1, -1):
+            if self.kinds[i] == kind:
+                best, best_distance = i, position - self.offsets[i]
+                break
+        for i in range(right, bisect_left(self.offsets, end)):
+            if self.kinds[i] == kind:
+                if best_distance is None or self.offsets[i] - position < best_distance:
+                    best = i
+                break
+        return best
+
+def _add_match(events: TemporalEvents, match, offset: int = 0):
+    """Add the events of one pattern match found in a text starting at offset."""
+    if match.group('range_start'):
+        events.add(offset + match.start('range_start'), YEAR, int(match.group('range_start')))
+        events.add(offset + match.start('range_end'), YEAR, int(match.group('range_end')))
+    elif match.group('century'):
+        events.add(offset + match.start(), CENTURY, int(match.group('century')))
+    elif match.group('year'):
+        events.add(offset + match.start(), YEAR, int(match.group('year')))
+    elif match.group('era'):
+        events.add(offset + match.start(), ERA, match.group('era').upper())
+    else:
+        events.add(offset + match.start('period'), PERIOD, match.group('period'))
+
+def tag_text(text: str) -> TemporalEvents:
+    """Scan a text once and return its temporal events in offset order."""
+    events = TemporalEvents()
+    for match in TEMPORAL_PATTERN.finditer(text):
+        _add_match(events, match)
+    return events
+
+def tag_pieces(pieces: Iterable[str], overlap: int = PIECE_OVERLAP) -> TemporalEvents:
+    """
+    tag_text over a text given in consecutive pieces, holding about one piece at a time.
+    Matches starting in the last overlap characters read so far are left for the next
+    round; the search then resumes where it stopped, so the events are those of the
+    whole text (as long as no single match is longer than overlap).
+    """
+    events = TemporalEvents()
+    # The buffer holds the text from offset buffer_start; the next search starts at resume
+    buffer, buffer_start, resume = '', 0, 0
+
+    for piece in chain(pieces, [None]):
+        if piece is None:
+            limit = buffer_start + len(buffer)
+        else:
+            buffer += piece
+            limit = buffer_start + len(buffer) - overlap
+            if limit <= resume:
+                continue
+
+        for match in TEMPORAL_PATTERN.finditer(buffer, resume - buffer_start):
+            if buffer_start + match.start() >= limit:
+                break
+            _add_match(events, match, buffer_start)
+            resume = buffer_start + match.end()
+        resume = max(resume, limit)
+
+        # One character before the resume point is kept for the word boundary there
+        keep_from = max(0, resume - 1 - buffer_start)
+        buffer, buffer_start = buffer[keep_from:], buffer_start + keep_from
+
+    return events
+
+def mention_time_context(events: TemporalEvents, position: int, length: int = 0,
+                         window: int = TEMPORAL_WINDOW) -> Tuple[Optional[int], str]:
+    """
+    Estimate the year and describe the dates around one mention.
+    The estimated year is the closest year to the mention; the description lists the
+    distinct years, centuries and named periods in the window in text order.
+    """
+    start, end = position - window, position + length + window
+    years, centuries, periods = [], [], []
+
+    for i in events.between(start, end):
+        kind, value = events.kinds[i], events.values[i]
+        if kind == YEAR and value not in years:
+            years.append(value)
+        elif kind == CENTURY and value not in centuries:
+            centuries.append(value)
+        elif kind == PERIOD and value not in periods:
+            periods.append(value)
+
+    parts = []
+    if years:
+        parts.append(f"Years: {', '.join(str(year) for year in years)}")
+    if centuries:
+        parts.append(f"Centuries: {', '.join(str(century) for century in centuries)}")
+    if periods:
+        parts.append(f"Periods: {', '.join(periods)}")
+
+    nearest = events.nearest(position, YEAR, start, end) if years else None
+    estimated_year = events.values[nearest] if nearest is not None else None
+    return estimated_year, "; ".join(parts)
+
+def tag_mentions(text: str, mentions: Iterable[Tuple[int, int]],
+                 window: int = TEMPORAL_WINDOW) -> List[Tuple[Optional[int], str]]:
+    """Tag a whole book once and return (estimated_year, time_context) per (position, length)."""
+    events = tag_text(text)
+    return [mention_time_context(events, position, length, window) for position, length in mentions]
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Timeline rollup of mention counts per location per decade and century
+The mention_year_rollup table is maintained incrementally by the batch writer (a book
+is added once it is dated, and taken out again before its mentions are deleted) and
+rebuilt after bulk re-dating, so the timeline endpoint never groups the mentions table.
+"""
+
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+
+# Resolution name -> bucket size in years
+TIMELINE_RESOLUTIONS = {'decade': 10, 'century': 100}
+
+def year_bucket(year: int, size: int) -> int:
+    """First year of the bucket containing year (floored, so 1 BCE falls in -10..-1)."""
+    return year - year % size
+
+def _bucket_sql(size: int) -> str:
+    """SQL for year_bucket(estimated_year, size); % truncates toward zero in SQLite and PostgreSQL."""
+    return f"(estimated_year - ((estimated_year % {size}) + {size}) % {size})"
+
+def rebuild_timeline_rollup(cursor):
+    """Recompute the whole rollup from mentions.estimated_year."""
+    cursor.execute("DELETE FROM mention_year_rollup")
+    for size in TIMELINE_RESOLUTIONS.values():
+        cursor.execute(f"""
+            INSERT INTO mention_year_rollup (bucket_size, location_id, bucket, mention_count)
+            SELECT {size}, location_id, {_bucket_sql(size)}, COUNT(*)
+            FROM mentions
+            WHERE estimated_year IS NOT NULL
+            GROUP BY location_id, {_bucket_sql(size)}
+        """)
+
+def remove_book_from_timeline_rollup(cursor, book_id: int, placeholder: str = '?'):
+    """Subtract a book's dated mentions from the rollup counts; call before deleting them."""
+    for size in TIMELINE_RESOLUTIONS.values():
+        cursor.execute(f"""
+            SELECT location_id, {_bucket_sql(size)}, COUNT(*)
+            FROM mentions
+            WHERE book_id = {placeholder} AND estimated_year IS NOT NULL
+            GROUP BY location_id, {_bucket_sql(size)}
+        """, (book_id,))
+        counts = [(row[2], size, row[0], row[1]) for row in cursor.fetchall()]
+        cursor.executemany(f"""
+            UPDATE mention_year_rollup SET mention_count = mention_count - {placeholder}
+            WHERE bucket_size = {placeholder} AND location_id = {placeholder} AND bucket = {placeholder}
+        """, counts)
+    cursor.execute("DELETE FROM mention_year_rollup WHERE mention_count <= 0")
+
+def add_to_timeline_rollup(cursor, mentions: Iterable[Tuple[int, Optional[int]]], placeholder: str = '?'):
+    """Add newly inserted (location_id, estimated_year) mentions to the rollup counts."""
+    counts = Counter()
+    for location_id, year in mentions:
+        if year is None:
+            continue
+        for size in TIMELINE_RESOLUTIONS.values():
+            counts[(size, location_id, year_bucket(year, size))] += 1
+
+    if not counts:
+        return
+
+    cursor.executemany(f"""
+        INSERT INTO mention_year_rollup (bucket_size, location_id, bucket, mention_count)
+        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+        ON CONFLICT (bucket_size, location_id, bucket)
+        DO UPDATE SET mention_count = mention_year_rollup.mention_count + excluded.mention_count
+    """, [(size, location_id, bucket, count) for (size, location_id, bucket), count in counts.items()])
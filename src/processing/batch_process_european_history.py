@@ -2,27 +2,63 @@
 """
 Batch processor for European History books from Project Gutenberg
 Uses the fast in-memory gazetteer for efficient location extraction
+Each book is streamed: the extractor yields mentions chunk by chunk and each chunk's
+rows are committed in a short transaction of their own, so no write transaction stays
+open while the book downloads or goes through NER. A book is flagged in progress
+(books.in_progress = 1), and hidden from the API, the export and the serving database,
+until its final dating update clears the flag; a failed book's partial rows are deleted,
+and so are a previous run's rows when a book is processed again.
 """
 
-import requests
-from bs4 import BeautifulSoup
+from array import array
+import itertools
+import numpy as np
 import time
 import json
-import sqlite3
 import os
 import sys
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 import re
 
 # Add the processing directory to the path to import the fast extractor
 sys.path.append(os.path.dirname(__file__))
-from extract_locations_fast import FastLocationExtractor, LocationMention
+from extract_locations_fast import FastLocationExtractor, MentionBatch, TextChunk
+from bookshelf_scraper import (DEFAULT_STATE_FILE, BookshelfCrawler, book_text_url, get_bookshelves,
+                               get_discovery_pattern)
 
 # Add the database directory to the path to import periodization and database functions
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'database'))
 from enhance_time_periods import extract_time_periods_from_text
-from database_integration import get_db_connection, get_database_type
+from data_access import (backend_of, execute, executemany, get_database_type, get_db_connection,
+                         get_sqlite_connection, mark_write, register_statements)
+from context_store import BookTextWriter, get_context_storage_mode
+from temporal_tagger import tag_mentions
+from dating import chapter_offsets_between, dump_chapter_offsets, estimate_years
+from timeline import add_to_timeline_rollup, remove_book_from_timeline_rollup
+from migrations import ensure_schema
+from maintenance import maintain_database
+from serving_db import publish_serving_database
+
+# Per-mention writes, prepared once per connection on PostgreSQL
+WRITER_STATEMENTS = {
+    'writer_insert_location': """
+        INSERT INTO locations (name, latitude, longitude, country_code, population)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (name, latitude, longitude) DO NOTHING
+    """,
+    'writer_location_id': "SELECT id FROM locations WHERE name = ? AND latitude = ? AND longitude = ?",
+    'writer_insert_mention': """
+        INSERT INTO mentions (book_id, location_id, text_position, context, mention_length, estimated_year, time_context)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    """,
+    'writer_update_mention_year': """
+        UPDATE mentions SET estimated_year = ?
+        WHERE location_id = ? AND book_id = ? AND text_position = ?
+    """,
+}
+register_statements(WRITER_STATEMENTS)
 
 @dataclass
 class BookInfo:
@@ -39,6 +75,7 @@ class EuropeanHistoryBatchProcessor:
         self.books_processed = 0
         self.total_locations = 0
         self.db_type = get_database_type()
+        self.context_storage = get_context_storage_mode()
         
     def initialize_extractor(self):
         """Initialize the fast location extractor."""
@@ -53,93 +90,29 @@ class EuropeanHistoryBatchProcessor:
         return True
     
     def scrape_european_history_books(self) -> List[BookInfo]:
-        """Scrape all books from the European History category across all pages."""
-        base_url = "https://www.gutenberg.org/ebooks/bookshelf/658"
-        print(f"Scraping European History books from: {base_url}")
-        
-        all_books = []
-        page_num = 1
+        """
+        Collect the books of the configured bookshelves (GUTENBERG_BOOKSHELVES, default the
+        European History shelf 658, plus shelves matching GUTENBERG_BOOKSHELF_DISCOVERY).
+        An interrupted crawl resumes from its saved state (CRAWL_STATE_FILE).
+        """
+        print(f"Scraping bookshelves: {', '.join(get_bookshelves())}")
+        crawler = BookshelfCrawler(get_bookshelves(), get_discovery_pattern(),
+                                   os.getenv('CRAWL_STATE_FILE', DEFAULT_STATE_FILE))
         
-        while True:
-            # Construct page URL
-            if page_num == 1:
-                page_url = base_url
-            else:
-                page_url = f"{base_url}?start_index={(page_num-1)*25 + 1}"
-            
-            print(f"\nScraping page {page_num}...")
-            
-            try:
-                response = requests.get(page_url, timeout=30)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Look for book entries in the category page
-                book_entries = soup.find_all(['li', 'div'], class_=lambda x: x and 'book' in x.lower())
-                
-                if not book_entries:
-                    # Fallback: look for any elements containing book links
-                    book_entries = soup.find_all(['li', 'div', 'p'])
-                
-                print(f"Scanning page {page_num} for book links...")
-                
-                page_books = 0
-                
-                for entry in book_entries:
-                    # Look for links that contain book IDs
-                    links = entry.find_all('a', href=True)
-                    
-                    for link in links:
-                        href = link.get('href', '')
-                        
-                        # Check if it's a book link (contains /ebooks/ followed by numbers)
-                        if '/ebooks/' in href and any(char.isdigit() for char in href):
-                            # Extract Gutenberg ID
-                            parts = href.split('/')
-                            if len(parts) >= 3 and parts[-1].isdigit():
-                                gutenberg_id = parts[-1]
-                                
-                                # No need to parse titles from HTML anymore - we'll get them from text files
-                                
-                                # Create book info with minimal data from category page
-                                # We'll get the real title and release date from the text file later
-                                book = BookInfo(
-                                    title="",  # Will be extracted from text file
-                                    author="",  # Empty string for author
-                                    url=f"https://www.gutenberg.org/cache/epub/{gutenberg_id}/pg{gutenberg_id}.txt",
-                                    gutenberg_id=gutenberg_id,
-                                    release_date=""  # Will be extracted from text file
-                                )
-                                
-                                # Avoid duplicates across all pages
-                                if not any(b.gutenberg_id == gutenberg_id for b in all_books):
-                                    all_books.append(book)
-                                    page_books += 1
-                                    print(f"  Found book ID: {gutenberg_id}")
-                
-                print(f"Page {page_num}: Found {page_books} new books")
-                
-                # Check if this page had any books
-                if page_books == 0:
-                    print(f"No more books found on page {page_num}. Stopping pagination.")
-                    break
-                
-                # Check if there's a next page link
-                next_page_link = soup.find('a', string=lambda x: x and 'next' in x.lower())
-                if not next_page_link:
-                    print("No next page link found. Reached end of category.")
-                    break
-                
-                page_num += 1
-                
-                # Small delay between pages to be respectful
-                time.sleep(2)
-                
-            except Exception as e:
-                print(f"Error scraping page {page_num}: {e}")
-                break
+        # Create book info with minimal data from the bookshelf pages
+        # We'll get the real title and release date from the text file later
+        all_books = [
+            BookInfo(
+                title="",  # Will be extracted from text file
+                author="",  # Empty string for author
+                url=book_text_url(gutenberg_id),
+                gutenberg_id=gutenberg_id,
+                release_date=""  # Will be extracted from text file
+            )
+            for gutenberg_id in crawler.crawl()
+        ]
         
-        print(f"\nSuccessfully parsed {len(all_books)} total books from all pages of European History category")
+        print(f"\nSuccessfully parsed {len(all_books)} total books from all pages of the bookshelves")
         return all_books
     
     def extract_book_metadata_from_text(self, book: BookInfo) -> tuple[str, str]:
@@ -147,10 +120,8 @@ class EuropeanHistoryBatchProcessor:
         try:
             print(f"  Extracting metadata from text file for book {book.gutenberg_id}...")
             
-            # Download the text file
-            response = requests.get(book.url, timeout=30)
-            response.raise_for_status()
-            text_content = response.text
+            # Only the header of the text file; the book itself is streamed later
+            text_content = self.extractor.read_book_header(book.url)
             
             # Extract title (look for "Title:" marker)
             title = ""
@@ -187,191 +158,165 @@ class EuropeanHistoryBatchProcessor:
     
     def setup_sqlite_database(self):
         """Set up SQLite database tables (existing functionality)."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Check if books table exists and what columns it has
-        cursor.execute("PRAGMA table_info(books)")
-        existing_columns = [col[1] for col in cursor.fetchall()]
-        
-        if not existing_columns:
-            # Create books table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE books (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    author TEXT,
-                    gutenberg_url TEXT UNIQUE,
-                    url TEXT,
-                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-        elif 'gutenberg_url' not in existing_columns:
-            # Add gutenberg_url column if it doesn't exist
-            cursor.execute('ALTER TABLE books ADD COLUMN gutenberg_url TEXT UNIQUE')
-        
-        # Check if locations table exists
-        cursor.execute("PRAGMA table_info(locations)")
-        locations_columns = [col[1] for col in cursor.fetchall()]
-        
-        if not locations_columns:
-            # Create locations table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE locations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    latitude REAL NOT NULL,
-                    longitude REAL NOT NULL,
-                    country_code TEXT,
-                    population INTEGER
-                )
-            ''')
-        elif 'country_code' not in locations_columns:
-            # Add missing columns if they don't exist
-            cursor.execute('ALTER TABLE locations ADD COLUMN country_code TEXT')
-            cursor.execute('ALTER TABLE locations ADD COLUMN population INTEGER')
-        
-        # Check if mentions table exists
-        cursor.execute("PRAGMA table_info(mentions)")
-        mentions_columns = [col[1] for col in cursor.fetchall()]
-        
-        if not mentions_columns:
-            # Create mentions table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE mentions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    book_id INTEGER,
-                    location_id INTEGER,
-                    text_position INTEGER,
-                    context TEXT,
-                    estimated_year INTEGER,
-                    time_context TEXT,
-                    FOREIGN KEY (book_id) REFERENCES books (id),
-                    FOREIGN KEY (location_id) REFERENCES locations (id)
-                )
-            ''')
-        elif 'time_context' not in mentions_columns:
-            # Add time_context column if it doesn't exist
-            cursor.execute('ALTER TABLE mentions ADD COLUMN time_context TEXT')
-        
-        # Check if books table has time period columns
-        if 'historical_start_year' not in existing_columns:
-            cursor.execute('ALTER TABLE books ADD COLUMN historical_start_year INTEGER')
-        if 'historical_end_year' not in existing_columns:
-            cursor.execute('ALTER TABLE books ADD COLUMN historical_end_year INTEGER')
-        if 'time_period_description' not in existing_columns:
-            cursor.execute('ALTER TABLE books ADD COLUMN time_period_description TEXT')
-        
-        # Check if books table has release_date column
-        if 'release_date' not in existing_columns:
-            cursor.execute('ALTER TABLE books ADD COLUMN release_date TEXT')
-        
-        conn.commit()
+        conn = get_sqlite_connection(self.db_path)
+        version = ensure_schema(conn, 'sqlite')
         conn.close()
-        print("SQLite database setup completed")
+        print(f"SQLite database setup completed (schema version {version})")
     
     def setup_postgresql_database(self):
         """Set up PostgreSQL database tables."""
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Check if books table exists and what columns it has
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns 
-                WHERE table_name = 'books'
-            """)
-            existing_columns = [col[0] for col in cursor.fetchall()]
-            
-            if not existing_columns:
-                # Create books table if it doesn't exist
-                cursor.execute('''
-                    CREATE TABLE books (
-                        id SERIAL PRIMARY KEY,
-                        title VARCHAR(500) NOT NULL,
-                        author VARCHAR(200),
-                        gutenberg_url TEXT UNIQUE,
-                        url TEXT,
-                        processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        release_date DATE,
-                        historical_start_year INTEGER,
-                        historical_end_year INTEGER,
-                        time_period_description TEXT
-                    )
-                ''')
-            
-            # Check if locations table exists
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns 
-                WHERE table_name = 'locations'
-            """)
-            locations_columns = [col[0] for col in cursor.fetchall()]
-            
-            if not locations_columns:
-                # Create locations table if it doesn't exist
-                cursor.execute('''
-                    CREATE TABLE locations (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(200) NOT NULL UNIQUE,
-                        latitude DOUBLE PRECISION NOT NULL,
-                        longitude DOUBLE PRECISION NOT NULL,
-                        country_code VARCHAR(10),
-                        population INTEGER
-                    )
-                ''')
-            
-            # Check if mentions table exists
-            cursor.execute("""
-                SELECT column_name FROM information_schema.columns 
-                WHERE table_name = 'mentions'
-            """)
-            mentions_columns = [col[0] for col in cursor.fetchall()]
-            
-            if not mentions_columns:
-                # Create mentions table if it doesn't exist
-                cursor.execute('''
-                    CREATE TABLE mentions (
-                        id SERIAL PRIMARY KEY,
-                        book_id INTEGER,
-                        location_id INTEGER,
-                        text_position INTEGER,
-                        context TEXT,
-                        estimated_year INTEGER,
-                        time_context TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (book_id) REFERENCES books (id),
-                        FOREIGN KEY (location_id) REFERENCES locations (id)
-                    )
-                ''')
-            
-            # Create indexes for better performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_title ON books(title)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_books_gutenberg_url ON books(gutenberg_url)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_locations_name ON locations(name)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_mentions_book_id ON mentions(book_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_mentions_location_id ON mentions(location_id)')
+            conn = get_db_connection(self.db_path)
+            if backend_of(conn) == 'sqlite':
+                # get_db_connection already fell back to SQLite
+                conn.close()
+                self.db_type = 'sqlite'
+                self.setup_sqlite_database()
+                return
             
-            conn.commit()
-            cursor.close()
+            version = ensure_schema(conn, 'postgresql')
             conn.close()
-            print("PostgreSQL database setup completed")
+            print(f"PostgreSQL database setup completed (schema version {version})")
             
         except Exception as e:
             print(f"Warning: PostgreSQL setup failed ({e}), falling back to SQLite")
             self.db_type = 'sqlite'
             self.setup_sqlite_database()
     
-    def save_book_to_db(self, book: BookInfo, location_mentions: List[LocationMention]) -> int:
-        """Save book and location mentions to database using normalized schema."""
+    def delete_book_rows(self, cursor, book_id: int, placeholder: str = '?', keep_book: bool = True):
+        """Delete a book's mentions and stored text (and its row unless keep_book), keeping the rollup in step."""
+        remove_book_from_timeline_rollup(cursor, book_id, placeholder)
+        cursor.execute(f"DELETE FROM mentions WHERE book_id = {placeholder}", (book_id,))
+        cursor.execute(f"DELETE FROM book_texts WHERE book_id = {placeholder}", (book_id,))
+        if not keep_book:
+            cursor.execute(f"DELETE FROM books WHERE id = {placeholder}", (book_id,))
+    
+    def clear_previous_run(self, cursor, gutenberg_url: str, placeholder: str = '?'):
+        """Delete the rows an earlier run left for a book, complete or cut short, before it is written again."""
+        cursor.execute(f"SELECT id FROM books WHERE gutenberg_url = {placeholder}", (gutenberg_url,))
+        row = cursor.fetchone()
+        if row is not None:
+            self.delete_book_rows(cursor, row[0], placeholder)
+    
+    def save_mention_batches(self, conn, cursor, book_id: int, batches: Iterable[Tuple[TextChunk, MentionBatch]],
+                             start_year: Optional[int] = None, end_year: Optional[int] = None,
+                             placeholder: str = '?') -> int:
+        """
+        Write a book's mentions as the extractor yields them, then date them.
+        Each batch is time-tagged on its chunk's text (which covers the tagger's window
+        around every mention), inserted without a year and committed, so locks are held
+        for one chunk's rows at a time. Once the whole text has passed, its length and
+        chapters spread the book's range over the mentions, combined with their explicit
+        years; the years, the text length, the cleared in-progress flag and the rollup
+        counts are written together and left for the caller to commit. Returns the
+        number of mentions. Rows are built straight from the batch columns; each distinct
+        place is looked up once per book.
+        """
+        store_compressed = self.context_storage == 'compressed'
+        # In compressed mode the book text is stored once and mentions keep only offsets
+        text_writer = BookTextWriter(cursor, book_id, placeholder) if store_compressed else None
+        
+        # Per-mention keys and explicit years, kept as compact arrays for dating the book at the end
+        positions, location_ids, explicit_years = array('q'), array('q'), array('d')
+        chapter_offsets = []
+        text_length = 0
+        # Location ID per place (name and coordinates, so same-named places stay apart);
+        # locations are committed with the chunk that first needs them and never deleted
+        known_locations = {}
+        
+        for chunk, mentions in batches:
+            text_length = chunk.own_end
+            chapter_offsets.extend(chapter_offsets_between(chunk.text, chunk.own_start, chunk.own_end, chunk.text_start))
+            if text_writer:
+                text_writer.write(chunk.own_text)
+            
+            # Location IDs of the batch's distinct places, by record index
+            record_location_ids = []
+            for record in mentions.records:
+                place = (record['name'], record['lat'], record['lon'])
+                location_id = known_locations.get(place)
+                if location_id is None:
+                    # First, ensure the location exists in the locations table
+                    execute(cursor, 'writer_insert_location', place + (record.get('country', ''), record.get('pop', 0)))
+                    
+                    # Get the location ID
+                    execute(cursor, 'writer_location_id', place)
+                    location_id = known_locations[place] = cursor.fetchone()[0]
+                record_location_ids.append(location_id)
+            
+            lengths = [len(surface) for surface in mentions.surfaces]
+            mention_lengths = [lengths[index] for index in mentions.surface_index]
+            batch_location_ids = [record_location_ids[index] for index in mentions.record_index]
+            times = tag_mentions(chunk.text, [(position - chunk.text_start, length)
+                                              for position, length in zip(mentions.positions, mention_lengths)])
+            contexts = [None] * len(mentions) if store_compressed else map(mentions.context, range(len(mentions)))
+            # Years are written once the whole book is dated, so a rollup rebuilt meanwhile skips them
+            mention_rows = [
+                (book_id, location_id, position, context, length, None, time_context)
+                for location_id, position, context, length, (_, time_context)
+                in zip(batch_location_ids, mentions.positions, contexts, mention_lengths, times)
+            ]
+            
+            # Insert the chunk's mentions with time context in one batch, in a transaction of their own
+            executemany(cursor, 'writer_insert_mention', mention_rows)
+            mark_write(cursor)
+            conn.commit()
+            positions.extend(mentions.positions)
+            location_ids.extend(batch_location_ids)
+            explicit_years.extend(float('nan') if explicit_year is None else explicit_year for explicit_year, _ in times)
+        
+        if text_writer:
+            text_writer.close()
+        
+        # Text length and chapter offsets let mentions be dated within the book; clearing the
+        # flag publishes the book with the years below, in the same transaction
+        cursor.execute(f"UPDATE books SET text_length = {placeholder}, chapter_offsets = {placeholder}, in_progress = NULL "
+                       f"WHERE id = {placeholder}",
+                       (text_length, dump_chapter_offsets(chapter_offsets), book_id))
+        
+        # Combine explicit dates with the book's range interpolated over its chapters
+        estimated = estimate_years(positions, explicit_years, text_length, chapter_offsets, start_year, end_year)
+        dated = ~np.isnan(estimated)
+        location_array = np.frombuffer(location_ids, dtype=np.int64)
+        executemany(cursor, 'writer_update_mention_year', zip(
+            estimated[dated].astype(np.int64).tolist(), location_array[dated].tolist(),
+            itertools.repeat(book_id), np.frombuffer(positions, dtype=np.int64)[dated].tolist()
+        ))
+        
+        # Keep the timeline rollup in step with the new mentions
+        add_to_timeline_rollup(cursor, zip(location_array[dated].tolist(), estimated[dated].astype(np.int64).tolist()),
+                               placeholder=placeholder)
+        mark_write(cursor)
+        return len(positions)
+    
+    def discard_partial_book(self, conn, cursor, book_id: Optional[int], placeholder: str = '?'):
+        """Delete what a failed book committed chunk by chunk, so no partial book is left behind."""
+        if book_id is None:
+            return
+        try:
+            self.delete_book_rows(cursor, book_id, placeholder, keep_book=False)
+            mark_write(cursor)
+            conn.commit()
+            print(f"   Partial rows of book {book_id} deleted")
+        except Exception as e:
+            conn.rollback()
+            print(f"   Warning: could not delete partial rows of book {book_id} ({e}); "
+                  f"they are replaced when the book is processed again")
+    
+    def save_book_to_db(self, book: BookInfo,
+                        batches: Iterable[Tuple[TextChunk, MentionBatch]]) -> Optional[Tuple[int, int]]:
+        """Save book and its streamed location mentions using normalized schema; returns (book id, mention count)."""
         if self.db_type == 'postgresql':
-            return self.save_book_to_postgresql(book, location_mentions)
+            return self.save_book_to_postgresql(book, batches)
         else:
-            return self.save_book_to_sqlite(book, location_mentions)
+            return self.save_book_to_sqlite(book, batches)
     
-    def save_book_to_sqlite(self, book: BookInfo, location_mentions: List[LocationMention]) -> int:
+    def save_book_to_sqlite(self, book: BookInfo,
+                            batches: Iterable[Tuple[TextChunk, MentionBatch]]) -> Optional[Tuple[int, int]]:
         """Save book to SQLite database (existing functionality)."""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_sqlite_connection(self.db_path)
         cursor = conn.cursor()
+        book_id = None
         
         try:
             # Extract time periods from book title and description (not full text)
@@ -410,74 +355,53 @@ class EuropeanHistoryBatchProcessor:
             else:
                 print(f"   DEBUG: No time periods found at all")
             
-            # Insert book with time period information
+            # Insert book with time period information, replacing the rows of an earlier run;
+            # it stays flagged in progress until its mentions are dated
+            gutenberg_url = f"https://www.gutenberg.org/ebooks/{book.gutenberg_id}"
+            self.clear_previous_run(cursor, gutenberg_url)
             cursor.execute('''
                 INSERT OR REPLACE INTO books (
                     title, author, gutenberg_url, url, 
-                    historical_start_year, historical_end_year, time_period_description, release_date
+                    historical_start_year, historical_end_year, time_period_description, release_date,
+                    in_progress
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
             ''', (
                 book.title, book.author or "", 
-                f"https://www.gutenberg.org/ebooks/{book.gutenberg_id}", 
+                gutenberg_url, 
                 book.url,
                 historical_start_year, historical_end_year, time_period_description, book.release_date
             ))
             
             book_id = cursor.lastrowid
+            mark_write(cursor)
+            conn.commit()
             
-            # Process each location mention
-            for mention in location_mentions:
-                # First, ensure the location exists in the locations table
-                cursor.execute('''
-                    INSERT OR IGNORE INTO locations (name, latitude, longitude, country_code, population)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (mention.location_name, mention.latitude, mention.longitude, mention.country_code, mention.population))
-                
-                # Get the location ID
-                cursor.execute('SELECT id FROM locations WHERE name = ?', (mention.location_name,))
-                location_id = cursor.fetchone()[0]
-                
-                # Extract time context from the mention context
-                mention_time_info = extract_time_periods_from_text(mention.context)
-                estimated_year = None
-                time_context = ""
-                
-                if mention_time_info.get('year'):
-                    years = [int(y) for y in mention_time_info['year'] if y.isdigit()]
-                    if years:
-                        estimated_year = years[0]  # Use first year mentioned in context
-                        time_context = f"Years: {', '.join(mention_time_info['year'])}"
-                
-                if mention_time_info.get('century'):
-                    if not time_context:
-                        time_context = f"Centuries: {', '.join(mention_time_info['century'])}"
-                    else:
-                        time_context += f"; Centuries: {', '.join(mention_time_info['century'])}"
-                
-                # Insert the mention with time context
-                cursor.execute('''
-                    INSERT INTO mentions (book_id, location_id, text_position, context, estimated_year, time_context)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (book_id, location_id, mention.text_position, mention.context, estimated_year, time_context))
+            # Mentions are written while the book streams through the extractor
+            mention_count = self.save_mention_batches(
+                conn, cursor, book_id, batches, historical_start_year, historical_end_year
+            )
             
             conn.commit()
-            print(f"  ✅ Saved {len(location_mentions)} location mentions to SQLite database")
+            print(f"  ✅ Saved {mention_count} location mentions to SQLite database")
             if time_periods:
                 print(f"   Time periods saved: {time_period_description}")
-            return book_id
+            return book_id, mention_count
             
         except Exception as e:
             print(f"   Error saving to SQLite database: {e}")
             conn.rollback()
+            self.discard_partial_book(conn, cursor, book_id)
             return None
         finally:
             conn.close()
     
-    def save_book_to_postgresql(self, book: BookInfo, location_mentions: List[LocationMention]) -> int:
+    def save_book_to_postgresql(self, book: BookInfo,
+                                batches: Iterable[Tuple[TextChunk, MentionBatch]]) -> Optional[Tuple[int, int]]:
         """Save book to PostgreSQL database."""
+        book_id = None
         try:
-            conn = get_db_connection()
+            conn = get_db_connection(self.db_path)
             cursor = conn.cursor()
             
             # Extract time periods from book title and description (not full text)
@@ -516,13 +440,17 @@ class EuropeanHistoryBatchProcessor:
             else:
                 print(f"   DEBUG: No time periods found at all")
             
-            # Insert book with time period information
+            # Insert book with time period information, replacing the rows of an earlier run;
+            # it stays flagged in progress until its mentions are dated
+            gutenberg_url = f"https://www.gutenberg.org/ebooks/{book.gutenberg_id}"
+            self.clear_previous_run(cursor, gutenberg_url, placeholder='%s')
             cursor.execute('''
                 INSERT INTO books (
                     title, author, gutenberg_url, url, 
-                    historical_start_year, historical_end_year, time_period_description, release_date
+                    historical_start_year, historical_end_year, time_period_description, release_date,
+                    in_progress
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1)
                 ON CONFLICT (gutenberg_url) DO UPDATE SET
                     title = EXCLUDED.title,
                     author = EXCLUDED.author,
@@ -530,11 +458,14 @@ class EuropeanHistoryBatchProcessor:
                     historical_start_year = EXCLUDED.historical_start_year,
                     historical_end_year = EXCLUDED.historical_end_year,
                     time_period_description = EXCLUDED.time_period_description,
-                    release_date = EXCLUDED.release_date
+                    release_date = EXCLUDED.release_date,
+                    text_length = NULL,
+                    chapter_offsets = NULL,
+                    in_progress = 1
                 RETURNING id
             ''', (
                 book.title, book.author or "", 
-                f"https://www.gutenberg.org/ebooks/{book.gutenberg_id}", 
+                gutenberg_url, 
                 book.url,
                 historical_start_year, historical_end_year, time_period_description, book.release_date
             ))
@@ -544,63 +475,26 @@ class EuropeanHistoryBatchProcessor:
                 book_id = result[0]
             else:
                 # Book was already there, get its ID
-                cursor.execute('SELECT id FROM books WHERE gutenberg_url = %s', 
-                             (f"https://www.gutenberg.org/ebooks/{book.gutenberg_id}",))
+                cursor.execute('SELECT id FROM books WHERE gutenberg_url = %s', (gutenberg_url,))
                 book_id = cursor.fetchone()[0]
+            conn.commit()
             
-            # Process each location mention
-            for mention in location_mentions:
-                # First, ensure the location exists in the locations table
-                cursor.execute('''
-                    INSERT INTO locations (name, latitude, longitude, country_code, population)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (name) DO NOTHING
-                ''', (mention.location_name, mention.latitude, mention.longitude, mention.country_code, mention.population))
-                
-                # Get the location ID
-                cursor.execute('SELECT id FROM locations WHERE name = %s', (mention.location_name,))
-                result = cursor.fetchone()
-                if result:
-                    location_id = result[0]
-                else:
-                    # Location was already there, get its ID
-                    cursor.execute('SELECT id FROM locations WHERE name = %s', (mention.location_name,))
-                    location_id = cursor.fetchone()[0]
-                
-                # Extract time context from the mention context
-                mention_time_info = extract_time_periods_from_text(mention.context)
-                estimated_year = None
-                time_context = ""
-                
-                if mention_time_info.get('year'):
-                    years = [int(y) for y in mention_time_info['year'] if y.isdigit()]
-                    if years:
-                        estimated_year = years[0]  # Use first year mentioned in context
-                        time_context = f"Years: {', '.join(mention_time_info['year'])}"
-                
-                if mention_time_info.get('century'):
-                    if not time_context:
-                        time_context = f"Centuries: {', '.join(mention_time_info['century'])}"
-                    else:
-                        time_context += f"; Centuries: {', '.join(mention_time_info['century'])}"
-                
-                # Insert the mention with time context
-                cursor.execute('''
-                    INSERT INTO mentions (book_id, location_id, text_position, context, estimated_year, time_context)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT DO NOTHING
-                ''', (book_id, location_id, mention.text_position, mention.context, estimated_year, time_context))
+            # Mentions are written while the book streams through the extractor
+            mention_count = self.save_mention_batches(
+                conn, cursor, book_id, batches, historical_start_year, historical_end_year, placeholder='%s'
+            )
             
             conn.commit()
-            print(f"  ✅ Saved {len(location_mentions)} location mentions to PostgreSQL database")
+            print(f"  ✅ Saved {mention_count} location mentions to PostgreSQL database")
             if time_periods:
                 print(f"   Time periods saved: {time_period_description}")
-            return book_id
+            return book_id, mention_count
             
         except Exception as e:
             print(f"   Error saving to PostgreSQL database: {e}")
             if conn:
                 conn.rollback()
+                self.discard_partial_book(conn, cursor, book_id, placeholder='%s')
             return None
         finally:
             if conn:
@@ -622,19 +516,13 @@ class EuropeanHistoryBatchProcessor:
             print(f"   Title: {book.title}")
             print(f"   Release Date: {book.release_date}")
             
-            # Download and process book
-            location_mentions = self.extractor.process_book(book.url)
-            
-            if location_mentions is not None:
-                # Save to database with time period information from title/description
-                book_id = self.save_book_to_db(book, location_mentions)
-                if book_id:
-                    self.total_locations += len(location_mentions)
-                    print(f"   Book processed successfully - {len(location_mentions)} locations saved")
-                    return True
-                else:
-                    print(f"   Failed to save to database")
-                    return False
+            # Stream the book through the extractor into the database, with time period information from title/description
+            saved = self.save_book_to_db(book, self.extractor.iter_book_mentions(book.url))
+            if saved:
+                book_id, mention_count = saved
+                self.total_locations += mention_count
+                print(f"   Book processed successfully - {mention_count} locations saved")
+                return True
             else:
                 print(f"   Book processing failed")
                 return False
@@ -675,6 +563,10 @@ class EuropeanHistoryBatchProcessor:
             progress = (batch_end / total_books) * 100
             print(f"   Overall progress: {progress:.1f}% ({self.books_processed}/{total_books})")
             
+            # Refresh planner statistics and reclaim WAL space after each batch load
+            if batch_success:
+                maintain_database(lambda: get_db_connection(self.db_path), full_analyze=True)
+            
             # Continue automatically to next batch
             if batch_end < total_books:
                 print(f"\n⏭ Continuing to next batch automatically...")
@@ -709,6 +601,10 @@ class EuropeanHistoryBatchProcessor:
         # Start processing
         self.process_books_in_batches(books)
         
+        # Hand the finished run to web workers reading the serving database
+        if get_database_type() == 'sqlite' and os.getenv('SQLITE_READ_FILE'):
+            publish_serving_database(self.db_path, os.getenv('SQLITE_READ_FILE'))
+        
         # Final summary
         print(f"\n🎉 Batch processing complete!")
         print(f"   Total books processed: {self.books_processed}")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Resumable crawler for Project Gutenberg bookshelves
+The crawl is a frontier of pages still to fetch: bookshelf pages (followed through
+their "Next" links) and, with discovery on, the bookshelf index. Each page is parsed
+for its <a> tags only, with lxml when it is installed, and book IDs are deduplicated
+in a set. The frontier, the pages done and the books found are saved to a JSON state
+file after every page, so an interrupted crawl resumes at the page where it stopped;
+the file is removed once the crawl completes.
+
+Usage:
+    python src/processing/bookshelf_scraper.py
+    python src/processing/bookshelf_scraper.py --shelves 658 53 --discover "History"
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Pattern
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401 -- only its presence is checked; BeautifulSoup drives it
+    HTML_PARSER = 'lxml'
+except ImportError:  # The standard library parser is slower but needs nothing installed
+    HTML_PARSER = 'html.parser'
+
+GUTENBERG_URL = "https://www.gutenberg.org"
+BOOKSHELF_URL = GUTENBERG_URL + "/ebooks/bookshelf/{shelf_id}"
+# Every bookshelf is linked from here; discovery starts at this page
+BOOKSHELF_INDEX_URL = GUTENBERG_URL + "/ebooks/bookshelf/"
+BOOK_TEXT_URL = GUTENBERG_URL + "/cache/epub/{book_id}/pg{book_id}.txt"
+
+# European History; used when GUTENBERG_BOOKSHELVES is not set
+DEFAULT_BOOKSHELVES = ['658']
+DEFAULT_STATE_FILE = 'bookshelf_crawl.json'
+# Pause between page requests, to be respectful of the site
+PAGE_DELAY_SECONDS = 2
+
+# Link paths on the site; query strings (sort orders, page offsets) are ignored
+BOOK_PATH = re.compile(r'^/ebooks/(\d+)/?$')
+BOOKSHELF_PATH = re.compile(r'^/ebooks/bookshelf/(\d+)/?$')
+
+# Only anchors are built into the parse tree; everything else on the page is skipped
+LINKS_ONLY = SoupStrainer('a', href=True)
+
+INDEX = 'index'
+SHELF = 'shelf'
+
+def get_bookshelves() -> List[str]:
+    """Read the bookshelf IDs to crawl from GUTENBERG_BOOKSHELVES (comma-separated)."""
+    value = os.getenv('GUTENBERG_BOOKSHELVES', '')
+    shelves = [shelf.strip() for shelf in value.split(',') if shelf.strip().isdigit()]
+    return shelves or list(DEFAULT_BOOKSHELVES)
+
+def get_discovery_pattern() -> Optional[str]:
+    """Read the bookshelf-name pattern for discovery from GUTENBERG_BOOKSHELF_DISCOVERY (unset: no discovery)."""
+    return os.getenv('GUTENBERG_BOOKSHELF_DISCOVERY') or None
+
+def book_text_url(book_id: str) -> str:
+    return BOOK_TEXT_URL.format(book_id=book_id)
+
+def parse_page(html: bytes, base_url: str) -> Dict:
+    """
+    Book IDs, bookshelf links ({shelf_id: link text}) and the next page's URL of one page.
+    Only direct book links count: /ebooks/bookshelf/658 is a shelf, not book 658.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=LINKS_ONLY)
+    book_ids = []
+    shelves = {}
+    next_url = None
+    site = urlsplit(GUTENBERG_URL).netloc
+    for link in soup.find_all('a'):
+        url = urljoin(base_url, link['href'])
+        parts = urlsplit(url)
+        if parts.netloc != site:
+            continue
+        book = BOOK_PATH.match(parts.path)
+        if book:
+            book_ids.append(book.group(1))
+            continue
+        text = link.get_text(' ', strip=True)
+        shelf = BOOKSHELF_PATH.match(parts.path)
+        if shelf:
+            shelves.setdefault(shelf.group(1), text)
+        if next_url is None and 'next' in text.lower():
+            next_url = url
+    return {'book_ids': book_ids, 'shelves': shelves, 'next_url': next_url}
+
+class BookshelfCrawler:
+    """Collects the book IDs of Gutenberg bookshelves, resuming from a saved frontier."""
+
+    def __init__(self, shelves: Optional[Iterable[str]] = None, discover: Optional[str] = None,
+                 state_file: str = DEFAULT_STATE_FILE, delay: float = PAGE_DELAY_SECONDS):
+        self.shelves = [str(shelf) for shelf in (shelves or get_bookshelves())]
+        self.discover: Optional[Pattern] = re.compile(discover, re.IGNORECASE) if discover else None
+        self.state_file = state_file
+        self.delay = delay
+        self.session = requests.Session()
+
+        # Pages still to fetch as (kind, url), pages fetched, and books in discovery order
+        self.frontier = deque()
+        self.visited = set()
+        self.book_ids: List[str] = []
+        self._known_books = set()
+        self.shelves_seen = set()
+
+    def _enqueue_shelf(self, shelf_id: str):
+        if shelf_id not in self.shelves_seen:
+            self.shelves_seen.add(shelf_id)
+            self.frontier.append((SHELF, BOOKSHELF_URL.format(shelf_id=shelf_id)))
+
+    def _add_book(self, book_id: str) -> bool:
+        if book_id in self._known_books:
+            return False
+        self._known_books.add(book_id)
+        self.book_ids.append(book_id)
+        return True
+
+    def _settings(self) -> Dict:
+        return {'shelves': self.shelves, 'discover': self.discover.pattern if self.discover else None}
+
+    def load_state(self) -> bool:
+        """Resume from the state file if it belongs to a crawl with the same settings."""
+        try:
+            with open(self.state_file, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get('settings') != self._settings():
+            print(f"Ignoring crawl state in {self.state_file}: it was saved for other bookshelves")
+            return False
+
+        self.frontier = deque(tuple(entry) for entry in state['frontier'])
+        self.visited = set(state['visited'])
+        self.shelves_seen = set(state['shelves_seen'])
+        for book_id in state['book_ids']:
+            self._add_book(book_id)
+        return True
+
+    def save_state(self):
+        """Write the crawl state atomically, so a crash while saving keeps the previous one."""
+        state = {
+            'settings': self._settings(),
+            'frontier': list(self.frontier),
+            'visited': sorted(self.visited),
+            'shelves_seen': sorted(self.shelves_seen),
+            'book_ids': self.book_ids,
+        }
+        temporary = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temporary, self.state_file)
+
+    def crawl_page(self, kind: str, url: str) -> int:
+        """Fetch one page, queue what it links to and return the number of new books."""
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        page = parse_page(response.content, url)
+
+        new_books = sum(1 for book_id in page['book_ids'] if self._add_book(book_id))
+        if self.discover:
+            for shelf_id, name in page['shelves'].items():
+                if self.discover.search(name):
+                    self._enqueue_shelf(shelf_id)
+        # A shelf page without books is past the last page, whatever its links say
+        if kind == SHELF and page['book_ids'] and page['next_url']:
+            if page['next_url'] not in self.visited:
+                self.frontier.append((SHELF, page['next_url']))
+        return new_books
+
+    def crawl(self) -> List[str]:
+        """
+        Crawl until the frontier is empty and return the book IDs in discovery order.
+        On an error the crawl stops with its state saved (the failed page first in the
+        frontier) and the books found so far are returned.
+        """
+        if self.load_state():
+            print(f"Resuming crawl: {len(self.frontier)} pages queued, {len(self.book_ids)} books found")
+        else:
+            for shelf_id in self.shelves:
+                self._enqueue_shelf(shelf_id)
+            if self.discover:
+                self.frontier.append((INDEX, BOOKSHELF_INDEX_URL))
+        print(f"Parsing pages with {HTML_PARSER}")
+
+        while self.frontier:
+            kind, url = self.frontier[0]
+            if url in self.visited:
+                self.frontier.popleft()
+                continue
+
+            print(f"\nScraping {url}...")
+            try:
+                new_books = self.crawl_page(kind, url)
+            except Exception as e:
+                print(f"Error scraping {url}: {e}")
+                self.save_state()
+                print(f"Crawl state saved to {self.state_file}; the next run resumes at this page")
+                return list(self.book_ids)
+
+            self.frontier.popleft()
+            self.visited.add(url)
+            self.save_state()
+            print(f"  {new_books} new books ({len(self.book_ids)} total, {len(self.frontier)} pages queued)")
+
+            # Small delay between pages to be respectful
+            if self.frontier:
+                time.sleep(self.delay)
+
+        # A finished crawl starts over next time
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        print(f"\nCrawled {len(self.visited)} pages of {len(self.shelves_seen)} bookshelves: {len(self.book_ids)} books")
+        return list(self.book_ids)
+
+def main():
+    """Crawl bookshelves and list the book IDs found."""
+    parser = argparse.ArgumentParser(description="Collect book IDs from Project Gutenberg bookshelves")
+    parser.add_argument('--shelves', nargs='+', default=None,
+                        help="bookshelf IDs (default: GUTENBERG_BOOKSHELVES or 658)")
+    parser.add_argument('--discover', default=get_discovery_pattern(),
+                        help="also crawl every bookshelf whose name matches this pattern")
+    parser.add_argument('--state', default=os.getenv('CRAWL_STATE_FILE', DEFAULT_STATE_FILE),
+                        help="crawl state file for resuming")
+    args = parser.parse_args()
+
+    book_ids = BookshelfCrawler(args.shelves, args.discover, args.state).crawl()
+    for book_id in book_ids:
+        print(book_text_url(book_id))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Memoized resolution of place-name entities against the in-memory gazetteer
+Surface forms repeat heavily within and across books ("Rome" thousands of times), so
+each distinct form is normalized and looked up once; its candidates with their name
+confidences, including "not a known place", are kept in a bounded LRU table shared by
+every book the extractor processes. Picking among several candidates is left to the
+per-book toponym disambiguation (toponyms.py).
+"""
+
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Distinct surface forms remembered; a long batch run sees a few tens of thousands
+DEFAULT_MEMO_SIZE = 100000
+# Candidates kept per name, most populous first; bounds the disambiguation work per name
+MAX_CANDIDATES = 20
+
+APOSTROPHES = str.maketrans({'’': "'", '‘': "'", 'ʼ': "'", '`': "'"})
+LEADING_ARTICLE = re.compile(r"^the\s+")
+POSSESSIVE = re.compile(r"(?:'s|(?<=s)')$")
+EDGE_PUNCTUATION = re.compile(r"^[\s\"'(\[]+|[\s\"'.,;:!?)\]]+$")
+SPACES = re.compile(r"\s+")
+
+def normalize_place_name(text: str) -> str:
+    """
+    Fold a place name for matching: Unicode compatibility forms and case folded,
+    diacritics removed, a leading "the" and a trailing possessive stripped,
+    whitespace collapsed. "The Hague's" -> "hague", "Köln" -> "koln".
+    """
+    text = unicodedata.normalize('NFKD', text.translate(APOSTROPHES).casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = SPACES.sub(' ', EDGE_PUNCTUATION.sub('', text))
+    text = POSSESSIVE.sub('', text)
+    return LEADING_ARTICLE.sub('', text).strip()
+
+def name_confidence(surface: str, record: Dict) -> float:
+    """Confidence of a match: longer surface forms and exact names score higher."""
+    base_confidence = 0.5
+
+    # Boost for longer entity text (more specific)
+    if len(surface) > 3:
+        base_confidence += 0.2
+
+    # Boost for exact name match
+    if surface.lower() == record['name'].lower():
+        base_confidence += 0.3
+
+    return min(base_confidence, 1.0)
+
+def gazetteer_records(value) -> List[Dict]:
+    """Records under one gazetteer key: a single record, or a list of same-named places."""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+class EntityResolver:
+    """Resolves entity surface forms to gazetteer candidates through a bounded LRU memo."""
+
+    def __init__(self, gazetteer: Dict[str, Dict], max_entries: int = DEFAULT_MEMO_SIZE):
+        self.gazetteer = gazetteer
+        self.max_entries = max_entries
+        self._memo: 'OrderedDict[str, Optional[Tuple[Tuple[Dict, float], ...]]]' = OrderedDict()
+        self._folded = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _folded_index(self) -> Dict[str, List[Dict]]:
+        """Every gazetteer record keyed by normalized name, most populous first; built on the first miss."""
+        if self._folded is None:
+            folded = {}
+            for key, value in self.gazetteer.items():
+                folded.setdefault(normalize_place_name(key), []).extend(gazetteer_records(value))
+            for records in folded.values():
+                records.sort(key=lambda record: record.get('pop', 0) or 0, reverse=True)
+            self._folded = folded
+        return self._folded
+
+    def _lookup(self, surface: str) -> Optional[Tuple[Tuple[Dict, float], ...]]:
+        # The gazetteer's own lowercase key first, then every place with the same folded name
+        records = list(gazetteer_records(self.gazetteer.get(surface.lower())))
+        seen = {id(record) for record in records}
+        for record in self._folded_index().get(normalize_place_name(surface), ()):
+            if id(record) not in seen:
+                records.append(record)
+                seen.add(id(record))
+        if not records:
+            return None
+        return tuple((record, name_confidence(surface, record)) for record in records[:MAX_CANDIDATES])
+
+    def resolve(self, surface: str) -> Optional[Tuple[Dict, float]]:
+        """(gazetteer record, confidence) of the first candidate, or None when it is not a known place."""
+        candidates = self.candidates(surface)
+        return candidates[0] if candidates else None
+
+    def candidates(self, surface: str) -> Optional[Tuple[Tuple[Dict, float], ...]]:
+        """Every (gazetteer record, name confidence) an entity's text may refer to, or None for unknown places."""
+        memo = self._memo
+        if surface in memo:
+            self.hits += 1
+            memo.move_to_end(surface)
+            return memo[surface]
+
+        self.misses += 1
+        result = self._lookup(surface)
+        memo[surface] = result
+        if len(memo) > self.max_entries:
+            memo.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._memo),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
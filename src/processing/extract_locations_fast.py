@@ -2,13 +2,23 @@
 """
 Fast location extraction using in-memory European gazetteer
 This version loads the gazetteer once and uses direct lookups instead of database queries
+A book is processed as a stream: the download is decoded block by block, the Gutenberg
+header and footer are cut off as the text passes, and chunks go through NER one at a
+time, each yielding its mentions. Only the current chunk and its overlaps are held, so
+memory per book stays flat however long the book is.
+Mentions travel as MentionBatch columns: gazetteer records and entity texts are stored
+once per batch, and contexts are offsets into the chunk text, so a mention costs a few
+dozen bytes instead of an object with its own context string.
 """
 
+import itertools
 import json
 import pickle
+import re
 import spacy
 import requests
-from typing import List, Dict, Optional
+from array import array
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 import os
 import sys
@@ -17,7 +27,138 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'database'))
 from enhance_time_periods import extract_time_periods_from_text
 
+sys.path.append(os.path.dirname(__file__))
+from entity_resolver import EntityResolver
+from toponyms import BookToponyms, ToponymDisambiguator
+
+# Characters of text per spaCy call; smaller chunks lower peak memory, larger ones mean fewer calls
+DEFAULT_CHUNK_SIZE = 500000
+# Characters beyond each end of a chunk that are parsed with it, so entities near a cut keep their sentence context
+CHUNK_OVERLAP = 1000
+# A chunk ends at the last paragraph break, else sentence end, in the final fifth of its target size
+CUT_SEARCH_FRACTION = 0.2
+
+# Bytes read from the connection at a time while streaming a book
+DOWNLOAD_BLOCK_SIZE = 65536
+# Characters searched for the Gutenberg start marker before the text is taken as unmarked
+HEADER_SEARCH_LIMIT = 100000
+GUTENBERG_START_MARKER = "*** START OF THE PROJECT GUTENBERG EBOOK"
+GUTENBERG_END_MARKER = "*** END OF THE PROJECT GUTENBERG EBOOK"
+
+PARAGRAPH_BREAK = re.compile(r'\n[ \t\r]*\n')
+SENTENCE_END = re.compile(r'[.!?;]["\'\u2019\u201d)\]]*\s+')
+WHITESPACE = re.compile(r'\s')
+
+def get_chunk_size() -> int:
+    """Read the NER chunk size from NER_CHUNK_SIZE (characters)."""
+    try:
+        return max(1000, int(os.getenv('NER_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)))
+    except ValueError:
+        return DEFAULT_CHUNK_SIZE
+
+def find_chunk_cut(text: str, lowest: int, target: int) -> int:
+    """End of a chunk within [lowest, target]: after a blank line, else after a sentence, else after a space."""
+    for pattern in (PARAGRAPH_BREAK, SENTENCE_END):
+        boundary = None
+        for boundary in pattern.finditer(text, lowest, target):
+            pass
+        if boundary:
+            return boundary.end()
+    space = max(text.rfind(' ', lowest, target), text.rfind('\n', lowest, target))
+    return space + 1 if space != -1 else target
+
 @dataclass
+class TextChunk:
+    """
+    One chunk of a streamed text. text holds the book's characters from text_start on,
+    covering the own range plus up to the overlap on both sides; offsets are book offsets.
+    """
+    text_start: int
+    text: str
+    window_start: int
+    window_end: int
+    own_start: int
+    own_end: int
+
+    def slice(self, start: int, end: int) -> str:
+        """Book characters [start, end), clipped to the chunk's text."""
+        return self.text[max(0, start - self.text_start):max(0, end - self.text_start)]
+
+    @property
+    def window(self) -> str:
+        return self.slice(self.window_start, self.window_end)
+
+    @property
+    def own_text(self) -> str:
+        return self.slice(self.own_start, self.own_end)
+
+def stream_chunks(pieces: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  overlap: int = CHUNK_OVERLAP) -> Iterator[TextChunk]:
+    """
+    Split a text arriving in pieces into consecutive chunks cut on paragraph or sentence
+    boundaries. The own ranges partition the text, and each window adds up to overlap
+    characters on both sides (trimmed to whole words) for the parser to see. An entity
+    belongs to the chunk whose own range holds its first character, so entities in the
+    overlap are reported once. At most a chunk and both overlaps are buffered, and the
+    cuts are the same as for the whole text at once.
+    """
+    pieces = iter(pieces)
+    buffer, buffer_start = '', 0
+    exhausted = False
+    own_start = 0
+    while True:
+        # Enough text to place the cut and the window end, or the rest of the stream
+        needed = own_start + chunk_size + overlap + 1
+        parts = []
+        available = buffer_start + len(buffer)
+        while not exhausted and available < needed:
+            piece = next(pieces, None)
+            if piece is None:
+                exhausted = True
+            else:
+                parts.append(piece)
+                available += len(piece)
+        if parts:
+            buffer += ''.join(parts)
+        buffer_end = buffer_start + len(buffer)
+        if own_start >= buffer_end:
+            return
+
+        target = own_start + chunk_size
+        if exhausted and target >= buffer_end:
+            own_end = buffer_end
+        else:
+            own_end = buffer_start + find_chunk_cut(buffer, target - int(chunk_size * CUT_SEARCH_FRACTION) - buffer_start,
+                                                    target - buffer_start)
+
+        window_start = own_start
+        if own_start > 0:
+            space = WHITESPACE.search(buffer, max(0, own_start - overlap) - buffer_start, own_start - buffer_start)
+            window_start = buffer_start + space.end() if space else own_start
+        window_end = own_end
+        if own_end < buffer_end:
+            limit = min(buffer_end, own_end + overlap) - buffer_start
+            space = buffer_start + max(buffer.rfind(' ', own_end - buffer_start, limit),
+                                       buffer.rfind('\n', own_end - buffer_start, limit))
+            window_end = space if space > own_end else own_end
+
+        text_start = max(0, own_start - overlap)
+        yield TextChunk(text_start, buffer[text_start - buffer_start:min(buffer_end, own_end + overlap) - buffer_start],
+                        window_start, window_end, own_start, own_end)
+
+        # Keep only what the next chunk's leading overlap needs
+        keep_from = max(buffer_start, own_end - overlap)
+        buffer, buffer_start = buffer[keep_from - buffer_start:], keep_from
+        own_start = own_end
+
+def text_chunks(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[int, int, int, int]]:
+    """(window_start, window_end, own_start, own_end) of the chunks of a text held in memory."""
+    pieces = (text[start:start + chunk_size] for start in range(0, len(text), chunk_size))
+    for chunk in stream_chunks(pieces, chunk_size, overlap):
+        yield chunk.window_start, chunk.window_end, chunk.own_start, chunk.own_end
+
+@dataclass(slots=True)
 class LocationMention:
     location_name: str
     latitude: float
@@ -29,10 +170,96 @@ class LocationMention:
     country_code: str
     population: int
 
+class MentionBatch:
+    """
+    Location mentions of one text as parallel arrays.
+    Gazetteer records and entity texts are interned per batch and referenced by index;
+    a context is the (start, end) of its stripped slice of text, which begins at book
+    offset text_start. Indexing or iterating yields LocationMention rows.
+    """
+
+    def __init__(self, text: str = '', text_start: int = 0):
+        self.text = text
+        self.text_start = text_start
+        self.records: List[Dict] = []
+        self.surfaces: List[str] = []
+        self._record_slots: Dict[int, int] = {}
+        self._surface_slots: Dict[str, int] = {}
+        self.record_index = array('l')
+        self.surface_index = array('l')
+        self.positions = array('q')
+        self.confidences = array('d')
+        self.context_starts = array('q')
+        self.context_ends = array('q')
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def append(self, record: Dict, surface: str, position: int, confidence: float,
+               context_start: int, context_end: int):
+        """Add a mention; its context is text[context_start:context_end] (book offsets) clipped and stripped."""
+        slot = self._record_slots.get(id(record))
+        if slot is None:
+            slot = self._record_slots[id(record)] = len(self.records)
+            self.records.append(record)
+        self.record_index.append(slot)
+        slot = self._surface_slots.get(surface)
+        if slot is None:
+            slot = self._surface_slots[surface] = len(self.surfaces)
+            self.surfaces.append(surface)
+        self.surface_index.append(slot)
+        self.positions.append(position)
+        self.confidences.append(confidence)
+
+        text = self.text
+        start = min(max(0, context_start - self.text_start), len(text))
+        end = max(start, min(context_end - self.text_start, len(text)))
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        self.context_starts.append(self.text_start + start)
+        self.context_ends.append(self.text_start + end)
+
+    def extend(self, other: 'MentionBatch'):
+        """Append another batch's mentions; their contexts must lie within this batch's text."""
+        for i in range(len(other)):
+            self.append(other.records[other.record_index[i]], other.surfaces[other.surface_index[i]],
+                        other.positions[i], other.confidences[i], other.context_starts[i], other.context_ends[i])
+
+    def context(self, index: int) -> str:
+        return self.text[self.context_starts[index] - self.text_start:self.context_ends[index] - self.text_start]
+
+    def mention_length(self, index: int) -> int:
+        return len(self.surfaces[self.surface_index[index]])
+
+    def __getitem__(self, index: int) -> LocationMention:
+        if index < 0:
+            index += len(self)
+        record = self.records[self.record_index[index]]
+        return LocationMention(
+            location_name=record['name'],
+            latitude=record['lat'],
+            longitude=record['lon'],
+            mentioned_as=self.surfaces[self.surface_index[index]],
+            context=self.context(index),
+            text_position=self.positions[index],
+            confidence=self.confidences[index],
+            country_code=record.get('country', ''),
+            population=record.get('pop', 0)
+        )
+
+    def __iter__(self) -> Iterator[LocationMention]:
+        return (self[index] for index in range(len(self)))
+
 class FastLocationExtractor:
-    def __init__(self, gazetteer_path: str = 'data/gazetteer/european_cities_optimized.pkl'):
+    def __init__(self, gazetteer_path: str = 'data/gazetteer/european_cities_optimized.pkl',
+                 chunk_size: Optional[int] = None):
         self.gazetteer_path = gazetteer_path
+        self.chunk_size = chunk_size or get_chunk_size()
         self.gazetteer = None
+        self.resolver = None
+        self.disambiguator = None
         self.nlp = None
         self.load_gazetteer()
         self.load_nlp_model()
@@ -54,6 +281,9 @@ class FastLocationExtractor:
                     self.gazetteer = json.load(f)
             
             print(f"Loaded {len(self.gazetteer):,} European locations into memory")
+            # One memo for every book this extractor processes
+            self.resolver = EntityResolver(self.gazetteer)
+            self.disambiguator = ToponymDisambiguator(self.gazetteer)
             return True
             
         except Exception as e:
@@ -72,27 +302,33 @@ class FastLocationExtractor:
             return False
     
     def find_location(self, entity_text: str) -> Optional[Dict]:
-        """Find a location in the in-memory gazetteer."""
-        if not self.gazetteer:
+        """Find a location in the in-memory gazetteer (memoized, with name normalization)."""
+        if not self.resolver:
             return None
         
-        # Direct dictionary lookup (much faster than database query)
-        key = entity_text.lower()
-        if key in self.gazetteer:
-            return self.gazetteer[key]
-        
-        return None
+        resolved = self.resolver.resolve(entity_text)
+        return resolved[0] if resolved else None
     
-    def download_book(self, url: str) -> Optional[str]:
-        """Download book text from URL."""
-        try:
-            print(f"Downloading book from {url}...")
-            response = requests.get(url, timeout=30)
+    def stream_book(self, url: str) -> Iterator[str]:
+        """Download book text from URL, yielding it as decoded pieces."""
+        print(f"Streaming book from {url}...")
+        with requests.get(url, timeout=30, stream=True) as response:
             response.raise_for_status()
-            return response.text
-        except Exception as e:
-            print(f"Error downloading book: {e}")
-            return None
+            # Gutenberg declares its charset; plain UTF-8 otherwise rather than guessing from the whole body
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+            for piece in response.iter_content(DOWNLOAD_BLOCK_SIZE, decode_unicode=True):
+                if piece:
+                    yield piece
+    
+    def read_book_header(self, url: str) -> str:
+        """Text of a book up to its Gutenberg start marker (at most HEADER_SEARCH_LIMIT characters), without downloading the rest."""
+        head = ''
+        for piece in self.stream_book(url):
+            head += piece
+            if GUTENBERG_START_MARKER in head or len(head) >= HEADER_SEARCH_LIMIT:
+                break
+        return head
     
     def extract_book_title(self, text: str) -> str:
         """Extract the actual book title from Gutenberg text."""
@@ -152,114 +388,150 @@ class FastLocationExtractor:
         print("Could not extract title, using generic name")
         return "Unknown Book"
     
-    def clean_gutenberg_text(self, text: str) -> str:
-        """Remove Project Gutenberg headers and footers."""
-        start_marker = "*** START OF THE PROJECT GUTENBERG EBOOK"
-        end_marker = "*** END OF THE PROJECT GUTENBERG EBOOK"
+    def clean_gutenberg_stream(self, pieces: Iterable[str]) -> Iterator[str]:
+        """
+        Remove Project Gutenberg headers and footers from text arriving in pieces.
+        The header is read up to the start marker (its title is reported), the body is
+        passed on as it arrives, and reading stops at the end marker, so the footer is
+        never downloaded. Without a start marker in the first HEADER_SEARCH_LIMIT
+        characters the full text is used; without an end marker the body runs to the end.
+        """
+        pieces = iter(pieces)
+        head = ''
+        for piece in pieces:
+            head += piece
+            if GUTENBERG_START_MARKER in head or len(head) >= HEADER_SEARCH_LIMIT:
+                break
         
-        try:
-            start_index = text.index(start_marker)
-            text_after_start = text[start_index + len(start_marker):]
-            end_index = text_after_start.index(end_marker)
-            clean_text = text_after_start[:end_index].strip()
-            print(f"Cleaned text: {len(clean_text):,} characters")
-            return clean_text
-        except ValueError:
+        start_index = head.find(GUTENBERG_START_MARKER)
+        if start_index == -1:
             print("Warning: Gutenberg markers not found. Using full text.")
-            return text
+            yield head
+            yield from pieces
+            return
+        print(f"Processing: {self.extract_book_title(head)}")
+        
+        # Hold back what could be the start of the end marker, and trailing whitespace
+        held = len(GUTENBERG_END_MARKER) - 1
+        body = head[start_index + len(GUTENBERG_START_MARKER):]
+        del head
+        pending = ''
+        length = 0
+        for piece in itertools.chain((body,), pieces):
+            if not pending:
+                piece = piece.lstrip()
+            pending += piece
+            end_index = pending.find(GUTENBERG_END_MARKER)
+            if end_index != -1:
+                pending = pending[:end_index]
+                break
+            ready = len(pending[:max(0, len(pending) - held)].rstrip())
+            if ready:
+                length += ready
+                yield pending[:ready]
+                pending = pending[ready:]
+        
+        pending = pending.rstrip()
+        length += len(pending)
+        if pending:
+            yield pending
+        print(f"Cleaned text: {length:,} characters")
     
-    def extract_locations_with_context(self, text: str, context_window: int = 100) -> List[LocationMention]:
+    def iter_location_mentions(self, pieces: Iterable[str], context_window: int = 100,
+                               chunk_size: Optional[int] = None) -> Iterator[Tuple[TextChunk, MentionBatch]]:
         """
         Extract location mentions with surrounding context using in-memory gazetteer.
-        Returns list of LocationMention objects.
+        The text arrives in pieces and is parsed in chunks of about chunk_size characters
+        (default: the extractor's, from NER_CHUNK_SIZE) cut on paragraph or sentence
+        boundaries. Yields (chunk, batch of the mentions in its own range) as each chunk is
+        parsed; contexts lie in the chunk's text, so they are never clipped at a cut.
         """
         if not self.nlp or not self.gazetteer:
             print("NLP model or gazetteer not loaded!")
-            return []
+            return
         
-        print(f"Extracting locations from {len(text):,} characters...")
+        chunk_size = chunk_size or self.chunk_size
+        # spaCy refuses longer texts; a chunk plus both overlaps must fit
+        self.nlp.max_length = max(self.nlp.max_length, chunk_size + 2 * CHUNK_OVERLAP + 1)
+        print("Extracting locations...")
         
-        # Process text in chunks to avoid memory issues
-        chunk_size = 500000
-        all_mentions = []
+        # One reading per name and book, fixed in the chunk where the name first appears
+        toponyms = BookToponyms(self.disambiguator)
+        # End of the last location entity taken, so a span parsed by two windows is reported once
+        covered_until = 0
+        total = 0
+        length = 0
         
-        for chunk_start in range(0, len(text), chunk_size):
-            chunk_end = min(chunk_start + chunk_size, len(text))
-            chunk = text[chunk_start:chunk_end]
-            
-            print(f"Processing chunk {chunk_start//chunk_size + 1} (chars {chunk_start:,}-{chunk_end:,})...")
+        for number, chunk in enumerate(stream_chunks(pieces, chunk_size), 1):
+            print(f"Processing chunk {number} (chars {chunk.own_start:,}-{chunk.own_end:,})...")
+            length = chunk.own_end
             
-            doc = self.nlp(chunk)
+            doc = self.nlp(chunk.window)
             
+            # Place entities as (text, start, end); the chunk's names are resolved together
+            found = []
+            names = {}
+            counts = {}
             for ent in doc.ents:
                 # Focus on location-related entities
-                if ent.label_ in ['GPE', 'LOC', 'FAC']:  # Countries, cities, locations, facilities
-                    location_data = self.find_location(ent.text)
-                    
-                    if location_data:
-                        # Calculate context window
-                        context_start = max(0, ent.start_char - context_window)
-                        context_end = min(len(chunk), ent.end_char + context_window)
-                        context = chunk[context_start:context_end].strip()
-                        
-                        # Calculate confidence based on entity type and text length
-                        confidence = self._calculate_confidence(ent, location_data)
-                        
-                        mention = LocationMention(
-                            location_name=location_data['name'],
-                            latitude=location_data['lat'],
-                            longitude=location_data['lon'],
-                            mentioned_as=ent.text,
-                            context=context,
-                            text_position=chunk_start + ent.start_char,
-                            confidence=confidence,
-                            country_code=location_data.get('country', ''),
-                            population=location_data.get('pop', 0)
-                        )
-                        
-                        all_mentions.append(mention)
+                if ent.label_ not in ['GPE', 'LOC', 'FAC']:  # Countries, cities, locations, facilities
+                    continue
+                start = chunk.window_start + ent.start_char
+                end = chunk.window_start + ent.end_char
+                # Entities starting in the overlap belong to the neighbouring chunk
+                if start < chunk.own_start or start >= chunk.own_end or start < covered_until:
+                    continue
+                covered_until = end
+                
+                candidates = self.resolver.candidates(ent.text)
+                if candidates:
+                    found.append((ent.text, start, end))
+                    names[ent.text] = candidates
+                    counts[ent.text] = counts.get(ent.text, 0) + 1
+            
+            # Release the parse before the mentions are handed on
+            del doc
+            
+            choices = toponyms.choose(names, counts)
+            mentions = MentionBatch(chunk.text, chunk.text_start)
+            for mentioned_as, start, end in found:
+                location_data, confidence = choices[mentioned_as]
+                # Context window as offsets into the chunk's text
+                mentions.append(location_data, mentioned_as, start, confidence,
+                                start - context_window, end + context_window)
+            
+            total += len(mentions)
+            yield chunk, mentions
         
-        print(f"Extracted {len(all_mentions)} location mentions")
+        stats = self.resolver.stats()
+        print(f"Extracted {total} location mentions from {length:,} characters "
+              f"({toponyms.ambiguous} ambiguous names; entity cache: {stats['hit_rate']:.0%} hits, {stats['entries']:,} forms)")
+    
+    def extract_locations_with_context(self, text: str, context_window: int = 100,
+                                       chunk_size: Optional[int] = None) -> MentionBatch:
+        """
+        Extract location mentions from a text held in memory.
+        Returns one MentionBatch over the text (iterating it yields LocationMention objects).
+        """
+        all_mentions = MentionBatch(text)
+        for _, mentions in self.iter_location_mentions([text], context_window, chunk_size):
+            all_mentions.extend(mentions)
         return all_mentions
     
-    def _calculate_confidence(self, entity, location_data: Dict) -> float:
-        """Calculate confidence score for a location match."""
-        base_confidence = 0.5
-        
-        # Boost for longer entity text (more specific)
-        if len(entity.text) > 3:
-            base_confidence += 0.2
-        
-        # Boost for exact name match
-        if entity.text.lower() == location_data['name'].lower():
-            base_confidence += 0.3
-        
-        return min(base_confidence, 1.0)
+    def iter_book_mentions(self, url: str, context_window: int = 100) -> Iterator[Tuple[TextChunk, MentionBatch]]:
+        """Stream a book from its URL and yield (chunk, mentions) per parsed chunk of its cleaned text."""
+        yield from self.iter_location_mentions(self.clean_gutenberg_stream(self.stream_book(url)), context_window)
     
-    def process_book(self, url: str) -> Optional[List[LocationMention]]:
-        """Process a single book and extract locations."""
+    def process_book(self, url: str) -> Optional[int]:
+        """Process a single book and return its number of location mentions; batches are counted, not kept."""
         try:
-            # Download book
-            raw_text = self.download_book(url)
-            if not raw_text:
-                return None
-            
-            # Extract title
-            title = self.extract_book_title(raw_text)
-            print(f"Processing: {title}")
-            
-            # Clean text
-            clean_text = self.clean_gutenberg_text(raw_text)
-            
-            # Extract locations
-            mentions = self.extract_locations_with_context(clean_text)
+            mention_count = sum(len(batch) for _, batch in self.iter_book_mentions(url))
             
-            if mentions:
-                print(f"Found {len(mentions)} location mentions")
-                return mentions
+            if mention_count:
+                print(f"Found {mention_count} location mentions")
             else:
                 print("No locations found")
-                return []
+            return mention_count
                 
         except Exception as e:
             print(f"Error processing book: {e}")
@@ -280,8 +552,8 @@ def main():
     test_url = "https://www.gutenberg.org/cache/epub/49266/pg49266.txt"
     print(f"\nTesting with: {test_url}")
     
-    success = extractor.process_book(test_url)
-    if success:
+    mention_count = extractor.process_book(test_url)
+    if mention_count is not None:
         print("Book processing completed successfully!")
     else:
         print("Book processing failed!")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Toponym disambiguation for the place names of one book
+A name with several gazetteer candidates (the Frankfurts, "Georgia") is resolved once
+per book by scoring every candidate on population, on how common its country is among
+the book's unambiguous places, and on its closeness to those places. Candidate
+coordinates are unit vectors precomputed for the whole gazetteer, the book's
+unambiguous places are aggregated into at most MAX_ANCHOR_CELLS grid cells, and all
+candidate-to-anchor distances come from blocked float32 matrix products (straight-line
+chord distances, within 1% of great-circle ones below 2,500 km), so the work per book
+is bounded by (distinct names x MAX_CANDIDATES x MAX_ANCHOR_CELLS).
+A streamed book is disambiguated chunk by chunk (BookToponyms): an ambiguous name is
+decided when it first appears, against the unambiguous places seen up to and including
+that chunk, and keeps that reading for the rest of the book.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from entity_resolver import gazetteer_records
+
+EARTH_RADIUS_KM = 6371.0
+
+# Score weights: size of the place, share of its country in the book, closeness to the book's places
+POPULATION_WEIGHT = 0.3
+COUNTRY_WEIGHT = 0.3
+DISTANCE_WEIGHT = 0.4
+# log10 of the population that scores fully on size (10 million)
+POPULATION_SCALE = 7.0
+# Distance at which a place's closeness to another place of the book falls to 1/e
+DISTANCE_SCALE_KM = 500.0
+# Unambiguous places are summed into cells of this size; only the busiest cells are scored against
+ANCHOR_CELL_DEGREES = 0.5
+MAX_ANCHOR_CELLS = 512
+# Candidate rows per matrix product, bounding memory to rows x anchor cells
+SCORE_BLOCK_ROWS = 4096
+# Sharpness of the softmax that turns score gaps into the winner's share
+CHOICE_TEMPERATURE = 10.0
+# Additive smoothing of the book's country counts
+COUNTRY_PRIOR_SMOOTHING = 1.0
+
+Candidates = Tuple[Tuple[Dict, float], ...]
+
+def unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Points on the unit sphere as float32 rows; |a - b|^2 = 2 - 2 a.b gives the chord between two."""
+    lat = np.radians(latitudes)
+    lon = np.radians(longitudes)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat))).astype(np.float32)
+
+class ToponymDisambiguator:
+    """Chooses one gazetteer record per place name of a book from the resolver's candidates."""
+
+    def __init__(self, gazetteer: Dict):
+        records: List[Dict] = []
+        self._rows: Dict[int, int] = {}
+        for value in gazetteer.values():
+            for record in gazetteer_records(value):
+                if id(record) not in self._rows:
+                    self._rows[id(record)] = len(records)
+                    records.append(record)
+
+        # Spatial index over every candidate the resolver can return, built once per gazetteer
+        self.latitudes = np.array([record['lat'] for record in records], dtype=np.float64)
+        self.longitudes = np.array([record['lon'] for record in records], dtype=np.float64)
+        self.vectors = unit_vectors(self.latitudes, self.longitudes)
+        populations = np.array([record.get('pop', 0) or 0 for record in records], dtype=np.float64)
+        self.population_scores = np.minimum(np.log10(populations + 1) / POPULATION_SCALE, 1.0)
+        country_codes: Dict[str, int] = {}
+        self.countries = np.array([country_codes.setdefault(record.get('country', '') or '', len(country_codes))
+                                   for record in records], dtype=np.int64)
+        self.country_count = max(1, len(country_codes))
+
+    def _row(self, record: Dict) -> int:
+        return self._rows[id(record)]
+
+    def _anchor_cells(self, rows: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Unambiguous places summed per grid cell: (cell unit vectors, cell weights), busiest cells only."""
+        cell_lat = np.floor(self.latitudes[rows] / ANCHOR_CELL_DEGREES).astype(np.int64)
+        cell_lon = np.floor(self.longitudes[rows] / ANCHOR_CELL_DEGREES).astype(np.int64)
+        cells, inverse = np.unique(cell_lat * 1000 + cell_lon, return_inverse=True)
+        cell_weights = np.bincount(inverse, weights=weights, minlength=len(cells))
+        cell_vectors = np.zeros((len(cells), 3), dtype=np.float32)
+        np.add.at(cell_vectors, inverse, self.vectors[rows] * weights[:, None].astype(np.float32))
+        cell_vectors /= np.linalg.norm(cell_vectors, axis=1, keepdims=True)
+        if len(cells) > MAX_ANCHOR_CELLS:
+            busiest = np.argsort(cell_weights)[-MAX_ANCHOR_CELLS:]
+            cell_vectors, cell_weights = cell_vectors[busiest], cell_weights[busiest]
+        return cell_vectors, cell_weights
+
+    def _scores(self, rows: np.ndarray, anchor_rows: np.ndarray, anchor_weights: np.ndarray) -> np.ndarray:
+        """Score of every candidate row given the book's unambiguous places."""
+        scores = POPULATION_WEIGHT * self.population_scores[rows]
+        if not len(anchor_rows):
+            # No evidence about the book's region: the largest place wins
+            return scores
+
+        country_counts = np.bincount(self.countries[anchor_rows], weights=anchor_weights,
+                                     minlength=self.country_count)
+        prior = (country_counts + COUNTRY_PRIOR_SMOOTHING) / (anchor_weights.sum() + COUNTRY_PRIOR_SMOOTHING * self.country_count)
+        scores += COUNTRY_WEIGHT * prior[self.countries[rows]] / prior.max()
+
+        cell_vectors, cell_weights = self._anchor_cells(anchor_rows, anchor_weights)
+        cell_weights = (cell_weights / cell_weights.sum()).astype(np.float32)
+        scale = np.float32(EARTH_RADIUS_KM / DISTANCE_SCALE_KM)
+        closeness = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            # exp(-chord / DISTANCE_SCALE_KM) per candidate and cell, computed in place
+            block = self.vectors[rows[start:start + SCORE_BLOCK_ROWS]] @ cell_vectors.T
+            np.subtract(1.0, block, out=block)
+            np.maximum(block, 0.0, out=block)
+            block *= 2.0
+            np.sqrt(block, out=block)
+            block *= -scale
+            np.exp(block, out=block)
+            closeness[start:start + SCORE_BLOCK_ROWS] = block @ cell_weights
+        return scores + DISTANCE_WEIGHT * closeness
+
+    def choose(self, names: Dict[str, Candidates],
+               counts: Optional[Dict[str, int]] = None) -> Dict[str, Tuple[Dict, float]]:
+        """
+        (record, confidence) per name. Names with one candidate keep it and, weighted by
+        their mention counts, form the evidence; each ambiguous name gets its best-scoring
+        candidate, with the name confidence scaled by the winner's softmax share.
+        """
+        return BookToponyms(self).choose(names, counts)
+
+class BookToponyms:
+    """Choices for the place names of one book, made as its chunks arrive."""
+
+    def __init__(self, disambiguator: ToponymDisambiguator):
+        self.disambiguator = disambiguator
+        self.choices: Dict[str, Tuple[Dict, float]] = {}
+        self.ambiguous = 0
+        # Mention count per gazetteer row of the book's unambiguous names
+        self._anchors: Dict[int, float] = {}
+
+    def choose(self, names: Dict[str, Candidates],
+               counts: Optional[Dict[str, int]] = None) -> Dict[str, Tuple[Dict, float]]:
+        """
+        (record, confidence) per name of the next chunk; counts are the chunk's mention
+        counts. Unambiguous names add to the evidence first, then the chunk's new
+        ambiguous names are scored against everything seen so far.
+        """
+        disambiguator = self.disambiguator
+        counts = counts or {}
+        ambiguous = []
+        for name, candidates in names.items():
+            if len(candidates) == 1:
+                self.choices[name] = candidates[0]
+                row = disambiguator._row(candidates[0][0])
+                self._anchors[row] = self._anchors.get(row, 0) + counts.get(name, 1)
+            elif name not in self.choices:
+                ambiguous.append(name)
+
+        if ambiguous:
+            self.ambiguous += len(ambiguous)
+            rows = np.array([disambiguator._row(record) for name in ambiguous for record, _ in names[name]],
+                            dtype=np.int64)
+            scores = disambiguator._scores(rows, np.fromiter(self._anchors.keys(), dtype=np.int64, count=len(self._anchors)),
+                                           np.fromiter(self._anchors.values(), dtype=np.float64, count=len(self._anchors)))
+
+            start = 0
+            for name in ambiguous:
+                candidates = names[name]
+                segment = scores[start:start + len(candidates)]
+                start += len(candidates)
+                shares = np.exp(CHOICE_TEMPERATURE * (segment - segment.max()))
+                best = int(np.argmax(segment))
+                record, confidence = candidates[best]
+                self.choices[name] = (record, confidence * (0.5 + 0.5 * float(shares[best] / shares.sum())))
+        return {name: self.choices[name] for name in names}
@@ -1,15 +1,48 @@
-from flask import Flask, jsonify, request, render_template
-import sqlite3
+from flask import Flask, Response, abort, jsonify, request, render_template, send_file, url_for
 from difflib import get_close_matches
+from array import array
+import gzip
+import mimetypes
 import os
+import struct
+import sys
 from dotenv import load_dotenv
 
+# Add the database directory to the path to import the context store
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'database'))
+from api_queries import STARTS_WITH_BOUND
+from context_store import fill_mention_contexts, MAX_CONTEXT_WINDOW
+from data_access import backend_of, execute, fetch_all, get_database_type, get_sql_placeholder, query_stats
+import data_access
+from migrations import ensure_schema
+from maintenance import MaintenanceScheduler
+from timeline import TIMELINE_RESOLUTIONS
+from serving_db import ServingPublisher
+from export import EXPORT_FORMATS, ExportError, ExportFilters, check_export_format, export_mentions, parse_bbox
+
+sys.path.append(os.path.dirname(__file__))
+from assets import ASSET_MAX_AGE, AssetBuildError, assets_stale, build_assets, find_asset, load_manifest
+
 # Load environment variables
 load_dotenv()
 
 # --- Configuration ---
 DATABASE_FILE = 'history_map.db'
 
+# Packed columnar format for map location payloads, selected via the Accept header.
+# Layout (little-endian): 16-byte header (magic, version, count, name bytes), then
+# Uint32 ids, Float32 latitudes, Float32 longitudes, Uint32 mention counts,
+# Uint32 name offsets (count + 1) and the UTF-8 name table.
+COLUMNAR_MIMETYPE = 'application/x-hrm-columnar'
+COLUMNAR_MAGIC = b'HRMC'
+COLUMNAR_VERSION = 1
+
+# Fingerprinted asset names from the last build (see assets.py), loaded on first use
+asset_manifest = None
+
+# Not in every platform's mimetypes table
+mimetypes.add_type('font/woff2', '.woff2')
+
 # Initialize the Flask application
 app = Flask(__name__)
 
@@ -26,63 +59,46 @@ def log_database_info():
         print(f"💾 Using SQLite database: {DATABASE_FILE}")
 
 # --- Database Configuration ---
-def get_database_type() -> str:
-    """Determine which database to use based on environment variables."""
-    if os.getenv('DB_TYPE') == 'postgresql':
-        return 'postgresql'
-    return 'sqlite'  # Default fallback
-
-def get_sql_placeholder() -> str:
-    """Get the correct SQL parameter placeholder for the current database."""
-    if get_database_type() == 'postgresql':
-        return '%s'
-    return '?'
-
 def get_db_connection():
-    """Creates a connection to the database based on configuration."""
-    db_type = get_database_type()
-    
-    if db_type == 'postgresql':
-        return get_postgresql_connection()
-    else:
-        return get_sqlite_connection()
-
-def get_sqlite_connection():
-    """Creates a connection to the SQLite database (existing functionality)."""
-    conn = sqlite3.connect(DATABASE_FILE)
-    # This allows us to access columns by name (like a dictionary)
-    conn.row_factory = sqlite3.Row
-    # Enable WAL mode for better concurrent performance
-    conn.execute("PRAGMA journal_mode=WAL")
-    # Set timeout to avoid busy database errors
-    conn.execute("PRAGMA busy_timeout=5000")
-    # Additional performance optimizations
-    conn.execute("PRAGMA synchronous=NORMAL")
-    conn.execute("PRAGMA cache_size=10000")
-    conn.execute("PRAGMA temp_store=MEMORY")
-    return conn
-
-def get_postgresql_connection():
-    """Creates a connection to the PostgreSQL database."""
+    """Opens a connection to the configured database (DATABASE_FILE when using SQLite)."""
+    return data_access.get_db_connection(DATABASE_FILE)
+
+def get_read_connection():
+    """Opens a connection for API reads: the replica/snapshot when configured and fresh, else the primary."""
+    return data_access.get_read_connection(DATABASE_FILE)
+
+def ensure_database_schema():
+    """Apply pending schema migrations before serving (a single version read when current)."""
+    conn = get_db_connection()
     try:
-        import psycopg2
-        from psycopg2.extras import RealDictCursor
-        
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT', 5432),
-            database=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            cursor_factory=RealDictCursor
-        )
-        return conn
-    except ImportError:
-        print("Warning: psycopg2 not installed, falling back to SQLite")
-        return get_sqlite_connection()
-    except Exception as e:
-        print(f"Warning: PostgreSQL connection failed ({e}), falling back to SQLite")
-        return get_sqlite_connection()
+        # get_db_connection falls back to SQLite when PostgreSQL is unavailable
+        ensure_schema(conn, backend_of(conn))
+    finally:
+        conn.close()
+
+def start_maintenance_scheduler():
+    """Run ANALYZE/checkpoint/vacuum maintenance on a timer (MAINTENANCE_INTERVAL seconds, 0 disables)."""
+    scheduler = MaintenanceScheduler(get_db_connection)
+    scheduler.start()
+    return scheduler
+
+def start_serving_publisher():
+    """Republish the SQLITE_READ_FILE serving database once DATABASE_FILE changed and went quiet (DB_SNAPSHOT_INTERVAL, DB_SNAPSHOT_QUIET)."""
+    publisher = ServingPublisher(DATABASE_FILE)
+    if get_database_type() == 'sqlite':
+        publisher.start()
+    return publisher
+
+def prepare_static_assets():
+    """Rebuild the fingerprinted assets when a static source changed since the last build."""
+    global asset_manifest
+    if assets_stale():
+        try:
+            build_assets()
+            print("📦 Static assets rebuilt")
+        except (AssetBuildError, OSError) as e:
+            print(f"Warning: static asset build failed, serving unbuilt files ({e})")
+    asset_manifest = load_manifest()
 
 def optimize_database():
     """Create indexes and optimize the database for better performance."""
@@ -95,14 +111,11 @@ def optimize_database():
 
 def optimize_sqlite_database():
     """Optimize SQLite database (existing functionality)."""
-    conn = get_sqlite_connection()
+    conn = data_access.get_sqlite_connection(DATABASE_FILE)
     cursor = conn.cursor()
     
-    # Create indexes for frequently queried columns
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_locations_name ON locations(name)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mentions_location_id ON mentions(location_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mentions_book_id ON mentions(book_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mentions_position ON mentions(text_position)")
+    # Indexes (including the API covering indexes) are managed by the schema migrations
+    ensure_schema(conn, 'sqlite')
     
     # Analyze the database for better query planning
     cursor.execute("ANALYZE")
@@ -114,14 +127,11 @@ def optimize_sqlite_database():
 def optimize_postgresql_database():
     """Optimize PostgreSQL database."""
     try:
-        conn = get_postgresql_connection()
+        conn = data_access.connect_postgresql()
         cursor = conn.cursor()
         
-        # Create indexes for frequently queried columns
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_locations_name ON locations(name)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mentions_location_id ON mentions(location_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mentions_book_id ON mentions(book_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mentions_position ON mentions(text_position)")
+        # Indexes (including the API covering indexes) are managed by the schema migrations
+        ensure_schema(conn, 'postgresql')
         
         # Analyze the database for better query planning
         cursor.execute("ANALYZE")
@@ -135,11 +145,106 @@ def optimize_postgresql_database():
         print(f"Warning: PostgreSQL optimization failed ({e}), falling back to SQLite")
         optimize_sqlite_database()
 
+YEAR_FILTER_MODES = ('book', 'mention')
+
+def get_year_filter_mode():
+    """Read the mode query parameter: 'book' filters by book periods, 'mention' by estimated mention years."""
+    mode = request.args.get('mode', 'book')
+    return mode if mode in YEAR_FILTER_MODES else None
+
+def year_window_query(mode: str, start_year: int, end_year: int):
+    """Statement name and parameters listing the locations referenced in a year window."""
+    if mode == 'mention':
+        # Range scan on the (estimated_year, location_id) index
+        return 'locations_by_year_mention', (start_year, end_year)
+    return 'locations_by_year', (end_year, start_year)
+
+def get_context_window():
+    """Read the optional context_window query parameter (characters on each side of a mention)."""
+    window = request.args.get('context_window', type=int)
+    if window is None:
+        return None
+    return max(0, min(window, MAX_CONTEXT_WINDOW))
+
+# --- Response Formats ---
+def wants_columnar_response() -> bool:
+    """Check whether the client prefers the packed columnar location format over JSON."""
+    # JSON is listed first so that wildcard Accept headers keep getting JSON
+    best = request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE])
+    return best == COLUMNAR_MIMETYPE
+
+def pack_locations_columnar(rows) -> bytes:
+    """Pack (id, name, latitude, longitude, mention_count) rows into the columnar binary layout."""
+    ids = array('I')
+    latitudes = array('f')
+    longitudes = array('f')
+    mention_counts = array('I')
+    name_offsets = array('I', [0])
+    names = bytearray()
+    
+    for row in rows:
+        ids.append(row['id'])
+        latitudes.append(row['latitude'])
+        longitudes.append(row['longitude'])
+        mention_counts.append(row['mention_count'])
+        names += row['name'].encode('utf-8')
+        name_offsets.append(len(names))
+    
+    columns = [ids, latitudes, longitudes, mention_counts, name_offsets]
+    if sys.byteorder == 'big':
+        for column in columns:
+            column.byteswap()
+    
+    header = struct.pack('<4sIII', COLUMNAR_MAGIC, COLUMNAR_VERSION, len(ids), len(names))
+    return b''.join([header] + [column.tobytes() for column in columns] + [bytes(names)])
+
+def columnar_response(rows) -> Response:
+    """Build a columnar binary response, gzip-compressed when the client accepts it."""
+    payload = pack_locations_columnar(rows)
+    response = Response(payload, mimetype=COLUMNAR_MIMETYPE)
+    
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(payload, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
 # --- Web Interface ---
+@app.template_global()
+def asset_url(name):
+    """URL of a static file: its fingerprinted build when there is one, else the source under /static."""
+    global asset_manifest
+    if asset_manifest is None:
+        asset_manifest = load_manifest()
+    hashed = asset_manifest.get(name)
+    if hashed:
+        return url_for('serve_asset', filename=hashed)
+    return url_for('static', filename=name)
+
 @app.route('/')
 def index():
     """Main web interface for the Historical Reference Mapper."""
-    return render_template('index.html')
+    response = Response(render_template('index.html'), mimetype='text/html')
+    # The page names the current asset builds, so it is the one thing browsers revalidate
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted asset, precompressed with the best encoding the client accepts."""
+    path, encoding = find_asset(filename, lambda name: request.accept_encodings[name])
+    if path is None:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # The name changes whenever the content does
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    return response
 
 # --- API Endpoints ---
 
@@ -147,7 +252,8 @@ def index():
 def get_database_status():
     """
     Endpoint to check database status and configuration.
-    This helps verify which database is being used.
+    This helps verify which database is being used. Also reports per-statement
+    call counts and timings of this worker's API queries.
     """
     try:
         db_type = get_database_type()
@@ -168,7 +274,7 @@ def get_database_status():
             
             # Test PostgreSQL connection
             try:
-                conn = get_postgresql_connection()
+                conn = data_access.connect_postgresql()
                 cursor = conn.cursor()
                 cursor.execute("SELECT version()")
                 version = cursor.fetchone()
@@ -186,7 +292,7 @@ def get_database_status():
         else:
             # Test SQLite connection
             try:
-                conn = get_sqlite_connection()
+                conn = data_access.get_sqlite_connection(DATABASE_FILE)
                 cursor = conn.cursor()
                 cursor.execute("SELECT sqlite_version()")
                 version = cursor.fetchone()
@@ -202,6 +308,8 @@ def get_database_status():
                 status["status"] = "error"
                 status["message"] = f"SQLite connection failed: {str(e)}"
         
+        status["reads"] = data_access.get_read_status(DATABASE_FILE)
+        status["query_stats"] = query_stats.snapshot()
         return jsonify(status)
         
     except Exception as e:
@@ -233,40 +341,16 @@ def get_all_locations():
     if offset < 0:
         return jsonify({"error": "Offset must be non-negative"}), 400
     
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     try:
         # Use a single optimized query with window functions for better performance
         # Only show locations that have references (mentions)
-        placeholder = get_sql_placeholder()
         if search:
-            query = f"""
-                SELECT 
-                    l.id, l.name, l.latitude, l.longitude,
-                    COUNT(*) OVER() as total_count
-                FROM locations l
-                INNER JOIN mentions m ON l.id = m.location_id
-                WHERE l.name LIKE {placeholder} 
-                GROUP BY l.id, l.name, l.latitude, l.longitude
-                ORDER BY l.name 
-                LIMIT {placeholder} OFFSET {placeholder}
-            """
-            cursor.execute(query, (f'%{search}%', limit, offset))
+            results = fetch_all(cursor, 'locations_search', (f'%{search}%', f'%{search}%', limit, offset))
         else:
-            query = f"""
-                SELECT 
-                    l.id, l.name, l.latitude, l.longitude,
-                    COUNT(*) OVER() as total_count
-                FROM locations l
-                INNER JOIN mentions m ON l.id = m.location_id
-                GROUP BY l.id, l.name, l.latitude, l.longitude
-                ORDER BY l.name 
-                LIMIT {placeholder} OFFSET {placeholder}
-            """
-            cursor.execute(query, (limit, offset))
-        
-        results = cursor.fetchall()
+            results = fetch_all(cursor, 'locations_page', (limit, offset))
         
         if not results:
             return jsonify({
@@ -308,20 +392,18 @@ def get_locations_with_references():
     """
     Endpoint to get all locations that have references (mentions) from books.
     This is used for the "Show All Locations" button.
+    
+    Clients sending "Accept: application/x-hrm-columnar" receive the packed
+    columnar binary format with one row per location and its mention count.
     """
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     try:
-        query = """
-            SELECT DISTINCT l.id, l.name, l.latitude, l.longitude
-            FROM locations l
-            INNER JOIN mentions m ON l.id = m.location_id
-            ORDER BY l.name
-        """
-        cursor.execute(query)
-        
-        locations = cursor.fetchall()
+        if wants_columnar_response():
+            return columnar_response(fetch_all(cursor, 'locations_with_references_columnar'))
+        
+        locations = fetch_all(cursor, 'locations_with_references')
         locations_list = [dict(row) for row in locations]
         
         response = {
@@ -340,28 +422,11 @@ def get_books_by_location(location_name):
     Endpoint to find all books that mention a specific location.
     The location_name is passed directly in the URL.
     """
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     # This is the powerful SQL query that joins our three tables
-    placeholder = get_sql_placeholder()
-    query = f"""
-        SELECT
-            b.id,
-            b.title,
-            b.url
-        FROM
-            books b
-        JOIN
-            mentions m ON b.id = m.book_id
-        JOIN
-            locations l ON l.id = m.location_id
-        WHERE
-            l.name = {placeholder}
-    """
-    
-    cursor.execute(query, (location_name,))
-    books = cursor.fetchall()
+    books = fetch_all(cursor, 'books_by_location', (location_name,))
     conn.close()
     
     if not books:
@@ -378,39 +443,23 @@ def get_mentions_by_location(location_name):
     """
     Endpoint to get all mentions of a specific location with context and position.
     This provides the rich textual data for researchers.
-    """
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
-    placeholder = get_sql_placeholder()
-    query = f"""
-        SELECT
-            b.title,
-            l.name as location_name,
-            l.latitude,
-            l.longitude,
-            m.text_position,
-            m.context
-        FROM
-            books b
-        JOIN
-            mentions m ON b.id = m.book_id
-        JOIN
-            locations l ON l.id = m.location_id
-        WHERE
-            l.name = {placeholder}
-        ORDER BY
-            m.text_position
+    Query parameters:
+    - context_window: Characters of context on each side of the mention
+      (only applies to mentions stored in compressed context mode)
     """
+    conn = get_read_connection()
+    cursor = conn.cursor()
     
-    cursor.execute(query, (location_name,))
-    mentions = cursor.fetchall()
-    conn.close()
+    placeholder = get_sql_placeholder(backend_of(conn))
+    mentions = fetch_all(cursor, 'mentions_by_location', (location_name,))
     
     if not mentions:
+        conn.close()
         return jsonify({"error": "Location not found or no mentions available"}), 404
-        
-    mentions_list = [dict(row) for row in mentions]
+    
+    mentions_list = fill_mention_contexts(cursor, mentions, placeholder, get_context_window())
+    conn.close()
     return jsonify(mentions_list)
 
 @app.route('/api/mentions_by_year/<string:location_name>', methods=['GET'])
@@ -418,91 +467,45 @@ def get_mentions_by_location_and_year(location_name):
     """
     Endpoint to get mentions of a specific location filtered by year range.
     Returns mentions in two tiers: year-matched and year-mismatched/unperiodized.
+    
+    Query parameters:
+    - start_year, end_year: Year range (required)
+    - mode: 'book' (default) matches books whose period overlaps the range;
+      'mention' matches mentions whose own estimated year falls in the range
+    - context_window: Characters of context on each side of the mention
+      (only applies to mentions stored in compressed context mode)
     """
     start_year = request.args.get('start_year', type=int)
     end_year = request.args.get('end_year', type=int)
+    mode = get_year_filter_mode()
     
     # Validate parameters
     if not (start_year and end_year):
         return jsonify({"error": "Both 'start_year' and 'end_year' parameters are required"}), 400
+    if mode is None:
+        return jsonify({"error": "Parameter 'mode' must be 'book' or 'mention'"}), 400
     
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     try:
-        placeholder = get_sql_placeholder()
-        # Get year-matched mentions (books that overlap with the selected range)
-        year_matched_query = f"""
-            SELECT
-                b.title,
-                b.historical_start_year,
-                b.historical_end_year,
-                l.name as location_name,
-                l.latitude,
-                l.longitude,
-                m.text_position,
-                m.context,
-                'year_matched' as tier
-            FROM
-                books b
-            JOIN
-                mentions m ON b.id = m.book_id
-            JOIN
-                locations l ON l.id = m.location_id
-            WHERE
-                l.name = {placeholder} 
-                AND b.historical_start_year IS NOT NULL 
-                AND b.historical_end_year IS NOT NULL
-                AND b.historical_start_year <= {placeholder} 
-                AND b.historical_end_year >= {placeholder}
-            ORDER BY
-                m.text_position
-        """
-        
-        # Get year-mismatched and unperiodized mentions
-        other_mentions_query = f"""
-            SELECT
-                b.title,
-                b.historical_start_year,
-                b.historical_end_year,
-                l.name as location_name,
-                l.latitude,
-                l.longitude,
-                m.text_position,
-                m.context,
-                CASE 
-                    WHEN b.historical_start_year IS NULL OR b.historical_end_year IS NULL 
-                    THEN 'unperiodized'
-                    ELSE 'year_mismatched'
-                END as tier
-            FROM
-                books b
-            JOIN
-                mentions m ON b.id = m.book_id
-            JOIN
-                locations l ON l.id = m.location_id
-            WHERE
-                l.name = {placeholder}
-                AND (
-                    b.historical_start_year IS NULL 
-                    OR b.historical_end_year IS NULL
-                    OR b.historical_start_year > {placeholder} 
-                    OR b.historical_end_year < {placeholder}
-                )
-            ORDER BY
-                m.text_position
-        """
-        
-        # Execute both queries
-        cursor.execute(year_matched_query, (location_name, end_year, start_year))
-        year_matched = cursor.fetchall()
-        
-        cursor.execute(other_mentions_query, (location_name, end_year, start_year))
-        other_mentions = cursor.fetchall()
-        
-        # Convert to lists of dictionaries
-        year_matched_list = [dict(row) for row in year_matched]
-        other_mentions_list = [dict(row) for row in other_mentions]
+        placeholder = get_sql_placeholder(backend_of(conn))
+        if mode == 'mention':
+            # Mentions whose estimated year falls in the range, then the rest
+            year_matched = fetch_all(cursor, 'mentions_by_year_mention_matched', (location_name, start_year, end_year))
+            
+            other_mentions = fetch_all(cursor, 'mentions_by_year_mention_other', (location_name, start_year, end_year))
+        else:
+            # Get year-matched mentions (books that overlap with the selected range)
+            # and year-mismatched/unperiodized mentions
+            year_matched = fetch_all(cursor, 'mentions_by_year_matched', (location_name, end_year, start_year))
+            
+            other_mentions = fetch_all(cursor, 'mentions_by_year_other', (location_name, end_year, start_year))
+        
+        # Convert to lists of dictionaries, slicing compressed contexts from the book texts
+        context_window = get_context_window()
+        year_matched_list = fill_mention_contexts(cursor, year_matched, placeholder, context_window)
+        other_mentions_list = fill_mention_contexts(cursor, other_mentions, placeholder, context_window)
         
         response = {
             "location_name": location_name,
@@ -510,6 +513,7 @@ def get_mentions_by_location_and_year(location_name):
                 "start_year": start_year,
                 "end_year": end_year
             },
+            "mode": mode,
             "primary_tier": {
                 "tier_name": "References within selected time period",
                 "mentions": year_matched_list,
@@ -542,39 +546,21 @@ def search_locations():
     if len(query) < 2:
         return jsonify({"error": "Search query must be at least 2 characters"}), 400
     
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     try:
         # Use database-level search with multiple strategies for better results
         search_pattern = f'%{query}%'
-        placeholder = get_sql_placeholder()
         
         # First try exact match
-        cursor.execute(f"""
-            SELECT id, name, latitude, longitude, 1 as relevance
-            FROM locations 
-            WHERE LOWER(name) = LOWER({placeholder})
-        """, (query,))
-        exact_matches = cursor.fetchall()
+        exact_matches = fetch_all(cursor, 'search_exact', (query,))
         
         # Then try starts with
-        cursor.execute(f"""
-            SELECT id, name, latitude, longitude, 2 as relevance
-            FROM locations 
-            WHERE LOWER(name) LIKE LOWER({placeholder}) AND LOWER(name) != LOWER({placeholder})
-        """, (f'{query}%', query))
-        starts_with = cursor.fetchall()
+        starts_with = fetch_all(cursor, 'search_starts_with', (query, query + STARTS_WITH_BOUND))
         
         # Finally try contains
-        cursor.execute(f"""
-            SELECT id, name, latitude, longitude, 3 as relevance
-            FROM locations 
-            WHERE LOWER(name) LIKE {placeholder} 
-            AND LOWER(name) NOT LIKE LOWER({placeholder}) 
-            AND LOWER(name) NOT LIKE LOWER({placeholder})
-        """, (search_pattern, f'{query}%', query))
-        contains = cursor.fetchall()
+        contains = fetch_all(cursor, 'search_contains', (search_pattern, f'{query}%', query))
         
         # Combine and sort by relevance
         all_results = list(exact_matches) + list(starts_with) + list(contains)
@@ -598,28 +584,28 @@ def get_statistics():
     Endpoint to get database statistics.
     Useful for dashboards and understanding the scope of your data.
     """
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     # Get counts from each table
-    cursor.execute("SELECT COUNT(*) as count FROM books")
+    execute(cursor, 'statistics_book_count')
     book_count = cursor.fetchone()['count']
     
-    cursor.execute("SELECT COUNT(*) as count FROM locations")
+    execute(cursor, 'statistics_location_count')
     location_count = cursor.fetchone()['count']
     
-    cursor.execute("SELECT COUNT(*) as count FROM mentions")
+    execute(cursor, 'statistics_mention_count')
     mention_count = cursor.fetchone()['count']
     
     # Get some interesting stats
-    cursor.execute("SELECT COUNT(DISTINCT book_id) as count FROM mentions")
+    execute(cursor, 'statistics_books_with_mentions')
     books_with_mentions = cursor.fetchone()['count']
     
-    cursor.execute("SELECT COUNT(DISTINCT location_id) as count FROM mentions")
+    execute(cursor, 'statistics_locations_with_mentions')
     locations_with_mentions = cursor.fetchone()['count']
     
     # Get year range covered
-    cursor.execute("SELECT MIN(historical_start_year), MAX(historical_end_year) FROM books WHERE historical_start_year IS NOT NULL")
+    execute(cursor, 'statistics_year_range')
     year_range = cursor.fetchone()
     min_year = year_range[0] if year_range[0] else None
     max_year = year_range[1] if year_range[1] else None
@@ -652,52 +638,41 @@ def get_locations_by_year():
     Query parameters:
     - start_year: Start year for filtering
     - end_year: End year for filtering
+    - mode: 'book' (default) filters by book periods; 'mention' filters by each
+      mention's estimated year and returns per-location counts and year spans
+    
+    Clients sending "Accept: application/x-hrm-columnar" receive the packed
+    columnar binary format with one row per location and its mention count.
     """
     start_year = request.args.get('start_year', type=int)
     end_year = request.args.get('end_year', type=int)
+    mode = get_year_filter_mode()
     
     # Validate parameters
     if not (start_year and end_year):
         return jsonify({"error": "Both 'start_year' and 'end_year' parameters are required"}), 400
+    if mode is None:
+        return jsonify({"error": "Parameter 'mode' must be 'book' or 'mention'"}), 400
     
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     try:
-        # Use year range filtering - only show locations with references
-        db_type = get_database_type()
+        query_name, params = year_window_query(mode, start_year, end_year)
         
-        if db_type == 'postgresql':
-            query = """
-                SELECT DISTINCT l.id, l.name, l.latitude, l.longitude,
-                       b.historical_start_year, b.historical_end_year
-                FROM locations l
-                INNER JOIN mentions m ON l.id = m.location_id
-                INNER JOIN books b ON m.book_id = b.id
-                WHERE (b.historical_start_year <= %s AND b.historical_end_year >= %s)
-                ORDER BY l.name
-            """
-        else:
-            query = """
-                SELECT DISTINCT l.id, l.name, l.latitude, l.longitude,
-                       b.historical_start_year, b.historical_end_year
-                FROM locations l
-                INNER JOIN mentions m ON l.id = m.location_id
-                INNER JOIN books b ON m.book_id = b.id
-                WHERE (b.historical_start_year <= ? AND b.historical_end_year >= ?)
-                ORDER BY l.name
-            """
-        
-        cursor.execute(query, (end_year, start_year))
-        
-        locations = cursor.fetchall()
+        if wants_columnar_response():
+            return columnar_response(fetch_all(cursor, query_name + '_columnar', params))
+        
+        # Use year range filtering - only show locations with references
+        locations = fetch_all(cursor, query_name, params)
         locations_list = [dict(row) for row in locations]
         
         response = {
             "locations": locations_list,
             "filters": {
                 "start_year": start_year,
-                "end_year": end_year
+                "end_year": end_year,
+                "mode": mode
             },
             "total_locations": len(locations_list)
         }
@@ -707,7 +682,170 @@ def get_locations_by_year():
     finally:
         conn.close()
 
+@app.route('/api/locations_by_year/delta', methods=['GET'])
+def get_locations_by_year_delta():
+    """
+    Endpoint to get the change in referenced locations between two year windows,
+    so a client moving its year range only updates the markers that differ.
+    Query parameters:
+    - from_start_year, from_end_year: the window the client currently shows
+    - start_year, end_year: the new window
+    - mode: as for /api/locations_by_year
+    
+    Locations are keyed by id: "added" and "changed" (mention count differs) hold
+    (id, name, latitude, longitude, mention_count) rows for the new window, "removed"
+    holds the ids that are no longer referenced.
+    """
+    from_start_year = request.args.get('from_start_year', type=int)
+    from_end_year = request.args.get('from_end_year', type=int)
+    start_year = request.args.get('start_year', type=int)
+    end_year = request.args.get('end_year', type=int)
+    mode = get_year_filter_mode()
+    
+    # Validate parameters
+    if not (from_start_year and from_end_year and start_year and end_year):
+        return jsonify({"error": "Parameters 'from_start_year', 'from_end_year', 'start_year' and 'end_year' are required"}), 400
+    if mode is None:
+        return jsonify({"error": "Parameter 'mode' must be 'book' or 'mention'"}), 400
+    
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    
+    try:
+        query_name, params = year_window_query(mode, from_start_year, from_end_year)
+        previous = {row['id']: row['mention_count'] for row in fetch_all(cursor, query_name + '_columnar', params)}
+        query_name, params = year_window_query(mode, start_year, end_year)
+        current = fetch_all(cursor, query_name + '_columnar', params)
+        
+        added = []
+        changed = []
+        for row in current:
+            count = previous.pop(row['id'], None)
+            if count is None:
+                added.append(dict(row))
+            elif count != row['mention_count']:
+                changed.append(dict(row))
+        
+        return jsonify({
+            "added": added,
+            "changed": changed,
+            # Whatever is left of the previous window has no references in the new one
+            "removed": list(previous),
+            "filters": {
+                "from_start_year": from_start_year,
+                "from_end_year": from_end_year,
+                "start_year": start_year,
+                "end_year": end_year,
+                "mode": mode
+            },
+            "total_locations": len(current)
+        })
+        
+    finally:
+        conn.close()
+
 
+@app.route('/api/timeline', methods=['GET'])
+def get_timeline():
+    """
+    Endpoint for the timeline scrubber: mention counts per location per decade or
+    century plus the corpus-wide histogram, read from the mention_year_rollup table.
+    Query parameters:
+    - resolution: 'decade' (default) or 'century'
+    - start_year, end_year: Optional range of buckets to include
+    
+    Cells are [location_index, bucket_index, count] triples indexing the
+    locations and buckets arrays.
+    """
+    resolution = request.args.get('resolution', 'decade')
+    if resolution not in TIMELINE_RESOLUTIONS:
+        return jsonify({"error": "Parameter 'resolution' must be 'decade' or 'century'"}), 400
+    bucket_size = TIMELINE_RESOLUTIONS[resolution]
+    start_year = request.args.get('start_year', -100000, type=int)
+    end_year = request.args.get('end_year', 100000, type=int)
+    
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    
+    try:
+        rows = fetch_all(cursor, 'timeline_cells', (bucket_size, start_year, end_year))
+        
+        buckets = sorted({row['bucket'] for row in rows})
+        bucket_index = {bucket: i for i, bucket in enumerate(buckets)}
+        histogram = [0] * len(buckets)
+        locations, cells = [], []
+        
+        # Rows arrive grouped by location
+        for row in rows:
+            if not locations or locations[-1]['id'] != row['location_id']:
+                locations.append({
+                    "id": row['location_id'],
+                    "name": row['name'],
+                    "latitude": row['latitude'],
+                    "longitude": row['longitude'],
+                    "mention_count": 0
+                })
+            index = bucket_index[row['bucket']]
+            cells.append([len(locations) - 1, index, row['mention_count']])
+            histogram[index] += row['mention_count']
+            locations[-1]['mention_count'] += row['mention_count']
+        
+        response = jsonify({
+            "resolution": resolution,
+            "bucket_size": bucket_size,
+            "buckets": buckets,
+            "histogram": histogram,
+            "locations": locations,
+            "cells": cells
+        })
+        # The rollup only changes when books are processed
+        response.headers['Cache-Control'] = 'public, max-age=300'
+        return response
+        
+    finally:
+        conn.close()
+
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """
+    Endpoint to download mentions joined with their books and locations.
+    Query parameters:
+    - format: 'ndjson' (default), 'csv', 'geojson', 'parquet' or 'arrow'
+      (the last two need pyarrow)
+    - start_year, end_year: Optional year range; mode='book' (default) or 'mention'
+    - bbox: Optional min_lon,min_lat,max_lon,max_lat
+    - book_id: Optional, repeatable
+    
+    The body is streamed in chunks as rows are read, so exports of any size use
+    constant memory on the server.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        check_export_format(fmt)
+        filters = ExportFilters(
+            start_year=request.args.get('start_year', type=int),
+            end_year=request.args.get('end_year', type=int),
+            mode=request.args.get('mode', 'book'),
+            bbox=parse_bbox(request.args.get('bbox')),
+            book_ids=request.args.getlist('book_id', type=int)
+        )
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    conn = get_read_connection()
+    db_type = backend_of(conn)
+    
+    def generate():
+        try:
+            yield from export_mentions(conn, db_type, fmt, filters)
+        finally:
+            conn.close()
+    
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="mentions.{extension}"'
+    return response
 
 
 
@@ -728,6 +866,10 @@ def bad_request(error):
 if __name__ == '__main__':
     # Log database info on startup
     log_database_info()
+    ensure_database_schema()
+    start_maintenance_scheduler()
+    start_serving_publisher()
+    prepare_static_assets()
     
     # The host='0.0.0.0' makes the server accessible on your local network
     # Disable debug mode for better performance in production
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Static asset build for the web interface
+Every stylesheet, script, font and image under src/web/static (the app's own files and
+the vendored Leaflet, Font Awesome and Inter in static/vendor) is minified, renamed
+with a content hash and written to src/web/dist together with precompressed .gz and
+.br variants. manifest.json maps each source name to its fingerprinted name; the
+template links through it, and /assets/ serves the files with a one-year immutable
+Cache-Control and the best encoding the client accepts. A changed file gets a new
+name, so browsers never revalidate an asset, only the page that links to it.
+
+Usage:
+    python src/web/assets.py
+    python src/web/assets.py --clean
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:  # Minification is optional; assets are still fingerprinted and compressed
+    rcssmin = rjsmin = None
+
+try:
+    import brotli
+except ImportError:  # Without it only .gz variants are written
+    brotli = None
+
+WEB_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(WEB_DIR, 'static')
+ASSET_DIR = os.path.join(WEB_DIR, 'dist')
+MANIFEST_FILE = 'manifest.json'
+
+# Files under STATIC_DIR that are part of the page; licenses and notes are not served
+ASSET_EXTENSIONS = {'.css', '.js', '.png', '.svg', '.ico', '.gif', '.jpg', '.webp', '.woff', '.woff2'}
+# Already-compressed formats (PNG, WOFF2) gain nothing from gzip or brotli
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg'}
+# Vendored files ship minified by their upstream builds
+VENDOR_PREFIX = 'vendor/'
+
+# Hex digits of the SHA-256 content hash in fingerprinted names
+FINGERPRINT_LENGTH = 12
+# A compressed variant is kept only if it saves at least this fraction
+MIN_COMPRESSION_SAVING = 0.05
+# Cache lifetime for fingerprinted files: their content never changes under a name
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Content-Encoding and file suffix, in order of preference
+ASSET_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+CSS_URL_PATTERN = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+class AssetBuildError(RuntimeError):
+    """The static sources cannot be built (e.g. a stylesheet references a missing file)."""
+
+def asset_sources(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    """Source files to build, as {name relative to static_dir (POSIX separators): path}."""
+    sources = {}
+    for root, _, files in os.walk(static_dir):
+        for filename in files:
+            if os.path.splitext(filename)[1].lower() in ASSET_EXTENSIONS:
+                path = os.path.join(root, filename)
+                sources[os.path.relpath(path, static_dir).replace(os.sep, '/')] = path
+    return sources
+
+def fingerprinted_name(name: str, data: bytes) -> str:
+    """css/style.css -> css/style.<hash>.css"""
+    stem, extension = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]}{extension}"
+
+def rewrite_css_urls(name: str, css: str, manifest: Dict[str, str]) -> str:
+    """Point relative url() references in a stylesheet at the fingerprinted files."""
+    directory = posixpath.dirname(name)
+
+    def replace(match):
+        reference = match.group(2).strip()
+        if reference.startswith(('data:', '#', '/', 'http:', 'https:')):
+            return match.group(0)
+        # Keep query strings and fragments (e.g. font hacks like ?#iefix)
+        path, suffix = re.match(r'([^?#]*)(.*)', reference).groups()
+        target = posixpath.normpath(posixpath.join(directory, path))
+        if target not in manifest:
+            raise AssetBuildError(f"{name} references {reference}, which is not a static asset")
+        # Fingerprinted files keep their directories, so the reference stays relative
+        return f"url({posixpath.relpath(manifest[target], directory or '.')}{suffix})"
+
+    return CSS_URL_PATTERN.sub(replace, css)
+
+def minify(name: str, data: bytes) -> bytes:
+    """Minify the app's own stylesheets and scripts; everything else is returned unchanged."""
+    if name.startswith(VENDOR_PREFIX) or rjsmin is None:
+        return data
+    if name.endswith('.css'):
+        return rcssmin.cssmin(data.decode('utf-8')).encode('utf-8')
+    if name.endswith('.js'):
+        return rjsmin.jsmin(data.decode('utf-8')).encode('utf-8')
+    return data
+
+def compressed_variants(name: str, data: bytes) -> Dict[str, bytes]:
+    """Precompressed bodies per file suffix, at the slowest (smallest) settings."""
+    if posixpath.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+        return {}
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+    limit = len(data) * (1 - MIN_COMPRESSION_SAVING)
+    return {suffix: body for suffix, body in variants.items() if len(body) < limit}
+
+def _write_file(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+def build_assets(static_dir: str = STATIC_DIR, output_dir: str = ASSET_DIR, clean: bool = False) -> Dict[str, str]:
+    """
+    Build every static asset into output_dir and return the manifest.
+    Files from earlier builds are kept unless clean is set, so pages rendered before a
+    deployment can still load the assets they link to. The manifest is replaced last,
+    so a running server never links to a file that has not been written yet.
+    """
+    sources = asset_sources(static_dir)
+    manifest = {}
+    written = set()
+    # Stylesheets last: their url() references need the fingerprinted font and image names
+    for name in sorted(sources, key=lambda name: (name.endswith('.css'), name)):
+        with open(sources[name], 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = rewrite_css_urls(name, data.decode('utf-8'), manifest).encode('utf-8')
+        data = minify(name, data)
+
+        hashed = fingerprinted_name(name, data)
+        path = os.path.join(output_dir, *hashed.split('/'))
+        # The plain file is written last: its presence marks the variants as complete
+        if not os.path.exists(path):
+            for suffix, body in compressed_variants(name, data).items():
+                _write_file(path + suffix, body)
+            _write_file(path, data)
+        manifest[name] = hashed
+        written.update(hashed + suffix for suffix in ('', '.gz', '.br'))
+
+    _write_file(os.path.join(output_dir, MANIFEST_FILE),
+                json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    if clean:
+        for root, _, files in os.walk(output_dir):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), output_dir).replace(os.sep, '/')
+                if name != MANIFEST_FILE and name not in written:
+                    os.remove(os.path.join(root, filename))
+    return manifest
+
+def load_manifest(output_dir: str = ASSET_DIR) -> Dict[str, str]:
+    """Read the manifest of the last build; empty when assets have not been built."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def assets_stale(static_dir: str = STATIC_DIR, output_dir: str = ASSET_DIR) -> bool:
+    """True when there is no build or a source file changed after it."""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return True
+    built = os.path.getmtime(manifest_path)
+    sources = asset_sources(static_dir)
+    if set(sources) != set(load_manifest(output_dir)):
+        return True
+    return any(os.path.getmtime(path) > built for path in sources.values())
+
+def find_asset(filename: str, accepts: Callable[[str], float],
+               output_dir: str = ASSET_DIR) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Locate a built file and pick its variant for the request.
+    accepts(encoding) returns the client's Accept-Encoding quality for an encoding.
+    Returns (path, content encoding or None), or (None, None) for unknown files.
+    """
+    root = os.path.realpath(output_dir)
+    path = os.path.realpath(os.path.join(root, *filename.split('/')))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None, None
+    for encoding, suffix in ASSET_ENCODINGS:
+        if accepts(encoding) > 0 and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+def main():
+    """Build the static assets once."""
+    parser = argparse.ArgumentParser(description="Minify, fingerprint and precompress the web interface's static assets")
+    parser.add_argument('--static', default=STATIC_DIR, help="source directory")
+    parser.add_argument('--output', default=ASSET_DIR, help="build directory")
+    parser.add_argument('--clean', action='store_true', help="remove files left from earlier builds")
+    args = parser.parse_args()
+
+    if rjsmin is None:
+        print("Warning: rjsmin/rcssmin not installed, assets are not minified")
+    if brotli is None:
+        print("Warning: brotli not installed, only gzip variants are written")
+
+    started = time.perf_counter()
+    try:
+        manifest = build_assets(args.static, args.output, args.clean)
+    except AssetBuildError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"📦 {len(manifest)} assets built into {args.output} in {time.perf_counter() - started:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,232 @@
 // Historical Reference Mapper Web App
+
+// Year filter mode selected in the search panel: 'book' periods or 'mention' dates
+function getYearMode() {
+    const select = document.getElementById('year-mode');
+    return select ? select.value : 'book';
+}
+
+// Packed columnar location format served by /api/locations_* (see pack_locations_columnar in app_api.py).
+// Typed array views read the little-endian payload directly, which matches every browser platform.
+const COLUMNAR_MIMETYPE = 'application/x-hrm-columnar';
+const COLUMNAR_HEADER_BYTES = 16;
+const columnarNameDecoder = new TextDecoder('utf-8');
+
+function decodeColumnarLocations(buffer) {
+    const header = new DataView(buffer, 0, COLUMNAR_HEADER_BYTES);
+    const magic = String.fromCharCode(header.getUint8(0), header.getUint8(1), header.getUint8(2), header.getUint8(3));
+    if (magic !== 'HRMC') {
+        throw new Error('Unexpected columnar payload');
+    }
+    
+    const count = header.getUint32(8, true);
+    const nameBytes = header.getUint32(12, true);
+    let offset = COLUMNAR_HEADER_BYTES;
+    const column = (ArrayType, length) => {
+        const view = new ArrayType(buffer, offset, length);
+        offset += length * ArrayType.BYTES_PER_ELEMENT;
+        return view;
+    };
+    
+    return {
+        count,
+        ids: column(Uint32Array, count),
+        latitudes: column(Float32Array, count),
+        longitudes: column(Float32Array, count),
+        mentionCounts: column(Uint32Array, count),
+        nameOffsets: column(Uint32Array, count + 1),
+        names: new Uint8Array(buffer, offset, nameBytes)
+    };
+}
+
+function columnarName(columns, index) {
+    return columnarNameDecoder.decode(columns.names.subarray(columns.nameOffsets[index], columns.nameOffsets[index + 1]));
+}
+
+function columnarLocation(columns, index) {
+    // Only materialized on demand (popups, selection, result cards)
+    return {
+        id: columns.ids[index],
+        name: columnarName(columns, index),
+        latitude: columns.latitudes[index],
+        longitude: columns.longitudes[index],
+        mention_count: columns.mentionCounts[index]
+    };
+}
+
+// --- Data layer ---
+// API responses are kept in an LRU cache keyed by endpoint, location and year window.
+// Identical requests already in flight share one fetch; a caller's AbortSignal only
+// cancels the shared fetch once every caller waiting on it has given up.
+const DATA_CACHE_SIZE = 200;
+const YEAR_INPUT_DEBOUNCE_MS = 300;
+const HOVER_PREFETCH_DELAY_MS = 150;
+
+function abortError() {
+    return new DOMException('Request superseded', 'AbortError');
+}
+
+function isAbortError(error) {
+    return error && error.name === 'AbortError';
+}
+
+class DataLayer {
+    constructor(apiBase, capacity = DATA_CACHE_SIZE) {
+        this.apiBase = apiBase;
+        this.capacity = capacity;
+        this.cache = new Map();
+        this.inflight = new Map();
+        this.stats = { requests: 0, hits: 0, coalesced: 0, prefetched: 0 };
+    }
+    
+    remember(key, value) {
+        // Map iteration order is insertion order, so the first key is the least recently used
+        this.cache.delete(key);
+        this.cache.set(key, value);
+        if (this.cache.size > this.capacity) {
+            this.cache.delete(this.cache.keys().next().value);
+        }
+    }
+    
+    request(key, url, options = {}) {
+        const { signal, headers, decode = response => response.json() } = options;
+        
+        if (this.cache.has(key)) {
+            this.stats.hits += 1;
+            const value = this.cache.get(key);
+            this.remember(key, value);
+            return Promise.resolve(value);
+        }
+        
+        let entry = this.inflight.get(key);
+        if (entry) {
+            this.stats.coalesced += 1;
+        } else {
+            this.stats.requests += 1;
+            const controller = new AbortController();
+            entry = { controller, waiters: 0 };
+            entry.promise = fetch(url, { headers, signal: controller.signal })
+                .then(async response => {
+                    const data = await decode(response);
+                    // Error payloads are returned but not cached, so a retry asks again
+                    if (response.ok) {
+                        this.remember(key, data);
+                    }
+                    return data;
+                })
+                .finally(() => {
+                    // An aborted entry may already have been replaced by a fresh request
+                    if (this.inflight.get(key) === entry) {
+                        this.inflight.delete(key);
+                    }
+                });
+            this.inflight.set(key, entry);
+        }
+        
+        entry.waiters += 1;
+        if (!signal) {
+            return entry.promise;
+        }
+        
+        return new Promise((resolve, reject) => {
+            const onAbort = () => {
+                entry.waiters -= 1;
+                if (entry.waiters === 0) {
+                    // Forget the entry before aborting, so a request for the same key
+                    // made in this tick starts a new fetch instead of joining the dead one
+                    if (this.inflight.get(key) === entry) {
+                        this.inflight.delete(key);
+                    }
+                    entry.controller.abort();
+                }
+                reject(abortError());
+            };
+            if (signal.aborted) {
+                onAbort();
+                return;
+            }
+            signal.addEventListener('abort', onAbort, { once: true });
+            entry.promise.then(
+                value => { signal.removeEventListener('abort', onAbort); resolve(value); },
+                error => { signal.removeEventListener('abort', onAbort); reject(error); }
+            );
+        });
+    }
+    
+    mentionsByYear(locationName, startYear, endYear, mode, signal) {
+        const url = `${this.apiBase}/mentions_by_year/${encodeURIComponent(locationName)}?start_year=${startYear}&end_year=${endYear}&mode=${mode}`;
+        return this.request(`mentions_by_year|${locationName}|${startYear}|${endYear}|${mode}`, url, { signal });
+    }
+    
+    mentions(locationName, signal) {
+        return this.request(`mentions|${locationName}`, `${this.apiBase}/mentions/${encodeURIComponent(locationName)}`, { signal });
+    }
+    
+    booksByLocation(locationName, signal) {
+        return this.request(`books_by_location|${locationName}`, `${this.apiBase}/books_by_location/${encodeURIComponent(locationName)}`, { signal });
+    }
+    
+    locations(url, signal) {
+        // Prefer the packed columnar format; older servers simply answer with JSON
+        return this.request(`locations|${url}`, url, {
+            signal,
+            headers: { 'Accept': `${COLUMNAR_MIMETYPE}, application/json;q=0.9` },
+            decode: async response => {
+                const contentType = response.headers.get('Content-Type') || '';
+                if (response.ok && contentType.startsWith(COLUMNAR_MIMETYPE)) {
+                    return { columns: decodeColumnarLocations(await response.arrayBuffer()) };
+                }
+                return response.json();
+            }
+        });
+    }
+    
+    locationsDelta(from, startYear, endYear, signal) {
+        const url = `${this.apiBase}/locations_by_year/delta?from_start_year=${from.startYear}&from_end_year=${from.endYear}` +
+            `&start_year=${startYear}&end_year=${endYear}&mode=${from.mode}`;
+        return this.request(`locations_delta|${from.startYear}|${from.endYear}|${startYear}|${endYear}|${from.mode}`, url, { signal });
+    }
+    
+    prefetchMentionsByYear(locationName, startYear, endYear, mode) {
+        const key = `mentions_by_year|${locationName}|${startYear}|${endYear}|${mode}`;
+        if (this.cache.has(key) || this.inflight.has(key)) return;
+        this.stats.prefetched += 1;
+        this.mentionsByYear(locationName, startYear, endYear, mode).catch(() => {});
+    }
+}
+
+// Leaflet finds its marker images by stripping "marker-icon.png" from the stylesheet's
+// URL, which fails for fingerprinted names; the page lists the built URLs instead
+function useBundledMarkerIcons() {
+    const element = document.getElementById('leaflet-icons');
+    if (!element) return;
+    L.Icon.Default.imagePath = '';
+    L.Icon.Default.mergeOptions(JSON.parse(element.textContent));
+}
+
 class HistoricalMapper {
     constructor() {
         this.apiBase = '/api';
+        this.data = new DataLayer(this.apiBase);
+        // One controller per kind of request; starting a new one aborts the stale one
+        this.controllers = {};
+        this.yearInputTimer = null;
+        this.hoverTimer = null;
         this.currentResults = [];
+        this.currentColumns = null;
+        // Rows of currentColumns removed by year-window deltas; their replacements and
+        // newly added locations live in currentResults
+        this.hiddenIds = new Set();
+        this.yearWindow = null;
         this.map = null;
         this.markers = [];
+        this.pointLayer = null;
+        this.markerMode = 'auto';
         this.selectedLocation = null;
+        this.timelineCache = {};
+        this.timeline = null;
+        this.timelineLayer = null;
+        this.timelineTimer = null;
         this.init();
     }
 
@@ -33,6 +254,55 @@ class HistoricalMapper {
                 searchLocations();
             }
         });
+        
+        // Stepping through years re-runs the year search once the input settles
+        ['start-year', 'end-year'].forEach(id => {
+            document.getElementById(id).addEventListener('input', () => this.scheduleYearSearch());
+        });
+        document.getElementById('year-mode').addEventListener('change', () => this.scheduleYearSearch());
+    }
+
+    scheduleYearSearch() {
+        clearTimeout(this.yearInputTimer);
+        this.yearInputTimer = setTimeout(() => {
+            const startYear = document.getElementById('start-year').value;
+            const endYear = document.getElementById('end-year').value;
+            if (document.getElementById('location-input').value.trim() || !startYear || !endYear) return;
+            if (parseInt(startYear) > parseInt(endYear)) return;
+            if (this.yearWindow && this.yearWindow.mode === getYearMode()) {
+                this.updateYearWindow(startYear, endYear);
+            } else {
+                this.searchByYearRange(startYear, endYear);
+            }
+        }, YEAR_INPUT_DEBOUNCE_MS);
+    }
+
+    startRequest(kind) {
+        // Abort the previous request of this kind and hand out a signal for the new one
+        if (this.controllers[kind]) {
+            this.controllers[kind].abort();
+        }
+        this.controllers[kind] = new AbortController();
+        return this.controllers[kind].signal;
+    }
+
+    scheduleReferencePrefetch(resolveLocation) {
+        // Only prefetch when the pointer rests on a marker, not while it sweeps across the map
+        clearTimeout(this.hoverTimer);
+        this.hoverTimer = setTimeout(() => {
+            const location = resolveLocation();
+            if (!location) return;
+            this.data.prefetchMentionsByYear(
+                location.name,
+                document.getElementById('start-year').value,
+                document.getElementById('end-year').value,
+                getYearMode()
+            );
+        }, HOVER_PREFETCH_DELAY_MS);
+    }
+
+    cancelReferencePrefetch() {
+        clearTimeout(this.hoverTimer);
     }
 
     async searchLocations() {
@@ -89,6 +359,7 @@ class HistoricalMapper {
 
     clearResults() {
         this.currentResults = [];
+        this.yearWindow = null;
         // Clear map markers but keep map visible
         if (this.map) {
             this.clearMapMarkers();
@@ -96,17 +367,41 @@ class HistoricalMapper {
         }
     }
 
+    async fetchLocations(url, signal) {
+        return this.data.locations(url, signal);
+    }
+
     displayResults(locations, searchType, searchParams) {
         this.currentResults = locations;
-        
+        this.currentColumns = null;
+        this.hiddenIds = new Set();
+        this.yearWindow = null;
+        this.renderResults(locations.length, () => locations.map(location => this.createLocationCard(location)).join(''));
+    }
+
+    displayColumnarResults(columns) {
+        this.currentResults = [];
+        this.currentColumns = columns;
+        this.hiddenIds = new Set();
+        this.yearWindow = null;
+        this.renderResults(columns.count, () => {
+            let html = '';
+            for (let i = 0; i < columns.count; i++) {
+                html += this.createLocationCard(columnarLocation(columns, i));
+            }
+            return html;
+        });
+    }
+
+    renderResults(count, buildCards) {
         const resultsSection = document.getElementById('results-section');
         const resultsContainer = document.getElementById('results-container');
         const resultsCount = document.getElementById('results-count');
         
-        resultsCount.textContent = locations.length;
+        resultsCount.textContent = count;
         resultsSection.style.display = 'block';
         
-        if (locations.length === 0) {
+        if (count === 0) {
             resultsContainer.innerHTML = `
                 <div style="text-align: center; padding: 3rem; color: #718096;">
                     <i class="fas fa-search" style="font-size: 3rem; margin-bottom: 1rem; color: #cbd5e0;"></i>
@@ -117,7 +412,7 @@ class HistoricalMapper {
             return;
         }
         
-        resultsContainer.innerHTML = locations.map(location => this.createLocationCard(location)).join('');
+        resultsContainer.innerHTML = buildCards();
         
         // Update map with new results
         this.updateMapWithResults();
@@ -152,16 +447,27 @@ class HistoricalMapper {
             `<div class="detail-item">
                 <i class="fas fa-calendar"></i>
                 <span>Years: ${location.historical_start_year} - ${location.historical_end_year}</span>
+            </div>` : location.earliest_year && location.latest_year ?
+            `<div class="detail-item">
+                <i class="fas fa-calendar"></i>
+                <span>Mentions dated: ${location.earliest_year} - ${location.latest_year}</span>
+            </div>` : '';
+        
+        const mentionInfo = location.mention_count ?
+            `<div class="detail-item">
+                <i class="fas fa-quote-left"></i>
+                <span>References: ${location.mention_count}</span>
             </div>` : '';
         
         return `
-            <div class="location-card" onclick="historicalMapper.selectLocationOnMap('${location.name}')">
+            <div class="location-card" data-location-id="${location.id}" onclick="historicalMapper.selectLocationOnMap('${location.name}')">
                 <div class="location-header">
                     <div class="location-name">${location.name}</div>
                     <div class="location-coords">${coords}</div>
                 </div>
                 <div class="location-details">
                     ${yearInfo}
+                    ${mentionInfo}
                     <div class="detail-item">
                         <i class="fas fa-map-marker-alt"></i>
                         <span>ID: ${location.id}</span>
@@ -182,8 +488,7 @@ class HistoricalMapper {
             this.showLoading();
             
             // Fetch only locations that have references (mentions) from books
-            const response = await fetch(`${this.apiBase}/locations_with_references`);
-            const data = await response.json();
+            const data = await this.fetchLocations(`${this.apiBase}/locations_with_references`);
             
             this.hideLoading();
             
@@ -193,7 +498,15 @@ class HistoricalMapper {
             }
             
             // Display locations with references on the map
-            this.currentResults = data.locations;
+            this.hiddenIds = new Set();
+            this.yearWindow = null;
+            if (data.columns) {
+                this.currentResults = [];
+                this.currentColumns = data.columns;
+            } else {
+                this.currentResults = data.locations;
+                this.currentColumns = null;
+            }
             this.updateMapWithResults();
             
         } catch (error) {
@@ -210,6 +523,7 @@ class HistoricalMapper {
 
     initMap() {
         // Initialize Leaflet map
+        useBundledMarkerIcons();
         this.map = L.map('map').setView([50, 10], 4); // Center on Europe
         
         // Add OpenStreetMap tiles
@@ -228,14 +542,30 @@ class HistoricalMapper {
             this.map.removeLayer(marker);
         });
         this.markers = [];
+        if (this.pointLayer) {
+            this.map.removeLayer(this.pointLayer);
+            this.pointLayer = null;
+        }
     }
 
-    addMarkersToMap() {
-        if (!this.map || !this.currentResults.length) return;
+    addMarkersToMap(fitView = true) {
+        if (this.useCanvasMarkers(this.visibleLocationCount())) {
+            this.addCanvasMarkersToMap(fitView);
+            return;
+        }
+        
+        if (this.currentColumns) {
+            this.addColumnarMarkersToMap();
+        }
+        
+        if (!this.map || !this.currentResults.length) {
+            if (fitView) this.fitMapToMarkers();
+            return;
+        }
         
         const locationsWithCoords = this.currentResults.filter(loc => loc.latitude && loc.longitude);
         
-        if (locationsWithCoords.length === 0) {
+        if (locationsWithCoords.length === 0 && !this.markers.length) {
             // Show message if no coordinates
             const mapContainer = document.getElementById('map-container');
             mapContainer.innerHTML = `
@@ -249,20 +579,26 @@ class HistoricalMapper {
         }
         
         // Add markers for each location
-        locationsWithCoords.forEach(location => {
-            const marker = L.marker([location.latitude, location.longitude])
-                .addTo(this.map)
-                .bindPopup(this.createMarkerPopup(location));
-            
-            // Add click handler for marker
-            marker.on('click', (e) => {
-                e.originalEvent.stopPropagation();
-                this.selectLocationOnMap(location);
-            });
-            
-            this.markers.push(marker);
-        });
+        locationsWithCoords.forEach(location => this.markers.push(this.createLocationMarker(location)));
+        if (fitView) this.fitMapToMarkers();
+    }
+
+    createLocationMarker(location) {
+        const marker = L.marker([location.latitude, location.longitude], { locationId: location.id })
+            .addTo(this.map)
+            .bindPopup(this.createMarkerPopup(location));
         
+        // Add click handler for marker
+        marker.on('click', (e) => {
+            e.originalEvent.stopPropagation();
+            this.selectLocationOnMap(location);
+        });
+        marker.on('mouseover', () => this.scheduleReferencePrefetch(() => location));
+        marker.on('mouseout', () => this.cancelReferencePrefetch());
+        return marker;
+    }
+
+    fitMapToMarkers() {
         // Fit map to show all markers
         if (this.markers.length > 0) {
             const group = new L.featureGroup(this.markers);
@@ -270,14 +606,59 @@ class HistoricalMapper {
         }
     }
 
+    addColumnarMarkersToMap() {
+        const columns = this.currentColumns;
+        if (!this.map || !columns.count) return;
+        
+        const { ids, latitudes, longitudes } = columns;
+        // Shared handlers: each marker only carries its row index into the columns
+        const buildPopup = (marker) => this.createMarkerPopup(columnarLocation(columns, marker.options.locationIndex));
+        const onClick = (e) => {
+            e.originalEvent.stopPropagation();
+            this.selectLocationOnMap(columnarLocation(columns, e.target.options.locationIndex));
+        };
+        const onMouseOver = (e) => this.scheduleReferencePrefetch(() => columnarLocation(columns, e.target.options.locationIndex));
+        const onMouseOut = () => this.cancelReferencePrefetch();
+        
+        for (let i = 0; i < columns.count; i++) {
+            const lat = latitudes[i];
+            const lng = longitudes[i];
+            if (!lat || !lng || this.hiddenIds.has(ids[i])) continue;
+            
+            const marker = L.marker([lat, lng], { locationIndex: i, locationId: ids[i] })
+                .addTo(this.map)
+                .bindPopup(buildPopup)
+                .on('click', onClick)
+                .on('mouseover', onMouseOver)
+                .on('mouseout', onMouseOut);
+            
+            this.markers.push(marker);
+        }
+    }
+
+    findColumnarLocation(name) {
+        const columns = this.currentColumns;
+        if (!columns) return null;
+        
+        for (let i = 0; i < columns.count; i++) {
+            if (columnarName(columns, i) === name && !this.hiddenIds.has(columns.ids[i])) {
+                return columnarLocation(columns, i);
+            }
+        }
+        return null;
+    }
+
     createMarkerPopup(location) {
         const yearInfo = location.historical_start_year && location.historical_end_year ?
             `<div><strong>Years:</strong> ${location.historical_start_year} - ${location.historical_end_year}</div>` : '';
+        const mentionInfo = location.mention_count ?
+            `<div><strong>References:</strong> ${location.mention_count}</div>` : '';
         
         return `
             <div class="location-popup">
                 <h4>${location.name}</h4>
                 ${yearInfo}
+                ${mentionInfo}
                 <div class="popup-actions">
                     <button class="popup-btn secondary" onclick="historicalMapper.selectLocationOnMap('${location.name}')">
                         <i class="fas fa-crosshairs"></i> Select
@@ -290,7 +671,8 @@ class HistoricalMapper {
     selectLocationOnMap(location) {
         if (typeof location === 'string') {
             // Find location by name
-            location = this.currentResults.find(loc => loc.name === location);
+            const name = location;
+            location = this.currentResults.find(loc => loc.name === name) || this.findColumnarLocation(name);
         }
         
         if (!location) return;
@@ -301,6 +683,9 @@ class HistoricalMapper {
         this.selectedLocation = location;
         
         // Highlight the selected marker
+        if (this.pointLayer) {
+            this.pointLayer.setSelected(location.id);
+        }
         this.markers.forEach(marker => {
             if (marker.getLatLng().lat === location.latitude && 
                 marker.getLatLng().lng === location.longitude) {
@@ -358,13 +743,14 @@ class HistoricalMapper {
             const endYear = document.getElementById('end-year').value;
             
             // Fetch references from database with year filtering
-            const mentionsResponse = await fetch(`${this.apiBase}/mentions_by_year/${encodeURIComponent(location.name)}?start_year=${startYear}&end_year=${endYear}`);
-            const mentionsData = await mentionsResponse.json();
+            const signal = this.startRequest('references');
+            const mentionsData = await this.data.mentionsByYear(location.name, startYear, endYear, getYearMode(), signal);
             
             // Update references content with two-tier display
             this.updateReferencesContentTwoTier(mentionsData, location.name);
             
         } catch (error) {
+            if (isAbortError(error)) return;
             console.error('Error fetching database references:', error);
             this.showError('Failed to load database references');
         }
@@ -503,6 +889,7 @@ class HistoricalMapper {
                         <div class="mention-item" style="background: white; border-left: 3px solid ${borderColor};">
                             <div class="mention-header">
                                 <small class="mention-position">Position: ${mention.text_position}</small>
+                                ${mention.estimated_year ? `<small style="color: #718096;">c. ${mention.estimated_year}</small>` : ''}
                                 ${mention.historical_start_year && mention.historical_end_year ? 
                                     `<small style="color: #718096;">(${mention.historical_start_year}-${mention.historical_end_year})</small>` : 
                                     '<small style="color: #718096;">(Time period: Unknown)</small>'
@@ -563,6 +950,9 @@ class HistoricalMapper {
         }
         
         // Reset marker icons
+        if (this.pointLayer) {
+            this.pointLayer.setSelected(null);
+        }
         this.markers.forEach(marker => {
             marker.setIcon(L.divIcon({
                 className: 'default-marker',
@@ -577,13 +967,12 @@ class HistoricalMapper {
         try {
             this.showLoading();
             
-            // Get books by location
-            const booksResponse = await fetch(`${this.apiBase}/books_by_location/${encodeURIComponent(locationName)}`);
-            const books = await booksResponse.json();
-            
-            // Get mentions by location
-            const mentionsResponse = await fetch(`${this.apiBase}/mentions/${encodeURIComponent(locationName)}`);
-            const mentions = await mentionsResponse.json();
+            // Get books and mentions by location
+            const signal = this.startRequest('details');
+            const [books, mentions] = await Promise.all([
+                this.data.booksByLocation(locationName, signal),
+                this.data.mentions(locationName, signal)
+            ]);
             
             this.hideLoading();
             
@@ -591,6 +980,7 @@ class HistoricalMapper {
             this.displayLocationDetailsInResults(locationName, books, mentions);
             
         } catch (error) {
+            if (isAbortError(error)) return;
             console.error('Error fetching location details:', error);
             this.hideLoading();
             this.showError('Failed to load location details');
@@ -660,6 +1050,7 @@ class HistoricalMapper {
                                         <div class="mention-item">
                                             <div class="mention-header">
                                                 <small class="mention-position">Position: ${mention.text_position}</small>
+                                ${mention.estimated_year ? `<small style="color: #718096;">c. ${mention.estimated_year}</small>` : ''}
                                             </div>
                                             <div class="mention-context">
                                                 "${mention.context}"
@@ -730,8 +1121,7 @@ HistoricalMapper.prototype.searchByLocation = async function(locationName) {
         this.showLoading();
         
         // First get books by location
-        const booksResponse = await fetch(`${this.apiBase}/books_by_location/${encodeURIComponent(locationName)}`);
-        const books = await booksResponse.json();
+        const books = await this.data.booksByLocation(locationName, this.startRequest('search'));
         
         this.hideLoading();
         
@@ -755,6 +1145,7 @@ HistoricalMapper.prototype.searchByLocation = async function(locationName) {
         this.showDatabaseReferences(mockLocation);
         
     } catch (error) {
+        if (isAbortError(error)) return;
         console.error('Error searching by location:', error);
         this.hideLoading();
         this.showError('Failed to search by location');
@@ -765,9 +1156,8 @@ HistoricalMapper.prototype.searchByYearRange = async function(startYear, endYear
     try {
         this.showLoading();
         
-        const url = `${this.apiBase}/locations_by_year?start_year=${startYear}&end_year=${endYear}`;
-        const response = await fetch(url);
-        const data = await response.json();
+        const url = `${this.apiBase}/locations_by_year?start_year=${startYear}&end_year=${endYear}&mode=${getYearMode()}`;
+        const data = await this.fetchLocations(url, this.startRequest('search'));
         
         this.hideLoading();
         
@@ -776,11 +1166,623 @@ HistoricalMapper.prototype.searchByYearRange = async function(startYear, endYear
             return;
         }
         
-        this.displayResults(data.locations, 'year', { startYear, endYear });
+        if (data.columns) {
+            this.displayColumnarResults(data.columns);
+        } else {
+            this.displayResults(data.locations, 'year', { startYear, endYear });
+        }
+        // Later year changes only fetch and apply the difference to this window
+        this.yearWindow = { startYear, endYear, mode: getYearMode() };
         
     } catch (error) {
+        if (isAbortError(error)) return;
         console.error('Error searching by year range:', error);
         this.hideLoading();
         this.showError('Failed to search by year range');
     }
 };
+
+// --- Timeline scrubber ---
+// Each resolution is fetched once from /api/timeline and regrouped into one array of
+// [locationIndex, count] pairs per bucket, so a slider or animation frame is one lookup.
+const TIMELINE_FRAME_MS = 400;
+
+HistoricalMapper.prototype.toggleTimeline = async function() {
+    const controls = document.getElementById('timeline-controls');
+    if (controls.style.display !== 'none') {
+        controls.style.display = 'none';
+        this.stopTimelinePlayback();
+        if (this.timelineLayer) {
+            this.timelineLayer.clearLayers();
+        }
+        return;
+    }
+    
+    controls.style.display = 'flex';
+    await this.changeTimelineResolution(document.getElementById('timeline-resolution').value);
+};
+
+HistoricalMapper.prototype.loadTimeline = async function(resolution) {
+    if (!this.timelineCache[resolution]) {
+        const response = await fetch(`${this.apiBase}/timeline?resolution=${resolution}`);
+        const data = await response.json();
+        if (data.error) {
+            throw new Error(data.error);
+        }
+        
+        const frames = data.buckets.map(() => []);
+        data.cells.forEach(([locationIndex, bucketIndex, count]) => {
+            frames[bucketIndex].push([locationIndex, count]);
+        });
+        
+        this.timelineCache[resolution] = {
+            buckets: data.buckets,
+            bucketSize: data.bucket_size,
+            histogram: data.histogram,
+            locations: data.locations,
+            frames,
+            markers: new Array(data.locations.length)
+        };
+    }
+    return this.timelineCache[resolution];
+};
+
+HistoricalMapper.prototype.changeTimelineResolution = async function(resolution) {
+    try {
+        this.stopTimelinePlayback();
+        this.timeline = await this.loadTimeline(resolution);
+        
+        if (!this.timelineLayer) {
+            this.timelineLayer = L.layerGroup().addTo(this.map);
+        }
+        
+        const slider = document.getElementById('timeline-slider');
+        slider.max = Math.max(0, this.timeline.buckets.length - 1);
+        slider.value = 0;
+        this.drawTimelineHistogram();
+        this.showTimelineFrame(0);
+    } catch (error) {
+        console.error('Error loading timeline:', error);
+        this.showError('Failed to load timeline');
+    }
+};
+
+HistoricalMapper.prototype.drawTimelineHistogram = function() {
+    const canvas = document.getElementById('timeline-histogram');
+    const histogram = this.timeline.histogram;
+    canvas.width = canvas.clientWidth || 600;
+    
+    const context = canvas.getContext('2d');
+    context.clearRect(0, 0, canvas.width, canvas.height);
+    if (!histogram.length) return;
+    
+    const peak = Math.max(...histogram);
+    const barWidth = canvas.width / histogram.length;
+    context.fillStyle = '#667eea';
+    histogram.forEach((count, i) => {
+        const height = peak ? (count / peak) * canvas.height : 0;
+        context.fillRect(i * barWidth, canvas.height - height, Math.max(1, barWidth - 1), height);
+    });
+};
+
+HistoricalMapper.prototype.timelineMarker = function(locationIndex) {
+    // Markers are created on first use and reused by every later frame
+    const timeline = this.timeline;
+    if (!timeline.markers[locationIndex]) {
+        const location = timeline.locations[locationIndex];
+        timeline.markers[locationIndex] = L.circleMarker([location.latitude, location.longitude], {
+            color: '#667eea',
+            fillColor: '#667eea',
+            fillOpacity: 0.5,
+            weight: 1
+        }).bindTooltip(location.name);
+    }
+    return timeline.markers[locationIndex];
+};
+
+HistoricalMapper.prototype.showTimelineFrame = function(index) {
+    const timeline = this.timeline;
+    if (!timeline || !timeline.buckets.length) {
+        document.getElementById('timeline-label').textContent = 'No dated mentions';
+        return;
+    }
+    
+    const frame = timeline.frames[index];
+    this.timelineLayer.clearLayers();
+    frame.forEach(([locationIndex, count]) => {
+        const marker = this.timelineMarker(locationIndex);
+        marker.setRadius(3 + Math.sqrt(count));
+        this.timelineLayer.addLayer(marker);
+    });
+    
+    const bucket = timeline.buckets[index];
+    document.getElementById('timeline-slider').value = index;
+    document.getElementById('timeline-label').textContent =
+        `${bucket}-${bucket + timeline.bucketSize - 1}: ${timeline.histogram[index]} mentions, ${frame.length} places`;
+};
+
+HistoricalMapper.prototype.toggleTimelinePlayback = function() {
+    if (this.timelineTimer) {
+        this.stopTimelinePlayback();
+        return;
+    }
+    if (!this.timeline || !this.timeline.buckets.length) return;
+    
+    const slider = document.getElementById('timeline-slider');
+    let index = parseInt(slider.value);
+    if (index >= this.timeline.buckets.length - 1) {
+        index = 0;
+    }
+    
+    document.getElementById('timeline-play').innerHTML = '<i class="fas fa-pause"></i>';
+    this.timelineTimer = setInterval(() => {
+        this.showTimelineFrame(index);
+        index += 1;
+        if (index >= this.timeline.buckets.length) {
+            this.stopTimelinePlayback();
+        }
+    }, TIMELINE_FRAME_MS);
+};
+
+HistoricalMapper.prototype.stopTimelinePlayback = function() {
+    if (this.timelineTimer) {
+        clearInterval(this.timelineTimer);
+        this.timelineTimer = null;
+    }
+    const button = document.getElementById('timeline-play');
+    if (button) {
+        button.innerHTML = '<i class="fas fa-play"></i>';
+    }
+};
+
+// --- Canvas point layer ---
+// Large result sets are drawn on one canvas instead of one DOM marker per location.
+// Points are projected once; each zoom level groups them into CLUSTER_CELL_PX grid
+// cells (cached per zoom), and popups are only built for the point that was clicked.
+const CLUSTER_CELL_PX = 48;
+const POINT_RADIUS = 5;
+const SELECTED_POINT_RADIUS = 9;
+// 'auto' switches from DOM markers to the canvas above this many locations
+const CANVAS_MARKER_THRESHOLD = 1000;
+
+const PointCanvasLayer = L.Renderer.extend({
+    // points: { count, ids, latitudes, longitudes } plus locationAt(row), which builds the
+    // location object for a row only when it is needed (popups, selection, prefetch).
+    // Callbacks receive a slot, resolved with layer.locationAt(slot):
+    // options.onPointClick/onPointHover(slot), options.popupContent(slot), options.onPointOut()
+    initialize: function(points, locationAt, options) {
+        L.Renderer.prototype.initialize.call(this, options);
+        // One slot per point: projected position, id and where its location comes from
+        this._ids = [];
+        this._lat = [];
+        this._lng = [];
+        this._x = [];
+        this._y = [];
+        this._valid = [];
+        this._batch = [];
+        this._row = [];
+        this._slotById = new Map();
+        this._freeSlots = [];
+        this._clusters = {};
+        this._selectedId = null;
+        this._hoverIndex = null;
+        this._latLngBounds = L.latLngBounds([]);
+        this._boundsStale = false;
+        this.addPoints(points, locationAt);
+    },
+    
+    addPoints: function(points, locationAt) {
+        // World pixel coordinates at zoom 0; scaled by 2^zoom when clustering and drawing
+        const { count, ids, latitudes, longitudes } = points;
+        const crs = L.CRS.EPSG3857;
+        const batch = { locationAt };
+        for (let i = 0; i < count; i++) {
+            const lat = latitudes[i];
+            const lng = longitudes[i];
+            if (!lat || !lng) continue;
+            const point = crs.latLngToPoint(L.latLng(lat, lng), 0);
+            // Reuse slots freed by removePoints so the arrays do not grow while scrubbing
+            const slot = this._freeSlots.length ? this._freeSlots.pop() : this._ids.length;
+            this._ids[slot] = ids[i];
+            this._lat[slot] = lat;
+            this._lng[slot] = lng;
+            this._x[slot] = point.x;
+            this._y[slot] = point.y;
+            this._valid[slot] = true;
+            this._batch[slot] = batch;
+            this._row[slot] = i;
+            this._slotById.set(ids[i], slot);
+            this._latLngBounds.extend([lat, lng]);
+        }
+        this._changed();
+    },
+    
+    removePoints: function(ids) {
+        ids.forEach(id => {
+            const slot = this._slotById.get(id);
+            if (slot === undefined) return;
+            this._slotById.delete(id);
+            this._valid[slot] = false;
+            this._batch[slot] = null;
+            this._freeSlots.push(slot);
+            this._boundsStale = true;
+        });
+        this._changed();
+    },
+    
+    _changed: function() {
+        // Clusters are rebuilt lazily for the zoom levels that are drawn next
+        this._clusters = {};
+        this._hoverIndex = null;
+        if (this._map) {
+            this._update();
+        }
+    },
+    
+    locationAt: function(slot) {
+        return this._batch[slot].locationAt(this._row[slot]);
+    },
+    
+    getBounds: function() {
+        // Removing points cannot shrink the bounds in place; they are recomputed on the next read
+        if (this._boundsStale) {
+            const bounds = L.latLngBounds([]);
+            for (let i = 0; i < this._ids.length; i++) {
+                if (this._valid[i]) bounds.extend([this._lat[i], this._lng[i]]);
+            }
+            this._latLngBounds = bounds;
+            this._boundsStale = false;
+        }
+        return this._latLngBounds;
+    },
+    
+    getEvents: function() {
+        const events = L.Renderer.prototype.getEvents.call(this);
+        events.click = this._onClick;
+        events.mousemove = this._onMouseMove;
+        return events;
+    },
+    
+    _initContainer: function() {
+        this._container = document.createElement('canvas');
+        this._ctx = this._container.getContext('2d');
+    },
+    
+    _destroyContainer: function() {
+        L.DomUtil.remove(this._container);
+        this._map.getContainer().style.cursor = '';
+        delete this._ctx;
+        delete this._container;
+    },
+    
+    _update: function() {
+        if (this._map._animatingZoom && this._bounds) return;
+        L.Renderer.prototype._update.call(this);
+        
+        const bounds = this._bounds;
+        const size = bounds.getSize();
+        const ratio = L.Browser.retina ? 2 : 1;
+        const canvas = this._container;
+        L.DomUtil.setPosition(canvas, bounds.min);
+        canvas.width = ratio * size.x;
+        canvas.height = ratio * size.y;
+        canvas.style.width = size.x + 'px';
+        canvas.style.height = size.y + 'px';
+        this._ctx.setTransform(ratio, 0, 0, ratio, -ratio * bounds.min.x, -ratio * bounds.min.y);
+        this._draw();
+    },
+    
+    _clustersAt: function(zoom) {
+        if (this._clusters[zoom]) return this._clusters[zoom];
+        
+        const scale = Math.pow(2, zoom);
+        const cells = new Map();
+        const list = [];
+        for (let i = 0; i < this._ids.length; i++) {
+            if (!this._valid[i]) continue;
+            const x = this._x[i] * scale;
+            const y = this._y[i] * scale;
+            const key = Math.floor(x / CLUSTER_CELL_PX) * 4194304 + Math.floor(y / CLUSTER_CELL_PX);
+            let cluster = cells.get(key);
+            if (!cluster) {
+                cluster = { x: 0, y: 0, size: 0, index: i, minX: x, minY: y, maxX: x, maxY: y };
+                cells.set(key, cluster);
+                list.push(cluster);
+            }
+            cluster.x += x;
+            cluster.y += y;
+            cluster.size += 1;
+            cluster.minX = Math.min(cluster.minX, x);
+            cluster.minY = Math.min(cluster.minY, y);
+            cluster.maxX = Math.max(cluster.maxX, x);
+            cluster.maxY = Math.max(cluster.maxY, y);
+        }
+        list.forEach(cluster => {
+            cluster.x /= cluster.size;
+            cluster.y /= cluster.size;
+        });
+        
+        this._clusters[zoom] = { cells, list };
+        return this._clusters[zoom];
+    },
+    
+    _clusterRadius: function(cluster) {
+        return cluster.size === 1 ? POINT_RADIUS : Math.min(CLUSTER_CELL_PX / 2, 10 + 3 * Math.log2(cluster.size));
+    },
+    
+    _draw: function() {
+        const ctx = this._ctx;
+        const bounds = this._bounds;
+        const origin = this._map.getPixelOrigin();
+        const { list } = this._clustersAt(this._map.getZoom());
+        const groups = [];
+        let selected = null;
+        
+        // Clear in device pixels, so redraws without a resize (setSelected) start blank
+        const canvas = this._container;
+        ctx.save();
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        ctx.restore();
+        
+        // All single points go into one path, so the common case is a single fill
+        ctx.beginPath();
+        for (const cluster of list) {
+            const x = cluster.x - origin.x;
+            const y = cluster.y - origin.y;
+            const radius = this._clusterRadius(cluster);
+            if (x + radius < bounds.min.x || x - radius > bounds.max.x ||
+                y + radius < bounds.min.y || y - radius > bounds.max.y) continue;
+            
+            if (cluster.size > 1) {
+                groups.push([x, y, radius, cluster.size]);
+            } else if (this._ids[cluster.index] === this._selectedId) {
+                selected = [x, y];
+            } else {
+                ctx.moveTo(x + radius, y);
+                ctx.arc(x, y, radius, 0, 2 * Math.PI);
+            }
+        }
+        ctx.fillStyle = '#e53e3e';
+        ctx.strokeStyle = '#c53030';
+        ctx.lineWidth = 2;
+        ctx.fill();
+        ctx.stroke();
+        
+        ctx.font = '600 11px Inter, sans-serif';
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
+        groups.forEach(([x, y, radius, size]) => {
+            ctx.beginPath();
+            ctx.arc(x, y, radius, 0, 2 * Math.PI);
+            ctx.fillStyle = 'rgba(102, 126, 234, 0.85)';
+            ctx.fill();
+            ctx.strokeStyle = '#4c51bf';
+            ctx.stroke();
+            ctx.fillStyle = 'white';
+            ctx.fillText(size >= 1000 ? `${Math.round(size / 100) / 10}k` : String(size), x, y);
+        });
+        
+        if (selected) {
+            ctx.beginPath();
+            ctx.arc(selected[0], selected[1], SELECTED_POINT_RADIUS, 0, 2 * Math.PI);
+            ctx.fillStyle = '#667eea';
+            ctx.strokeStyle = '#4c51bf';
+            ctx.lineWidth = 3;
+            ctx.fill();
+            ctx.stroke();
+        }
+    },
+    
+    _hitTest: function(containerPoint) {
+        // Only the clicked cell and its neighbours can hold a cluster drawn under the cursor
+        const zoom = this._map.getZoom();
+        const { cells } = this._clustersAt(zoom);
+        const point = this._map.containerPointToLayerPoint(containerPoint).add(this._map.getPixelOrigin());
+        const cellX = Math.floor(point.x / CLUSTER_CELL_PX);
+        const cellY = Math.floor(point.y / CLUSTER_CELL_PX);
+        let best = null;
+        let bestDistance = Infinity;
+        for (let dx = -1; dx <= 1; dx++) {
+            for (let dy = -1; dy <= 1; dy++) {
+                const cluster = cells.get((cellX + dx) * 4194304 + (cellY + dy));
+                if (!cluster) continue;
+                const distance = Math.hypot(cluster.x - point.x, cluster.y - point.y);
+                if (distance <= this._clusterRadius(cluster) + 2 && distance < bestDistance) {
+                    best = cluster;
+                    bestDistance = distance;
+                }
+            }
+        }
+        return best;
+    },
+    
+    _onMouseMove: function(e) {
+        const hit = this._hitTest(e.containerPoint);
+        this._map.getContainer().style.cursor = hit ? 'pointer' : '';
+        
+        // Hover callbacks fire when the pointer enters or leaves a single point
+        const index = hit && hit.size === 1 ? hit.index : null;
+        if (index === this._hoverIndex) return;
+        this._hoverIndex = index;
+        if (index !== null && this.options.onPointHover) {
+            this.options.onPointHover(index);
+        } else if (index === null && this.options.onPointOut) {
+            this.options.onPointOut();
+        }
+    },
+    
+    _onClick: function(e) {
+        const cluster = this._hitTest(e.containerPoint);
+        if (!cluster) return;
+        
+        const map = this._map;
+        const zoom = map.getZoom();
+        if (cluster.size > 1 && (cluster.maxX > cluster.minX || cluster.maxY > cluster.minY) && zoom < map.getMaxZoom()) {
+            // Zoom into the cluster's extent; the next zoom level splits it up
+            const scale = Math.pow(2, zoom);
+            const corner = (x, y) => L.CRS.EPSG3857.pointToLatLng(L.point(x / scale, y / scale), 0);
+            map.fitBounds(L.latLngBounds(corner(cluster.minX, cluster.minY), corner(cluster.maxX, cluster.maxY)).pad(0.1));
+            return;
+        }
+        
+        const index = cluster.index;
+        if (this.options.onPointClick) {
+            this.options.onPointClick(index);
+        }
+        if (this.options.popupContent) {
+            L.popup()
+                .setLatLng([this._lat[index], this._lng[index]])
+                .setContent(this.options.popupContent(index))
+                .openOn(map);
+        }
+    },
+    
+    setSelected: function(id) {
+        this._selectedId = id;
+        if (this._map && this._bounds) {
+            this._draw();
+        }
+    }
+});
+
+HistoricalMapper.prototype.setMarkerMode = function(mode) {
+    this.markerMode = mode;
+    this.updateMapWithResults();
+};
+
+HistoricalMapper.prototype.useCanvasMarkers = function(count) {
+    if (this.markerMode === 'canvas') return true;
+    if (this.markerMode === 'markers') return false;
+    return count > CANVAS_MARKER_THRESHOLD;
+};
+
+HistoricalMapper.prototype.visibleLocationCount = function() {
+    const columnCount = this.currentColumns ? this.currentColumns.count - this.hiddenIds.size : 0;
+    return columnCount + this.currentResults.length;
+};
+
+function packLocations(locations) {
+    // Same shape as decoded columnar payloads, so the canvas layer takes either
+    return {
+        count: locations.length,
+        ids: locations.map(location => location.id),
+        latitudes: locations.map(location => location.latitude),
+        longitudes: locations.map(location => location.longitude)
+    };
+}
+
+HistoricalMapper.prototype.addCanvasMarkersToMap = function(fitView = true) {
+    if (!this.map || !this.visibleLocationCount()) return;
+    
+    const columns = this.currentColumns;
+    const results = this.currentResults;
+    const options = {
+        padding: 0.5,
+        onPointHover: (slot) => this.scheduleReferencePrefetch(() => this.pointLayer.locationAt(slot)),
+        onPointOut: () => this.cancelReferencePrefetch(),
+        onPointClick: (slot) => this.selectLocationOnMap(this.pointLayer.locationAt(slot)),
+        popupContent: (slot) => this.createMarkerPopup(this.pointLayer.locationAt(slot))
+    };
+    
+    if (columns) {
+        this.pointLayer = new PointCanvasLayer(columns, (row) => columnarLocation(columns, row), options);
+        this.pointLayer.removePoints(this.hiddenIds);
+        this.pointLayer.addPoints(packLocations(results), (row) => results[row]);
+    } else {
+        this.pointLayer = new PointCanvasLayer(packLocations(results), (row) => results[row], options);
+    }
+    this.pointLayer.addTo(this.map);
+    
+    const bounds = this.pointLayer.getBounds();
+    if (fitView && bounds.isValid()) {
+        this.map.fitBounds(bounds.pad(0.1));
+    }
+};
+
+// --- Incremental year windows ---
+// After a full year search, changing the years fetches only the locations entering,
+// leaving or changing count between the shown window and the new one, and applies
+// them to the markers and result cards in place.
+HistoricalMapper.prototype.updateYearWindow = async function(startYear, endYear) {
+    const yearWindow = this.yearWindow;
+    if (yearWindow.startYear === startYear && yearWindow.endYear === endYear) return;
+    
+    // Nothing to patch when the current window shows an empty result
+    if (!this.visibleLocationCount()) {
+        await this.searchByYearRange(startYear, endYear);
+        return;
+    }
+    
+    try {
+        const delta = await this.data.locationsDelta(yearWindow, startYear, endYear, this.startRequest('search'));
+        if (delta.error) {
+            this.showError(delta.error);
+            return;
+        }
+        // A full search may have replaced the window while the delta was loading
+        if (this.yearWindow !== yearWindow) return;
+        
+        this.applyYearDelta(delta);
+        yearWindow.startYear = startYear;
+        yearWindow.endYear = endYear;
+    } catch (error) {
+        if (isAbortError(error)) return;
+        console.error('Error updating year window:', error);
+        this.showError('Failed to update year range');
+    }
+};
+
+HistoricalMapper.prototype.applyYearDelta = function(delta) {
+    // Changed locations are replaced, so their popups and cards show the new counts
+    const removed = new Set(delta.removed);
+    delta.changed.forEach(location => removed.add(location.id));
+    const entering = delta.added.concat(delta.changed);
+    
+    if (removed.size) {
+        this.currentResults = this.currentResults.filter(location => !removed.has(location.id));
+        const columns = this.currentColumns;
+        if (columns) {
+            // Only rows of the columnar payload are hidden; extras were filtered out above
+            columns.idSet = columns.idSet || new Set(columns.ids);
+            removed.forEach(id => {
+                if (columns.idSet.has(id)) {
+                    this.hiddenIds.add(id);
+                }
+            });
+        }
+    }
+    this.currentResults.push(...entering);
+    
+    // Markers; a delta that takes the count across CANVAS_MARKER_THRESHOLD rebuilds them with
+    // the other renderer, keeping the view the user is scrubbing in
+    if (this.map && this.useCanvasMarkers(this.visibleLocationCount()) !== Boolean(this.pointLayer)) {
+        this.clearMapMarkers();
+        this.addMarkersToMap(false);
+        if (this.pointLayer && this.selectedLocation) {
+            this.pointLayer.setSelected(this.selectedLocation.id);
+        }
+    } else if (this.pointLayer) {
+        this.pointLayer.removePoints(removed);
+        this.pointLayer.addPoints(packLocations(entering), (row) => entering[row]);
+    } else if (this.map) {
+        this.markers = this.markers.filter(marker => {
+            if (!removed.has(marker.options.locationId)) return true;
+            this.map.removeLayer(marker);
+            return false;
+        });
+        entering
+            .filter(location => location.latitude && location.longitude)
+            .forEach(location => this.markers.push(this.createLocationMarker(location)));
+    }
+    
+    // Result cards
+    const resultsContainer = document.getElementById('results-container');
+    resultsContainer.querySelectorAll('.location-card').forEach(card => {
+        if (removed.has(parseInt(card.dataset.locationId))) {
+            card.remove();
+        }
+    });
+    resultsContainer.insertAdjacentHTML('beforeend', entering.map(location => this.createLocationCard(location)).join(''));
+    document.getElementById('results-count').textContent = delta.total_locations;
+};